@@ -0,0 +1,33 @@
+'''
+___________________________________________________________________________________________________________________________________
+
+                                        ORB - Opening Range Breakout Toolkit
+
+___________________________________________________________________________________________________________________________________
+
+Public helpers that sit on top of the private RiverRose package. The live bot (Opening_Range_Breakout_Bot.py) and the
+notebooks import the pieces they need directly from the submodules, e.g.
+
+    from orb.engine import ORBEngine, ORBStrategy
+
+Submodules:
+- app: RiverRose TradingApp subclass that forwards IBKR callbacks to the event engine
+- ib_requests: awaitable request/response layer (PendingRequest) resolved by IBKR callbacks
+- bar_store: preallocated NumPy ring buffer of OHLCV bars updated in place by the bar callbacks
+- ledger: typed execution/commission ledger with incremental trade pairing (entry, exit, re-entry)
+- contracts: front-month calendar, which contract month to trade on a given day (automatic quarterly roll)
+- latency: monotonic span timing into log-scale histograms, per stage p50/p99 reports and on-demand cProfile
+- tick_replay: memory-mapped tick/1 second session replay for exact first touch and STP LMT fills, compared with the
+  5 minute backtest
+- engine: event driven ORB strategy engine (replaces the 3 second polling loop)
+- backtest: vectorized ORB backtest used by Notebook 1 (same trade_data as the per-row loop)
+- candle_cache: on-disk Feather cache of the candle history with incremental refresh (Notebooks 1 and 3)
+- features: session indexed feature pipeline replacing inside_day / find_conditions / anchored_vwap
+- feature_store: per-session ML feature rows shared by Notebook 2 training and the live bot
+- model_selection: parallel, disk cached model selection harness for Notebook 2
+- ml_gate: Notebook 2 model compiled to NumPy arrays, scores the 07:35 feature row and gates the bracket sides
+- performance_db: pooled engine, server side net profit for contract sizing and asynchronous performance writes
+- performance_analytics: incremental performance history and vectorized tracking KPIs for Notebook 3
+- sim_broker: in-process simulated broker that replays stored 5 minute bars through the live engine
+- sweep: parallel parameter sweep of the vectorized backtest with a tidy KPI table
+'''
@@ -0,0 +1,152 @@
+'''
+Event driven wrapper around the RiverRose TradingApp.
+
+RiverRose's TradingApp buffers every callback into lists (app.data, app.curr_position, app.order, app.execution) that
+the bot used to poll and clear every cycle. ORBTradingApp keeps that behaviour (the parent callback always runs first)
+and forwards each event to an attached engine so the strategy can react the moment IBKR sends something.
+
+The request_* methods return a PendingRequest (see orb.ib_requests) that the matching *End callback resolves, so
+callers can wait on the answer with a timeout instead of sleeping.
+'''
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                            #IMPORT LIBRARIES AND DEPENDENCIES
+#-------------------------------------------------------------------------------------------------------------------------------
+
+import RiverRose as rr
+
+from orb.ib_requests import NEXT_VALID_ID, OPEN_ORDERS, POSITIONS, RequestRegistry
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                            #Trading App with Event Forwarding
+#-------------------------------------------------------------------------------------------------------------------------------
+
+class ORBTradingApp(rr.TradingApp):
+
+    def __init__(self):
+        rr.TradingApp.__init__(self)
+        #The engine gets attached after we connect, so anything that arrives before that is only buffered by RiverRose
+        self.engine = None
+        self.requests = RequestRegistry()
+        #Order IDs we have placed, their errors belong to the order and never to a pending request
+        self.order_ids = set()
+        #IBKR sends nextValidId as soon as the connection is up, so this doubles as our "connected" signal
+        self.connection_ready = self.requests.open(NEXT_VALID_ID, 'Connection handshake')
+
+    def _dispatch(self, handler, *args):
+        if self.engine is not None:
+            getattr(self.engine, handler)(*args)
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                #Awaitable Requests
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def request_historical(self, contract, time_period, candle_size, keep_up_to_date=False, use_rth=1, req_id=None):
+        #formatDate=2 gives us epoch seconds so TWS and Gateway timestamps look the same
+        #Callers that route the bars themselves pass a req_id they have already registered
+        req_id = self.requests.new_req_id() if req_id is None else req_id
+        pending = self.requests.open(req_id, f"Historical data for {contract.symbol}")
+        self.reqHistoricalData(req_id, contract, '', time_period, candle_size, 'TRADES', use_rth, 2, keep_up_to_date, [])
+        return pending
+
+    def request_positions(self):
+        pending = self.requests.open(POSITIONS, 'Positions')
+        self.reqPositions()
+        return pending
+
+    def request_open_orders(self):
+        pending = self.requests.open(OPEN_ORDERS, 'Open orders')
+        self.reqOpenOrders()
+        return pending
+
+    def request_executions(self, execution_filter):
+        req_id = self.requests.new_req_id()
+        pending = self.requests.open(req_id, 'Executions')
+        self.reqExecutions(req_id, execution_filter)
+        return pending
+
+    def request_next_order_id(self):
+        pending = self.requests.open(NEXT_VALID_ID, 'Next valid order ID')
+        self.reqIds(-1)
+        return pending
+
+    def placeOrder(self, orderId, contract, order):
+        self.order_ids.add(orderId)
+        super().placeOrder(orderId, contract, order)
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                #Market Data Callbacks
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def historicalData(self, reqId, bar):
+        super().historicalData(reqId, bar)
+        self.requests.add(reqId, bar)
+        self._dispatch('on_historical_bar', reqId, bar)
+
+    def historicalDataEnd(self, reqId, start, end):
+        super().historicalDataEnd(reqId, start, end)
+        self.requests.resolve(reqId)
+        self._dispatch('on_historical_end', reqId)
+
+    def historicalDataUpdate(self, reqId, bar):
+        super().historicalDataUpdate(reqId, bar)
+        self._dispatch('on_historical_update', reqId, bar)
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                            #Position, Order and Execution Callbacks
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def position(self, account, contract, position, avgCost):
+        super().position(account, contract, position, avgCost)
+        self.requests.add(POSITIONS, (account, contract, position, avgCost))
+        self._dispatch('on_position', account, contract, position, avgCost)
+
+    def positionEnd(self):
+        super().positionEnd()
+        self.requests.resolve(POSITIONS)
+
+    def openOrder(self, orderId, contract, order, orderState):
+        super().openOrder(orderId, contract, order, orderState)
+        self.requests.add(OPEN_ORDERS, (orderId, contract, order, orderState))
+        self._dispatch('on_open_order', orderId, contract, order, orderState)
+
+    def openOrderEnd(self):
+        super().openOrderEnd()
+        self.requests.resolve(OPEN_ORDERS)
+
+    def orderStatus(self, orderId, status, filled, remaining, avgFillPrice, permId, parentId, lastFillPrice, clientId,
+                    whyHeld, mktCapPrice):
+        super().orderStatus(orderId, status, filled, remaining, avgFillPrice, permId, parentId, lastFillPrice, clientId,
+                            whyHeld, mktCapPrice)
+        self._dispatch('on_order_status', orderId, status, filled, remaining)
+
+    def execDetails(self, reqId, contract, execution):
+        super().execDetails(reqId, contract, execution)
+        self.requests.add(reqId, (contract, execution))
+        self._dispatch('on_execution', reqId, contract, execution)
+
+    def execDetailsEnd(self, reqId):
+        super().execDetailsEnd(reqId)
+        self.requests.resolve(reqId)
+
+    def commissionReport(self, commissionReport):
+        super().commissionReport(commissionReport)
+        self._dispatch('on_commission', commissionReport.execId, commissionReport.commission)
+
+    def commissionAndFeesReport(self, commissionAndFeesReport):
+        #Newer ibapi versions send this instead of commissionReport
+        super().commissionAndFeesReport(commissionAndFeesReport)
+        self._dispatch('on_commission', commissionAndFeesReport.execId, commissionAndFeesReport.commissionAndFees)
+
+    def nextValidId(self, orderId):
+        super().nextValidId(orderId)
+        self.requests.resolve(NEXT_VALID_ID, orderId)
+        self._dispatch('on_next_valid_id', orderId)
+
+    def error(self, reqId, errorCode, errorString, advancedOrderRejectJson=""):
+        super().error(reqId, errorCode, errorString, advancedOrderRejectJson)
+        if reqId in self.order_ids:
+            return
+        #A pending request that IBKR rejects fails straight away instead of waiting out its timeout
+        self.requests.fail(reqId, errorCode, errorString)
@@ -0,0 +1,498 @@
+'''
+Vectorized Opening Range Breakout backtest.
+
+Notebook 1 walks every 5 minute bar with .iloc and appends to dictionaries of lists, which takes minutes per parameter
+setting on years of MES/MNQ data. This engine produces the same outputs (the trade_data dictionary rrk.kpi_dataframe
+consumes and the return/entry/stop_price/profit_target/signal/trade_outcome columns) but only steps from event to event:
+
+- bars are grouped by session (calendar date, like the notebook) and the opening range bar is found with a mask
+- entries are the first bar of the session whose High/Low breaks the (forward filled) opening range levels
+- stop loss, profit target and the 13:45 flat exit are resolved with first-touch searches over running max/min arrays
+
+So the Python work is a handful of NumPy calls per trade instead of dozens of .iloc lookups per bar.
+
+Usage in Notebook 1 (replacing the signal/return loop):
+
+    import orb.backtest as orbb
+    trade_data, trade_count = orbb.run_backtest(data_dict, tickers, profit_multiplier)
+
+reference_backtest keeps the notebook loop so check_parity can confirm both give identical results.
+'''
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                            #IMPORT LIBRARIES AND DEPENDENCIES
+#-------------------------------------------------------------------------------------------------------------------------------
+
+import time
+
+import numpy as np
+import pandas as pd
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Constants
+#-------------------------------------------------------------------------------------------------------------------------------
+
+#Start of the opening range bar (MST)
+ORB_TIME = '07:30:00'
+#Any trade still open on a bar strictly between these times is closed at that bar's open
+EXIT_WINDOW = ('13:44:00', '13:55:00')
+
+#Machine learning features recorded with every trade, in the order Notebook 1 appends them to trade_data
+FEATURE_COLUMNS = ['volume_5min', 'barsize_5min', 'barsize_5min_norm', 'gap', 'topping_tail', 'bottoming_tail',
+                   'avwap_2day', 'sma_90_norm', 'sma_90_slope', 'inside_wicks', 'inside_body']
+
+#Per-bar columns the notebook adds to each ticker's dataframe
+OUTPUT_COLUMNS = ['return', 'entry', 'stop_price', 'profit_target', 'signal', 'trade_outcome']
+
+
+def _seconds(time_string):
+    t = pd.to_datetime(time_string).time()
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                #Session Index and Levels
+#-------------------------------------------------------------------------------------------------------------------------------
+
+def session_index(index):
+    '''
+    For a DatetimeIndex return (seconds of the day, first bar of each bar's session, first bar of the next session).
+    Sessions are consecutive runs of the same calendar date, exactly how the notebook loop resets each day.
+    '''
+    index = pd.DatetimeIndex(index)
+    seconds = (index.hour * 3600 + index.minute * 60 + index.second).to_numpy()
+    days = index.normalize().asi8
+    n = len(days)
+    new_session = np.ones(n, dtype=bool)
+    new_session[1:] = days[1:] != days[:-1]
+    starts = np.flatnonzero(new_session)
+    ends = np.append(starts[1:], n)
+    session_id = np.cumsum(new_session) - 1
+    return seconds, starts[session_id], ends[session_id]
+
+
+def opening_range_levels(seconds, session_start, high, low, orb_time=ORB_TIME, orb_minutes=5):
+    '''
+    Long and short entry levels for every bar from raw OHLC arrays: the High/Low over the opening range window, known
+    from the last bar of the window and forward filled to the end of that session only.
+    '''
+    n = len(seconds)
+    long_entry = np.full(n, np.nan)
+    short_entry = np.full(n, np.nan)
+    start = _seconds(orb_time)
+    positions = np.flatnonzero((seconds >= start) & (seconds < start + (orb_minutes * 60)))
+    if len(positions) == 0:
+        return long_entry, short_entry
+
+    #The window is one contiguous block per session, so reduceat gives every session's range in one call
+    sessions = session_start[positions]
+    first = np.flatnonzero(np.r_[True, sessions[1:] != sessions[:-1]])
+    last = np.r_[first[1:], len(positions)] - 1
+    long_entry[positions[last]] = np.maximum.reduceat(high[positions], first)
+    short_entry[positions[last]] = np.minimum.reduceat(low[positions], first)
+
+    #Forward fill by carrying the index of the last known level, but never across a session boundary
+    source = np.maximum.accumulate(np.where(np.isnan(long_entry), -1, np.arange(n)))
+    same_session = source >= session_start
+    return np.where(same_session, long_entry[source], np.nan), np.where(same_session, short_entry[source], np.nan)
+
+
+def orb_levels(data, orb_time=ORB_TIME, orb_minutes=None):
+    '''
+    Long and short entry levels for every bar of a dataframe. Frames that already went through find_conditions keep
+    their long_entry/short_entry columns (notebook parity) unless a specific orb_minutes window is asked for.
+    '''
+    if (orb_minutes is None) and ('long_entry' in data.columns) and ('short_entry' in data.columns):
+        return data['long_entry'].to_numpy(dtype=float), data['short_entry'].to_numpy(dtype=float)
+    seconds, session_start, _ = session_index(data.index)
+    return opening_range_levels(seconds, session_start, data['High'].to_numpy(dtype=float),
+                                data['Low'].to_numpy(dtype=float), orb_time, orb_minutes or 5)
+
+
+def _feature_matrix(data):
+    features = np.full((len(data), len(FEATURE_COLUMNS)), np.nan)
+    for j, column in enumerate(FEATURE_COLUMNS):
+        if column in data.columns:
+            features[:, j] = data[column].to_numpy(dtype=float)
+    return features
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                #First-Touch Searches
+#-------------------------------------------------------------------------------------------------------------------------------
+
+def _first_true(mask):
+    if len(mask) == 0:
+        return 0
+    k = int(np.argmax(mask))
+    return k if mask[k] else len(mask)
+
+
+def _first_at_or_above(values, level):
+    #The running max never decreases, so the first touch is a binary search
+    return int(np.searchsorted(np.maximum.accumulate(values), level, side='left'))
+
+
+def _first_at_or_below(values, level):
+    return int(np.searchsorted(-np.minimum.accumulate(values), -level, side='left'))
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                #Vectorized Backtest
+#-------------------------------------------------------------------------------------------------------------------------------
+
+def backtest_arrays(index, open_, high, low, close, long_entry, short_entry, seconds, session_end, features=None,
+                    profit_multiplier=2, exit_window=EXIT_WINDOW, cancel_time=None, reentry=True,
+                    reentry_tolerance=None):
+    '''
+    The backtest on plain arrays (what the sweep workers map from disk). Returns (trades, columns), see backtest_ticker.
+
+    cancel_time: no entries or re-entries on bars starting at or after this time ('13:30:00' like the live bot)
+    reentry: allow the single re-entry after a stop out
+    reentry_tolerance: None re-enters after a stop like the notebook, a number of points classifies the first exit the
+                       way the live bot does (an exit within the tolerance of the stop counts as stopped)
+    '''
+    n = len(close)
+    exit_after, exit_before = _seconds(exit_window[0]), _seconds(exit_window[1])
+    in_exit_window = (seconds > exit_after) & (seconds < exit_before)
+    can_enter = np.ones(n, dtype=bool) if cancel_time is None else seconds < _seconds(cancel_time)
+    no_features = [np.nan] * len(FEATURE_COLUMNS)
+
+    returns = np.zeros(n)
+    entry_price = np.zeros(n)
+    stop_price = np.zeros(n)
+    profit_price = np.zeros(n)
+    signal = np.full(n, '', dtype='<U5')
+    outcome = np.full(n, '', dtype='<U7')
+    trades = {}
+
+    def enter(e, direction):
+        if direction == 'LONG':
+            entry, stop = long_entry[e], short_entry[e]
+            target = entry + ((entry - stop) * profit_multiplier)
+            returns[e] = (close[e] / entry) - 1
+        else:
+            entry, stop = short_entry[e], long_entry[e]
+            target = entry - ((stop - entry) * profit_multiplier)
+            returns[e] = (entry / close[e]) - 1
+        signal[e] = direction
+        entry_price[e], stop_price[e], profit_price[e] = entry, stop, target
+        trades[len(trades) + 1] = [index[e], direction, entry, *(no_features if features is None else features[e])]
+        return entry, stop, target
+
+    #Bar 0 is never traded (the notebook starts its loop at 1)
+    i = 1
+    current_day_end = -1
+    trade_executed_today = False
+    trades_today = 0
+    last_outcome = ''
+    last_direction = None
+    reentry_pending = False
+    position = None
+
+    while i < n:
+        end = session_end[i]
+        if end != current_day_end:
+            current_day_end = end
+            trade_executed_today = False
+            trades_today = 0
+            reentry_pending = False
+
+        if position is not None:
+            #Manage the open trade: stop first, then profit target, then the end of day exit (all first touch)
+            direction, entry, stop, target = position
+            window = slice(i, end)
+            if direction == 'LONG':
+                k_stop = _first_at_or_below(low[window], stop)
+                k_profit = _first_at_or_above(high[window], target)
+            else:
+                k_stop = _first_at_or_above(high[window], stop)
+                k_profit = _first_at_or_below(low[window], target)
+            k_time = _first_true(in_exit_window[window])
+            k = min(k_stop, k_profit, k_time)
+            x = i + k
+
+            #Every bar before the exit just carries the position and earns the bar's return
+            if x > i:
+                hold = slice(i, x)
+                if direction == 'LONG':
+                    returns[hold] = (close[hold] / close[i - 1:x - 1]) - 1
+                else:
+                    returns[hold] = (close[i - 1:x - 1] / close[hold]) - 1
+                signal[hold] = direction
+                entry_price[hold], stop_price[hold], profit_price[hold] = entry, stop, target
+            if x >= end:
+                #Still open at the end of the session, it carries into the next one
+                i = end
+                continue
+
+            if k == k_stop:
+                last_outcome, exit_price = 'Stopped', stop
+            elif k == k_profit:
+                last_outcome, exit_price = 'Profit', target
+            else:
+                last_outcome, exit_price = '', open_[x]
+            if direction == 'LONG':
+                returns[x] = (exit_price / close[x - 1]) - 1
+            else:
+                returns[x] = (close[x - 1] / exit_price) - 1
+            outcome[x] = last_outcome
+            trades[len(trades)].append(exit_price)
+            position = None
+            if reentry_tolerance is None:
+                reentry_pending = reentry and (last_outcome == 'Stopped')
+            elif direction == 'LONG':
+                reentry_pending = reentry and (exit_price < (stop + reentry_tolerance))
+            else:
+                reentry_pending = reentry and (exit_price > (stop - reentry_tolerance))
+            i = x + 1
+
+        elif not trade_executed_today:
+            #Look for the first breakout of the session, long wins if one bar breaks both sides
+            window = slice(i, end)
+            long_break = (long_entry[window] < high[window]) & can_enter[window]
+            short_break = (short_entry[window] > low[window]) & can_enter[window]
+            k = _first_true(long_break | short_break)
+            if i + k >= end:
+                i = end
+                continue
+            e = i + k
+            last_direction = 'LONG' if long_break[k] else 'SHORT'
+            position = (last_direction, *enter(e, last_direction))
+            trades_today += 1
+            trade_executed_today = True
+            i = e + 1
+
+        elif reentry_pending and (trades_today <= 1):
+            #Stopped out of the first trade, re-enter once if the same side breaks again
+            window = slice(i, end)
+            if last_direction == 'LONG':
+                k = _first_true((long_entry[window] < high[window]) & can_enter[window])
+            else:
+                k = _first_true((short_entry[window] > low[window]) & can_enter[window])
+            outcome[i:min(i + k, end)] = last_outcome
+            if i + k >= end:
+                i = end
+                continue
+            e = i + k
+            position = (last_direction, *enter(e, last_direction))
+            trades_today += 1
+            i = e + 1
+
+        else:
+            #Done for the day, the rest of the session repeats the last outcome
+            outcome[i:end] = last_outcome
+            i = end
+
+    #Notebook 1 overwrites the last trade with the final close when it ends on an odd trade count, kpi_dataframe
+    #was built against that output so we keep it
+    if len(trades) % 2 != 0:
+        trades[len(trades)] = close[n - 1]
+
+    columns = {'return': returns, 'entry': entry_price, 'stop_price': stop_price, 'profit_target': profit_price,
+               'signal': signal, 'trade_outcome': outcome}
+    return trades, columns
+
+
+def backtest_ticker(data, profit_multiplier=2, orb_time=ORB_TIME, orb_minutes=None, exit_window=EXIT_WINDOW,
+                    cancel_time=None, reentry=True, reentry_tolerance=None):
+    '''
+    Backtest one ticker's prepared 5 minute dataframe.
+
+    Returns (trades, columns): trades is {trade number: [timestamp, 'LONG'/'SHORT', entry, *FEATURE_COLUMNS, exit]} like
+    trade_data[ticker] in Notebook 1 and columns holds an array for each of OUTPUT_COLUMNS. The defaults reproduce the
+    notebook, see backtest_arrays for the other parameters.
+    '''
+    seconds, _, session_end = session_index(data.index)
+    long_entry, short_entry = orb_levels(data, orb_time, orb_minutes)
+    return backtest_arrays(data.index, data['Open'].to_numpy(dtype=float), data['High'].to_numpy(dtype=float),
+                           data['Low'].to_numpy(dtype=float), data['Close'].to_numpy(dtype=float), long_entry,
+                           short_entry, seconds, session_end, _feature_matrix(data), profit_multiplier, exit_window,
+                           cancel_time, reentry, reentry_tolerance)
+
+
+def run_backtest(data_dict, tickers, profit_multiplier=2, orb_time=ORB_TIME, exit_window=EXIT_WINDOW):
+    '''
+    Drop-in replacement for the Notebook 1 signal/return loop. Adds the OUTPUT_COLUMNS to each dataframe in data_dict
+    and returns (trade_data, trade_count) in the shape rrk.kpi_dataframe and rrk.daytrading_KPI_df expect.
+    '''
+    trade_data = {}
+    trade_count = {}
+    for ticker in tickers:
+        print(f"Finding Trade signals and calculaiting Daily returns for {ticker}:")
+        trades, columns = backtest_ticker(data_dict[ticker], profit_multiplier, orb_time, exit_window=exit_window)
+        trade_data[ticker] = trades
+        trade_count[ticker] = len(trades)
+        for column in OUTPUT_COLUMNS:
+            data_dict[ticker][column] = columns[column]
+        print(f"{ticker} Dataframe Complete")
+    return trade_data, trade_count
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                            #Reference Loop and Parity Check
+#-------------------------------------------------------------------------------------------------------------------------------
+
+def reference_backtest(data, profit_multiplier=2, exit_window=EXIT_WINDOW):
+    '''The Notebook 1 bar-by-bar loop for one ticker, kept so check_parity has something to compare against'''
+    long_entry, short_entry = orb_levels(data)
+    features = _feature_matrix(data)
+    exit_after = pd.to_datetime(exit_window[0]).time()
+    exit_before = pd.to_datetime(exit_window[1]).time()
+    high, low = data['High'], data['Low']
+    open_, close = data['Open'], data['Close']
+    times = data.index.time
+
+    ticker_signal = ['']
+    ticker_return = [0]
+    stop_price = [0]
+    profit_price = [0]
+    entry_price = [0]
+    trade_outcome = ['']
+    trade_data = {}
+    trade_count = 0
+    trade_executed_today = False
+    current_day = False
+    Trades = 0
+
+    def no_trade(outcome):
+        ticker_signal.append('')
+        ticker_return.append(0)
+        entry_price.append(0)
+        stop_price.append(0)
+        profit_price.append(0)
+        trade_outcome.append(outcome)
+
+    def take_trade(i, direction):
+        nonlocal trade_count
+        ticker_signal.append(direction)
+        trade_outcome.append('')
+        trade_count += 1
+        if direction == 'LONG':
+            entry, stop_loss = long_entry[i], short_entry[i]
+            ticker_return.append((close.iloc[i] / entry) - 1)
+            profit_target = entry + ((entry - stop_loss) * profit_multiplier)
+        else:
+            entry, stop_loss = short_entry[i], long_entry[i]
+            ticker_return.append((entry / close.iloc[i]) - 1)
+            profit_target = entry - ((stop_loss - entry) * profit_multiplier)
+        trade_data[trade_count] = [data.index[i], direction, entry, *features[i]]
+        entry_price.append(entry)
+        stop_price.append(stop_loss)
+        profit_price.append(profit_target)
+
+    for i in range(1, len(data)):
+        day = data.index[i].date()
+        if current_day != day:
+            current_day = day
+            trade_executed_today = False
+            Trades = 0
+
+        if trade_executed_today and (ticker_signal[-1] == '') and (trade_outcome[-1] == 'Profit'):
+            no_trade('Profit')
+        elif trade_executed_today and (ticker_signal[-1] == '') and (trade_outcome[-1] == 'Stopped') and (Trades == 2):
+            no_trade('Stopped')
+        elif trade_executed_today and (ticker_signal[-1] == '') and (trade_outcome[-1] == ''):
+            no_trade('')
+
+        if trade_executed_today and (trade_outcome[-1] == 'Stopped') and (Trades <= 1):
+            lookback = -1
+            while ticker_signal[lookback] == '':
+                lookback -= 1
+            direction = ticker_signal[lookback]
+            if (direction == 'LONG') and (long_entry[i] < high.iloc[i]):
+                take_trade(i, 'LONG')
+                Trades += 1
+            elif (direction == 'SHORT') and (short_entry[i] > low.iloc[i]):
+                take_trade(i, 'SHORT')
+                Trades += 1
+            else:
+                no_trade('Stopped')
+
+        elif (ticker_signal[-1] == '') and not trade_executed_today:
+            if long_entry[i] < high.iloc[i]:
+                take_trade(i, 'LONG')
+                Trades += 1
+                trade_executed_today = True
+            elif short_entry[i] > low.iloc[i]:
+                take_trade(i, 'SHORT')
+                Trades += 1
+                trade_executed_today = True
+            else:
+                no_trade('')
+
+        elif ticker_signal[-1] in ('LONG', 'SHORT'):
+            direction = ticker_signal[-1]
+            stop_loss, profit_target, entry = stop_price[-1], profit_price[-1], entry_price[-1]
+            if direction == 'LONG':
+                stopped, profit = low.iloc[i] <= stop_loss, high.iloc[i] >= profit_target
+            else:
+                stopped, profit = high.iloc[i] >= stop_loss, low.iloc[i] <= profit_target
+            if stopped or profit or (exit_after < times[i] < exit_before):
+                if stopped:
+                    outcome, exit_price = 'Stopped', stop_loss
+                elif profit:
+                    outcome, exit_price = 'Profit', profit_target
+                else:
+                    outcome, exit_price = '', open_.iloc[i]
+                trade_data[trade_count].append(exit_price)
+                no_trade(outcome)
+                if direction == 'LONG':
+                    ticker_return[-1] = (exit_price / close.iloc[i - 1]) - 1
+                else:
+                    ticker_return[-1] = (close.iloc[i - 1] / exit_price) - 1
+            else:
+                ticker_signal.append(direction)
+                trade_outcome.append('')
+                if direction == 'LONG':
+                    ticker_return.append((close.iloc[i] / close.iloc[i - 1]) - 1)
+                else:
+                    ticker_return.append((close.iloc[i - 1] / close.iloc[i]) - 1)
+                stop_price.append(stop_loss)
+                profit_price.append(profit_target)
+                entry_price.append(entry)
+
+    if trade_count % 2 != 0:
+        trade_data[trade_count] = close.iloc[len(data) - 1]
+
+    columns = {'return': np.array(ticker_return, dtype=float), 'entry': np.array(entry_price, dtype=float),
+               'stop_price': np.array(stop_price, dtype=float), 'profit_target': np.array(profit_price, dtype=float),
+               'signal': np.array(ticker_signal), 'trade_outcome': np.array(trade_outcome)}
+    return trade_data, columns
+
+
+def _same(a, b):
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return (len(a) == len(b)) and all(_same(x, y) for x, y in zip(a, b))
+    if isinstance(a, (float, np.floating)) and isinstance(b, (float, np.floating)):
+        return (np.isnan(a) and np.isnan(b)) or (a == b)
+    return a == b
+
+
+def check_parity(data, profit_multiplier=2):
+    '''
+    Run the reference loop and the vectorized engine on the same dataframe, raise AssertionError on the first
+    difference and return the (loop seconds, vectorized seconds) it took each of them.
+    '''
+    started = time.perf_counter()
+    loop_trades, loop_columns = reference_backtest(data, profit_multiplier)
+    loop_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    trades, columns = backtest_ticker(data, profit_multiplier)
+    vectorized_seconds = time.perf_counter() - started
+
+    assert loop_trades.keys() == trades.keys(), f"Trade counts differ: {len(loop_trades)} vs {len(trades)}"
+    for number in loop_trades:
+        assert _same(loop_trades[number], trades[number]), \
+            f"Trade {number} differs:\n loop: {loop_trades[number]}\n vectorized: {trades[number]}"
+    for column in OUTPUT_COLUMNS:
+        expected, actual = loop_columns[column], columns[column]
+        if expected.dtype.kind == 'f':
+            matches = np.array_equal(expected, actual, equal_nan=True)
+        else:
+            matches = np.array_equal(expected, actual)
+        assert matches, f"Column {column} differs at rows {np.flatnonzero(expected != actual)[:10]}"
+    print(f"Parity confirmed on {len(data)} bars and {len(trades)} trades: loop {loop_seconds:.2f}s, "
+          f"vectorized {vectorized_seconds:.3f}s ({loop_seconds / vectorized_seconds:.0f}x)")
+    return loop_seconds, vectorized_seconds
@@ -0,0 +1,176 @@
+'''
+Append-only ring buffer of OHLCV bars.
+
+Every polling cycle used to request a full day of 5 minute bars, rebuild a DataFrame with rr.dataToDataFrame, re-parse
+the dates, convert UTC to MST and rebuild the Time column, just to read the last two rows and the 7:30 bar. The
+BarStore is preallocated once with typed NumPy columns (int64 epoch seconds plus float64 OHLCV) and the historical and
+keepUpToDate callbacks write straight into it. Lookups we make at decision time are O(1):
+
+- latest(): the bar that is still building
+- latest_closed(): the last bar that has closed
+- orb_bar(session_date): the opening range bar for a session
+- find(timestamp): any bar still in the buffer by its start time
+'''
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                            #IMPORT LIBRARIES AND DEPENDENCIES
+#-------------------------------------------------------------------------------------------------------------------------------
+
+import datetime as dt
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Constants
+#-------------------------------------------------------------------------------------------------------------------------------
+
+TIMEZONE = ZoneInfo('America/Denver')
+ORB_BAR_TIME = dt.time(7, 30)
+COLUMNS = ('Open', 'High', 'Low', 'Close', 'Volume')
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                        #Bar
+#-------------------------------------------------------------------------------------------------------------------------------
+
+class Bar:
+    '''A single bar handed out at decision time, the timestamp is converted to MST only here'''
+    __slots__ = ('epoch', 'open', 'high', 'low', 'close', 'volume')
+
+    def __init__(self, epoch, open, high, low, close, volume):
+        self.epoch = epoch
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    @property
+    def timestamp(self):
+        return dt.datetime.fromtimestamp(self.epoch, TIMEZONE)
+
+    def __repr__(self):
+        return f"Bar({self.timestamp}, O={self.open}, H={self.high}, L={self.low}, C={self.close}, V={self.volume})"
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Ring Buffer
+#-------------------------------------------------------------------------------------------------------------------------------
+
+class BarStore:
+
+    def __init__(self, capacity=4096, orb_time=ORB_BAR_TIME, timezone=TIMEZONE):
+        self.capacity = capacity
+        self.orb_time = orb_time
+        self.timezone = timezone
+        #Typed columns, allocated once
+        self.epoch = np.zeros(capacity, dtype=np.int64)
+        self.open = np.zeros(capacity, dtype=np.float64)
+        self.high = np.zeros(capacity, dtype=np.float64)
+        self.low = np.zeros(capacity, dtype=np.float64)
+        self.close = np.zeros(capacity, dtype=np.float64)
+        self.volume = np.zeros(capacity, dtype=np.float64)
+        #Total bars ever appended, a bar's sequence number modulo capacity is its slot
+        self.count = 0
+        #epoch -> sequence number and session date -> sequence number of that session's opening range bar
+        self._seq_by_epoch = {}
+        self._orb_seq = {}
+        #Local start time of the newest bar, worked out once when it is appended
+        self.latest_time = None
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                    #Writing
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def _write(self, slot, open, high, low, close, volume):
+        self.open[slot] = open
+        self.high[slot] = high
+        self.low[slot] = low
+        self.close[slot] = close
+        self.volume[slot] = volume
+
+    def update(self, epoch, open, high, low, close, volume):
+        '''
+        Write a bar in place. Returns True when the bar is new, which means the bar before it has closed, and False
+        when IBKR is just updating a bar we already hold.
+        '''
+        epoch = int(epoch)
+        seq = self._seq_by_epoch.get(epoch)
+        if seq is not None:
+            self._write(seq % self.capacity, open, high, low, close, volume)
+            return False
+        if self.count and epoch < self.epoch[(self.count - 1) % self.capacity]:
+            #An older bar that already left the buffer, nothing to update
+            return False
+
+        seq = self.count
+        slot = seq % self.capacity
+        if seq >= self.capacity:
+            del self._seq_by_epoch[int(self.epoch[slot])]
+        self.epoch[slot] = epoch
+        self._write(slot, open, high, low, close, volume)
+        self._seq_by_epoch[epoch] = seq
+        self.count += 1
+
+        #This is the only timezone conversion we do, once per bar rather than per cycle
+        local = dt.datetime.fromtimestamp(epoch, self.timezone)
+        self.latest_time = local
+        if local.time() == self.orb_time:
+            self._orb_seq[local.date()] = seq
+        return True
+
+    def update_from_ib(self, bar):
+        '''IBKR BarData requested with formatDate=2 (epoch seconds)'''
+        return self.update(bar.date, bar.open, bar.high, bar.low, bar.close, bar.volume)
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                    #O(1) Lookups
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def _live(self, seq):
+        return (seq is not None) and (self.count - self.capacity <= seq < self.count)
+
+    def get(self, seq):
+        if not self._live(seq):
+            return None
+        slot = seq % self.capacity
+        return Bar(int(self.epoch[slot]), float(self.open[slot]), float(self.high[slot]), float(self.low[slot]),
+                   float(self.close[slot]), float(self.volume[slot]))
+
+    def latest(self):
+        return self.get(self.count - 1)
+
+    def latest_closed(self):
+        return self.get(self.count - 2)
+
+    def orb_bar(self, session_date):
+        return self.get(self._orb_seq.get(session_date))
+
+    def find(self, epoch):
+        return self.get(self._seq_by_epoch.get(int(epoch)))
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                    #Windows
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def last(self, column, n, closed_only=True):
+        '''The last n values of a column in time order (a copy, only used outside the hot path)'''
+        end = self.count - 1 if closed_only else self.count
+        start = max(end - n, self.count - self.capacity, 0)
+        slots = np.arange(start, end) % self.capacity
+        return getattr(self, column.lower())[slots]
+
+    def to_frame(self):
+        '''Same layout as the old rr.dataToDataFrame frame after localizing, handy for debugging and notebooks'''
+        start = max(self.count - self.capacity, 0)
+        slots = np.arange(start, self.count) % self.capacity
+        df = pd.DataFrame({name: getattr(self, name.lower())[slots] for name in COLUMNS})
+        df.index = pd.to_datetime(self.epoch[slots], unit='s', utc=True).tz_convert(str(self.timezone))
+        df.index.name = 'Date'
+        df['Time'] = df.index.time
+        return df
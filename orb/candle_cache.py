@@ -0,0 +1,239 @@
+'''
+Local columnar cache of the candle tables.
+
+Notebooks 1 and 3 pull years of 5 minute MES/MNQ candles from PostgreSQL with rr.candle_database_to_dataframe on every
+run. The CandleCache keeps a copy on disk as uncompressed Feather (Arrow IPC) files, one per ticker and month:
+
+    candle_cache/
+        mnq/
+            2023-11.feather
+            2023-12.feather
+            ...
+            _meta.json          <- high-water mark, row count and when it was last refreshed
+
+- cold load: one bulk fetch through the loader (rr.candle_database_to_dataframe by default), split into months
+- warm load: every month is memory-mapped and stitched back together, no database round trip
+- refresh: once the cache is missing the last completed session, rows newer than the high-water mark are merged in
+  and only the months they touch are rewritten. With a since_query only those rows are fetched, without one the
+  loader's full history is fetched and filtered down to them
+- invalidate / rebuild wipe a ticker (or everything) and start again, is_fresh says whether the cache already holds
+  the last completed session
+
+Usage in Notebook 1 (engine is the notebook's SQLAlchemy engine, candles_since the SELECT of Date, Open, High, Low,
+Close, Volume for :ticker after :since from our candle table):
+
+    from orb.candle_cache import CandleCache
+    cache = CandleCache(username=username, password=password, orb_time=orb_time, since_query=candles_since,
+                        engine=engine)
+    data_MES = cache.load('mes')
+    data_MNQ = cache.load('mnq')
+
+Leaving out since_query and engine still refreshes a stale cache, it just pays for the full fetch to do it.
+
+The frames come back exactly like the loader's: a 'Date' DatetimeIndex, Open/High/Low/Close/Volume and a Time column.
+'''
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                            #IMPORT LIBRARIES AND DEPENDENCIES
+#-------------------------------------------------------------------------------------------------------------------------------
+
+import datetime as dt
+import json
+import os
+import shutil
+import time
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import RiverRose as rr
+import sqlalchemy as sa
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Constants
+#-------------------------------------------------------------------------------------------------------------------------------
+
+CACHE_DIRECTORY = 'candle_cache'
+META_FILE = '_meta.json'
+TIMEZONE = ZoneInfo('America/Denver')
+#Regular trading hours close (MST), a session only counts as complete after this
+SESSION_CLOSE = dt.time(14, 0)
+#Columns we keep on disk, Time is rebuilt from the index on load
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Helpers
+#-------------------------------------------------------------------------------------------------------------------------------
+
+def last_complete_session(now=None):
+    '''The date of the most recent weekday session that has already closed (holidays are not accounted for)'''
+    now = now or dt.datetime.now(TIMEZONE)
+    day = now.date() if now.time() >= SESSION_CLOSE else now.date() - dt.timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= dt.timedelta(days=1)
+    return day
+
+
+def _finish_frame(data):
+    '''Put a frame into the loader's layout: sorted 'Date' index, OHLCV columns and a Time column'''
+    data = data.sort_index()
+    data = data[~data.index.duplicated(keep='last')]
+    data.index.name = 'Date'
+    data['Time'] = data.index.time
+    return data
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Candle Cache
+#-------------------------------------------------------------------------------------------------------------------------------
+
+class CandleCache:
+    '''
+    loader: function(ticker) returning the full history, defaults to rr.candle_database_to_dataframe
+    since_query: SQL for the incremental refresh with :ticker and :since bound parameters, returning Date, Open, High,
+                 Low, Close, Volume (the candle schema lives in RiverRose, so it is passed in rather than guessed)
+    engine: SQLAlchemy engine the since_query runs on
+    '''
+
+    def __init__(self, directory=CACHE_DIRECTORY, username=None, password=None, orb_time='5min', loader=None,
+                 since_query=None, engine=None):
+        self.directory = directory
+        self.username = username
+        self.password = password
+        self.orb_time = orb_time
+        self.loader = loader
+        self.since_query = since_query
+        self.engine = engine
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                    #Paths and Metadata
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def _ticker_directory(self, ticker):
+        return os.path.join(self.directory, ticker.lower())
+
+    def _partition_path(self, ticker, month):
+        return os.path.join(self._ticker_directory(ticker), f"{month}.feather")
+
+    def _partitions(self, ticker):
+        folder = self._ticker_directory(ticker)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(os.path.join(folder, name) for name in os.listdir(folder) if name.endswith('.feather'))
+
+    def metadata(self, ticker):
+        path = os.path.join(self._ticker_directory(ticker), META_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            meta = json.load(f)
+        meta['high_water'] = pd.Timestamp(meta['high_water'])
+        return meta
+
+    def _write_metadata(self, ticker, high_water, rows):
+        meta = {'ticker': ticker.lower(), 'high_water': str(high_water), 'rows': int(rows),
+                'refreshed_at': dt.datetime.now(TIMEZONE).isoformat(timespec='seconds')}
+        path = os.path.join(self._ticker_directory(ticker), META_FILE)
+        #Write then rename, so a crash leaves either the old file or the new one and never half of it
+        with open(path + '.tmp', 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(path + '.tmp', path)
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                    #Reading and Writing
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def _write_months(self, ticker, data):
+        '''Write (or overwrite) one Feather file for every month present in data'''
+        os.makedirs(self._ticker_directory(ticker), exist_ok=True)
+        months = data.index.strftime('%Y-%m')
+        for month, frame in data[COLUMNS].groupby(months):
+            #Uncompressed so the file can be memory-mapped without decoding, renamed into place once complete
+            path = self._partition_path(ticker, month)
+            feather.write_feather(frame.reset_index(), path + '.tmp', compression='uncompressed')
+            os.replace(path + '.tmp', path)
+
+    def _read_partition(self, path):
+        with pa.memory_map(path, 'r') as source:
+            table = pa.ipc.open_file(source).read_all()
+        return table.to_pandas().set_index('Date')
+
+    def _read_cached(self, ticker):
+        frames = [self._read_partition(path) for path in self._partitions(ticker)]
+        if not frames:
+            return None
+        return pd.concat(frames)
+
+    def _fetch_all(self, ticker):
+        if self.loader is not None:
+            return self.loader(ticker)
+        return rr.candle_database_to_dataframe(ticker, self.username, self.password, self.orb_time)
+
+    def _fetch_since(self, ticker, since):
+        '''Rows after since, from the since_query when we have one, otherwise filtered out of the full history'''
+        if (self.since_query is None) or (self.engine is None):
+            print(f"{ticker}: cache is stale and there is no since_query, fetching the full history to refresh it")
+            return self._fetch_all(ticker)
+        with self.engine.connect() as connection:
+            data = pd.read_sql(sa.text(self.since_query), connection,
+                               params={'ticker': ticker, 'since': since.to_pydatetime()}, parse_dates=['Date'])
+        return data.set_index('Date')
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                    #Public Commands
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def load(self, ticker, refresh=True):
+        '''
+        Return the candles for a ticker. The first call fills the cache with a single bulk fetch, later calls read
+        the memory-mapped months and (with refresh=True, once the cache is stale) append only the newer rows.
+        '''
+        start = time.perf_counter()
+        cached = self._read_cached(ticker)
+        if cached is None:
+            data = _finish_frame(self._fetch_all(ticker))
+            self._write_months(ticker, data)
+            self._write_metadata(ticker, data.index.max(), len(data))
+            print(f"{ticker}: cached {len(data)} rows from the database in {time.perf_counter() - start:.2f} second(s)")
+            return data
+
+        meta = self.metadata(ticker)
+        if meta is None:
+            #The months were written but not _meta.json (the first fill was interrupted), rebuild it from the rows
+            self._write_metadata(ticker, cached.index.max(), len(cached))
+            meta = self.metadata(ticker)
+        if refresh and not self.is_fresh(ticker):
+            new_rows = self._fetch_since(ticker, meta['high_water'])
+            new_rows = new_rows[new_rows.index > meta['high_water']]
+            if len(new_rows):
+                #Only the months the new rows fall in get rewritten
+                touched = set(new_rows.index.strftime('%Y-%m'))
+                cached = pd.concat([cached, new_rows[COLUMNS]])
+                self._write_months(ticker, cached[cached.index.strftime('%Y-%m').isin(touched)])
+                self._write_metadata(ticker, cached.index.max(), len(cached))
+            print(f"{ticker}: fetched {len(new_rows)} new row(s) since {meta['high_water']}")
+
+        data = _finish_frame(cached)
+        print(f"{ticker}: loaded {len(data)} cached rows in {(time.perf_counter() - start) * 1000:.0f} ms")
+        return data
+
+    def is_fresh(self, ticker, now=None):
+        '''True when the cache already holds the last completed session'''
+        meta = self.metadata(ticker)
+        if meta is None:
+            return False
+        return meta['high_water'].date() >= last_complete_session(now)
+
+    def invalidate(self, ticker=None):
+        '''Delete the cache for one ticker, or every ticker when none is given'''
+        target = self.directory if ticker is None else self._ticker_directory(ticker)
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+            print(f"Removed cached candles in {target}")
+
+    def rebuild(self, ticker):
+        '''Throw away the cached months for a ticker and fill them again with one bulk fetch'''
+        self.invalidate(ticker)
+        return self.load(ticker, refresh=False)
@@ -0,0 +1,69 @@
+'''
+Front-month calendar for the futures we trade.
+
+The bot used to carry `expiration = '202503'` that had to be edited by hand every quarter. The equity index futures
+(MNQ, MES, NQ, ES, ...) list March, June, September and December contracts that expire on the third Friday of the
+month, and volume moves to the next contract about a week before that. front_month() works out which contract to
+trade on a given day from that calendar:
+
+    front_month('MNQ', dt.date(2025, 3, 12))     -> '202503'
+    front_month('MNQ', dt.date(2025, 3, 13))     -> '202506'   (8 days before the 3/21 expiry, we have rolled)
+'''
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                            #IMPORT LIBRARIES AND DEPENDENCIES
+#-------------------------------------------------------------------------------------------------------------------------------
+
+import datetime as dt
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Constants
+#-------------------------------------------------------------------------------------------------------------------------------
+
+QUARTERLY = (3, 6, 9, 12)
+#Contract months by symbol, anything else needs an explicit expiration
+CONTRACT_MONTHS = {'MNQ': QUARTERLY, 'MES': QUARTERLY, 'M2K': QUARTERLY, 'MYM': QUARTERLY,
+                   'NQ': QUARTERLY, 'ES': QUARTERLY, 'RTY': QUARTERLY, 'YM': QUARTERLY}
+#Dollars per point (the contract multiplier IBKR reports on the contract)
+POINT_VALUE = {'MNQ': 2, 'MES': 5, 'M2K': 5, 'MYM': 0.5, 'NQ': 20, 'ES': 50, 'RTY': 50, 'YM': 5}
+#CME's equity index roll date is the Thursday 8 days before the third Friday expiry
+ROLL_DAYS = 8
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Calendar
+#-------------------------------------------------------------------------------------------------------------------------------
+
+def third_friday(year, month):
+    first = dt.date(year, month, 1)
+    return first + dt.timedelta(days=((4 - first.weekday()) % 7) + 14)
+
+
+def roll_date(year, month, roll_days=ROLL_DAYS):
+    '''First day we trade the next contract instead of this one'''
+    return third_friday(year, month) - dt.timedelta(days=roll_days)
+
+
+def front_month(symbol, date=None, roll_days=ROLL_DAYS):
+    '''The contract month ('YYYYMM', what rr.usFut takes as its expiration) to trade on date (default today)'''
+    date = date or dt.date.today()
+    months = CONTRACT_MONTHS.get(symbol.upper())
+    if months is None:
+        raise ValueError(f"No contract calendar for {symbol}, add it to CONTRACT_MONTHS or pass an expiration")
+    year = date.year
+    while True:
+        for month in months:
+            if date < roll_date(year, month, roll_days):
+                return f"{year}{month:02d}"
+        year += 1
+
+
+def point_value(symbol):
+    '''Dollars per point of a symbol's contract, None when we don't know it'''
+    return POINT_VALUE.get(symbol.upper())
+
+
+def next_roll(symbol, date=None, roll_days=ROLL_DAYS):
+    '''The date we next roll out of today's front month'''
+    expiration = front_month(symbol, date, roll_days)
+    return roll_date(int(expiration[:4]), int(expiration[4:]), roll_days)
@@ -0,0 +1,602 @@
+'''
+Event driven Opening Range Breakout engine.
+
+The bot used to rebuild its whole picture of the account every 3 seconds (positions, open orders, executions and a
+full day of 5 minute bars) and then sleep. This engine subscribes once and keeps an in-memory state model that is
+updated incrementally from the IBKR callbacks forwarded by orb.app.ORBTradingApp:
+
+- 5 minute bars come from a single keepUpToDate historical data subscription
+- positions, open orders and executions are snapshotted once and then streamed by IBKR as they change
+- any number of symbols share the one connection, each with its own SessionState and bar subscription. A symbol
+  starts trading as soon as its own bars are in, and one whose bars stall is resubscribed on its own
+  (check_subscriptions) while the others keep going
+
+The trading rules (07:35 opening range bracket, single re-entry after a stop out and the 1:30pm cancel) are only
+evaluated when an event that can change their outcome arrives, so signal-to-order latency is measured in milliseconds.
+'''
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                            #IMPORT LIBRARIES AND DEPENDENCIES
+#-------------------------------------------------------------------------------------------------------------------------------
+
+import datetime as dt
+import threading
+import time
+import traceback
+from zoneinfo import ZoneInfo
+
+import RiverRose as rr
+from ibapi.execution import ExecutionFilter
+
+from orb.bar_store import BarStore
+from orb.contracts import point_value
+from orb.latency import LatencyRecorder
+from orb.ledger import FillLedger
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                #Strategy Constants
+#-------------------------------------------------------------------------------------------------------------------------------
+
+#All of our strategy times are in MST
+TIMEZONE = ZoneInfo('America/Denver')
+ORB_BAR_TIME = dt.time(7, 30)
+ENTRY_BAR_TIME = dt.time(7, 35)
+CANCEL_TIME = dt.time(13, 30)
+
+#place_oca_bracket sends a bracket (parent, profit target, stop loss) on both sides of the candle
+OCA_BRACKET_ORDERS = 6
+BRACKET_ORDERS = 3
+
+#Once IBKR reports one of these the order is no longer working
+DONE_STATUSES = ('Filled', 'Cancelled', 'ApiCancelled', 'Inactive')
+
+#keepUpToDate sends an update every few seconds, a symbol that goes this long without one gets resubscribed
+STALE_SECONDS = 90
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                #In-Memory State Model
+#-------------------------------------------------------------------------------------------------------------------------------
+
+class SessionState:
+    '''Everything the rules need to know about one symbol, updated one callback at a time'''
+
+    def __init__(self, client_id=None, on_trade=None, multiplier=None):
+        #Market data: preallocated ring buffer, the newest bar is the one still building
+        self.bars = BarStore(orb_time=ORB_BAR_TIME)
+        #None until IBKR reports the symbol, then the signed position (0.0 once we are flat again)
+        self.position = None
+        #orderId -> details of orders that are still working
+        self.open_orders = {}
+        #Every execution and commission keyed by execId, our client id's fills paired into trades as they arrive
+        self.ledger = FillLedger(client_id, multiplier, on_trade=on_trade)
+        #We don't act until the engine has every initial snapshot (bars, positions, orders, executions)
+        self.ready = False
+        #Rule flags so each decision is only made once per session
+        self.orders_placed = False
+        self.reentry_done = False
+        self.cancel_sent = False
+        #Today's ML feature row from the feature store, filled in when the opening range bar closes
+        self.features = None
+        #time.monotonic() of the last bar callback, the engine resubscribes a symbol whose bars go quiet
+        self.last_update = None
+
+    @property
+    def current_time(self):
+        '''Local start time of the bar that is still building'''
+        return self.bars.latest_time
+
+    def add_bar(self, bar):
+        '''Write a bar from the subscription in place, returns True when it closed the bar before it'''
+        return self.bars.update_from_ib(bar) and len(self.bars) > 1
+
+    def orb_bar(self):
+        '''Today's opening range bar, once it has closed'''
+        if self.current_time is None:
+            return None
+        orb_bar = self.bars.orb_bar(self.current_time.date())
+        if (orb_bar is None) or (orb_bar.epoch == self.bars.latest().epoch):
+            return None
+        return orb_bar
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                #Opening Range Breakout Rules
+#-------------------------------------------------------------------------------------------------------------------------------
+
+class ORBStrategy:
+    '''
+    The same rules the polling bot ran every 3 seconds:
+
+    - When the 7:35 bar opens, bracket both sides of the 7:30 bar with a OCA order (profit target = profit_multiplier x risk)
+    - If the first trade stopped out, re-enter once in the same direction before the cancel time
+    - After the cancel time, cancel any entry orders that haven't triggered while we are flat
+    - With an ml_gate, the 7:35 bracket only goes in on the sides the model scores above its threshold
+    '''
+
+    def __init__(self, symbol, expiration, quantity, client_id, profit_multiplier=2, reentry_tolerance=5,
+                 cancel_time=CANCEL_TIME, feature_store=None, ml_gate=None, performance_db=None, margin=None):
+        self.symbol = symbol
+        self.expiration = expiration
+        self.contract = rr.usFut(symbol, expiration)
+        self.quantity = quantity
+        self.client_id = client_id
+        self.profit_multiplier = profit_multiplier
+        self.reentry_tolerance = reentry_tolerance
+        self.cancel_time = cancel_time
+        #Optional orb.feature_store.FeatureStore, gives us the same feature row Notebook 2 trains on
+        self.feature_store = feature_store
+        #Optional orb.ml_gate.MLGate, scores the feature row and decides which sides of the 7:30 bar we bracket
+        self.ml_gate = ml_gate
+        #Optional orb.performance_db.PerformanceDB, keeps our contract size current as trade results come in
+        self.performance_db = performance_db
+        if performance_db is not None:
+            performance_db.add_listener(self.set_quantity)
+        #Initial margin per contract, recorded with each trade so Notebook 3 can work out the % return
+        self.margin = margin
+        self.state = SessionState(client_id, on_trade=self.on_trade_closed, multiplier=point_value(symbol))
+        #The engine attaches itself so we can route orders through it
+        self.engine = None
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                    #Event Hooks
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def set_quantity(self, quantity):
+        #Called from the performance database thread, only orders placed after this use the new size
+        print(f"{self.symbol}: Contract size changed from {self.quantity} to {quantity}")
+        self.quantity = quantity
+
+    def on_trade_closed(self, trade):
+        multiplier = self.state.ledger.multiplier
+        if multiplier is None:
+            #A P&L in points would be written as dollars and throw off the contract sizing, so record nothing
+            print(f"{self.symbol}: Trade {trade.number} closed but we don't know the contract's point value, add it to "
+                  f"orb.contracts.POINT_VALUE. It was not recorded in the performance table")
+            return
+        gross_profit = trade.gross_profit(multiplier)
+        print(f"{self.symbol}: Trade {trade.number} closed, {trade.direction} {trade.quantity:g} from "
+              f"{trade.entry_price:.2f} to {trade.exit_price:.2f}, gross ${gross_profit:.2f}, "
+              f"commission ${trade.commission:.2f}")
+        if self.performance_db is not None:
+            margin = None if self.margin is None else self.margin * trade.quantity
+            self.performance_db.record_trade(trade.entry_time.date(), self.symbol, trade.direction, gross_profit,
+                                             trade.commission, margin)
+
+    def on_bar_closed(self):
+        self.check_orb()
+        self.check_reentry()
+        self.check_cancel()
+
+    def on_account_event(self):
+        #The 7:35 check is cheap to repeat and covers snapshots that land after the 7:35 bar opened
+        self.check_orb()
+        self.check_reentry()
+        self.check_cancel()
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                        #Rules
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def check_orb(self):
+        state = self.state
+        if state.orders_placed or not state.ready or state.current_time is None:
+            return
+        #The 7:30 bar has only closed once the 7:35 bar is building
+        if state.current_time.time() != ENTRY_BAR_TIME:
+            return
+        orb_bar = state.orb_bar()
+        if orb_bar is None:
+            return
+
+        state.orders_placed = True
+        high = orb_bar.high
+        low = orb_bar.low
+        print(f"{self.symbol}: Time conditions met, looking for trade signals... \nHigh: ${high:.2f}, Low: ${low:.2f}")
+        if self.feature_store is not None:
+            #orders_placed is already set, so a feature or gate error must fall back to trading, never skip the day
+            try:
+                with self.engine.latency.span('features'):
+                    state.features = self.feature_store.live_row(orb_bar.timestamp.date(), orb_bar.open,
+                                                                 orb_bar.high, orb_bar.low, orb_bar.close,
+                                                                 orb_bar.volume)
+            except Exception as e:
+                print(f"{self.symbol}: Couldn't build today's features ({e}), trading without them")
+                state.features = None
+            if state.features is not None:
+                print(f"{self.symbol}: Today's features: " +
+                      ', '.join(f"{name} {value:.4f}" for name, value in state.features.items()))
+
+        if (state.position is not None) or (len(state.open_orders) != 0):
+            print(f"\n{self.symbol}: There are currently open orders or positions, so no new open orders will be placed")
+            return
+
+        stop_size = high - low
+        profit_target_long = high + (stop_size * self.profit_multiplier)
+        profit_target_short = low - (stop_size * self.profit_multiplier)
+        long_ok, short_ok = True, True
+        if self.ml_gate is not None:
+            try:
+                with self.engine.latency.span('ml_gate'):
+                    long_ok, short_ok = self.ml_gate.allow(state.features, orb_bar.timestamp.date())
+            except Exception as e:
+                print(f"{self.symbol}: ML gate failed ({e}), trading both sides")
+                long_ok, short_ok = True, True
+        if long_ok and short_ok:
+            self.engine.place_oca_bracket(self, high, profit_target_long, low, low, profit_target_short, high)
+        elif long_ok:
+            self.engine.place_bracket(self, 'BUY', high, profit_target_long, low, label='ML gated')
+        elif short_ok:
+            self.engine.place_bracket(self, 'SELL', low, profit_target_short, high, label='ML gated')
+        else:
+            print(f"{self.symbol}: The ML gate scored both sides below its threshold, no orders will be placed today")
+
+    def check_reentry(self):
+        state = self.state
+        if state.reentry_done or not state.ready or state.current_time is None:
+            return
+        #Our first trade of the day has to be closed (however many fills it took), no open orders and still have time
+        trades = state.ledger.session_trades(state.current_time.date())
+        if (state.position is None) or \
+            (len(trades) != 1) or \
+            (not trades[0].closed) or \
+            (len(state.open_orders) != 0) or \
+            (state.current_time.time() >= self.cancel_time):
+            return
+        orb_bar = state.orb_bar()
+        if orb_bar is None:
+            return
+
+        state.reentry_done = True
+        exit_price_trade_1 = trades[0].exit_price
+        high = orb_bar.high
+        low = orb_bar.low
+        tolerance = self.reentry_tolerance
+
+        #The ledger knows which way we went, the tolerance only decides whether the exit was our stop
+        if trades[0].direction == 'LONG':
+            print(f"{self.symbol}: We went Long this morning")
+            if exit_price_trade_1 < (low + tolerance):
+                print(f"{self.symbol}: We stopped, let's look to re-enter")
+                profit_target = ((high - low) * self.profit_multiplier) + high
+                self.engine.place_bracket(self, 'BUY', high, profit_target, low)
+            else:
+                print(f"{self.symbol}: Algorithm hit profit, congratulations!")
+        else:
+            print(f"{self.symbol}: We went Short this morning")
+            if exit_price_trade_1 > (high - tolerance):
+                print(f"{self.symbol}: We stopped, let's look to re-enter")
+                profit_target = low - ((high - low) * self.profit_multiplier)
+                self.engine.place_bracket(self, 'SELL', low, profit_target, high)
+            else:
+                print(f"{self.symbol}: Algorithm hit profit, congratulations!")
+
+    def check_cancel(self):
+        state = self.state
+        if state.cancel_sent or not state.ready or state.current_time is None:
+            return
+        if state.current_time.time() < self.cancel_time:
+            return
+        #Only cancel entries that never triggered, a working bracket on an open position stays put
+        if state.position or len(state.open_orders) == 0:
+            return
+
+        state.cancel_sent = True
+        print(f"{self.symbol}: Position didn't trigger before our minimum time condition. Cancelling Orders...")
+        #Cancelling the parent order takes its profit target and stop loss with it
+        for order_id, order in list(state.open_orders.items()):
+            if order['parentId'] == 0:
+                self.engine.cancel_order(order_id)
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Event Engine
+#-------------------------------------------------------------------------------------------------------------------------------
+
+class ORBEngine:
+    '''Routes callbacks from ORBTradingApp into each strategy's state and submits the orders the rules ask for'''
+
+    def __init__(self, app, strategies, time_period='1 D', candle_size='5 mins', request_timeout=30,
+                 stale_seconds=STALE_SECONDS, latency=None):
+        self.app = app
+        self.strategies = {strategy.symbol: strategy for strategy in strategies}
+        self.time_period = time_period
+        self.candle_size = candle_size
+        self.request_timeout = request_timeout
+        self.stale_seconds = stale_seconds
+        #reqId -> strategy for every live bar subscription, and symbol -> its current request so each symbol's
+        #subscription can be replaced on its own
+        self.bar_requests = {}
+        self.bar_pending = {}
+        #execId -> commission for commissionReports that arrive before their execution
+        self.early_commissions = {}
+        #Positions, open orders and executions are shared by every symbol, no strategy acts before they are in
+        self.account_ready = False
+        self.next_order_id = app.nextOrderId
+        #Callbacks arrive on the connection thread, start/stop are called from the main thread
+        self.lock = threading.RLock()
+        #When the event that is currently being handled arrived, used to report signal-to-order latency
+        self.event_started = None
+        #Spans for every hot-path stage (orb.latency), and when each order we sent went out so we can time IBKR's ack
+        self.latency = LatencyRecorder() if latency is None else latency
+        self._orders_sent = {}
+
+        for strategy in strategies:
+            strategy.engine = self
+        app.engine = self
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                #Subscribe Once
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def start(self):
+        '''
+        Send every subscription at once. Each symbol starts evaluating its rules as soon as its own bars and the shared
+        account snapshots are in, so a symbol whose data is slow (or never arrives) doesn't hold up the others.
+        '''
+        with self.lock:
+            snapshots = [self.app.request_positions(),
+                         self.app.request_open_orders(),
+                         self.app.request_executions(ExecutionFilter())]
+            for strategy in self.strategies.values():
+                self._subscribe(strategy)
+
+        #Callbacks keep filling the state while we wait, we just don't evaluate anything until it's complete
+        for pending in snapshots:
+            pending.result(timeout=self.request_timeout)
+            self.latency.record(f"request: {pending.description}", pending.elapsed)
+            print(f"{pending.description} loaded in {pending.elapsed * 1000:.0f} ms")
+
+        with self.lock:
+            self.account_ready = True
+            for strategy in self.strategies.values():
+                if self.bar_pending[strategy.symbol].done():
+                    self._activate(strategy)
+
+        for strategy in self.strategies.values():
+            pending = self.bar_pending[strategy.symbol]
+            try:
+                pending.result(timeout=max(0.0, self.request_timeout - (time.perf_counter() - pending.started)))
+                self.latency.record('request: historical data', pending.elapsed)
+                print(f"{pending.description} loaded in {pending.elapsed * 1000:.0f} ms")
+            except (TimeoutError, RuntimeError) as e:
+                print(f"{strategy.symbol}: {e}. The other symbols carry on, check_subscriptions() will retry it")
+        print("Subscribed to bars, positions, orders and executions. Waiting for events...")
+
+    def _subscribe(self, strategy):
+        '''(Re)start one symbol's keepUpToDate bar subscription, called with the lock held'''
+        previous = self.bar_pending.get(strategy.symbol)
+        if previous is not None:
+            self.bar_requests.pop(previous.key, None)
+            self.app.cancelHistoricalData(previous.key)
+        #Routed before the request goes out, the first bars can arrive before request_historical returns
+        req_id = self.app.requests.new_req_id()
+        self.bar_requests[req_id] = strategy
+        pending = self.app.request_historical(strategy.contract, self.time_period, self.candle_size,
+                                              keep_up_to_date=True, req_id=req_id)
+        self.bar_pending[strategy.symbol] = pending
+        strategy.state.last_update = time.monotonic()
+        return pending
+
+    def _activate(self, strategy):
+        '''Let a strategy's rules run once its bars and the account snapshots are loaded, called with the lock held'''
+        state = strategy.state
+        if state.ready:
+            return
+        self.event_started = time.perf_counter()
+        state.ready = True
+        #Trades in the execution snapshot were recorded by whichever run closed them
+        state.ledger.recording = True
+        if state.current_time is not None:
+            print(f"{strategy.symbol}: Initial bars loaded, last bar: {state.current_time}")
+        self._evaluate(strategy, strategy.on_bar_closed)
+
+    def _evaluate(self, strategy, hook):
+        '''Run one strategy's rules, an error is printed and doesn't stop the callbacks for the other symbols'''
+        try:
+            with self.latency.span(f"rules: {hook.__name__}"):
+                hook()
+        except Exception:
+            print(f"{strategy.symbol}: error while evaluating the rules\n{traceback.format_exc()}")
+
+    def check_subscriptions(self):
+        '''
+        Resubscribe any symbol whose bars never arrived, failed, or stopped updating, without touching the others.
+        The bot calls this from its main loop.
+        '''
+        now = time.monotonic()
+        with self.lock:
+            for strategy in self.strategies.values():
+                pending = self.bar_pending.get(strategy.symbol)
+                if pending is None:
+                    continue
+                if pending.error is not None:
+                    reason = f"the bar request failed with IBKR error {pending.error[0]}"
+                elif not pending.done() and (now - strategy.state.last_update > self.request_timeout):
+                    reason = f"no bars after {self.request_timeout} second(s)"
+                elif pending.done() and (now - strategy.state.last_update > self.stale_seconds):
+                    reason = f"no bar updates for {now - strategy.state.last_update:.0f} second(s)"
+                else:
+                    continue
+                print(f"{strategy.symbol}: {reason}, resubscribing")
+                self._subscribe(strategy)
+
+    def stop(self):
+        with self.lock:
+            for req_id in self.bar_requests:
+                self.app.cancelHistoricalData(req_id)
+            self.app.cancelPositions()
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                #Order Submission
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def _reserve_order_ids(self, count):
+        if self.next_order_id is None:
+            print("No valid order ID from IBKR yet, can't place orders")
+            return None
+        order_id = self.next_order_id
+        self.next_order_id += count
+        return order_id
+
+    def _mark_sent(self, order_id, count):
+        sent = time.perf_counter()
+        for i in range(count):
+            self._orders_sent[order_id + i] = sent
+
+    def _acknowledged(self, order_id):
+        sent = self._orders_sent.pop(order_id, None)
+        if sent is not None:
+            self.latency.since('order_ack', sent)
+
+    def _report_latency(self, label):
+        if self.event_started is not None:
+            self.latency.since('signal_to_order', self.event_started)
+            print(f"{label} {(time.perf_counter() - self.event_started) * 1000:.2f} ms after the triggering event")
+        #Let IBKR confirm the next id in case RiverRose used more than we reserved, nextValidId updates us when it lands
+        self.app.request_next_order_id()
+
+    def place_oca_bracket(self, strategy, high, profit_target_long, stop_loss_long, low, profit_target_short,
+                          stop_loss_short):
+        order_id = self._reserve_order_ids(OCA_BRACKET_ORDERS)
+        if order_id is None:
+            return
+        print(f"Using Order ID: {order_id}")
+        self._mark_sent(order_id, OCA_BRACKET_ORDERS)
+        with self.latency.span('order_submit'):
+            rr.place_oca_bracket(self.app, order_id, strategy.quantity, high, profit_target_long, stop_loss_long, low,
+                                 profit_target_short, stop_loss_short, strategy.contract)
+        self._report_latency(f"\n{strategy.symbol}: Order Placed")
+
+    def place_bracket(self, strategy, action, entry, profit_target, stop_loss, label='Re-entry'):
+        order_id = self._reserve_order_ids(BRACKET_ORDERS)
+        if order_id is None:
+            return
+        self._mark_sent(order_id, BRACKET_ORDERS)
+        with self.latency.span('order_submit'):
+            bracket_orders = rr.BracketOrder(order_id, action, strategy.quantity, entry, profit_target, stop_loss,
+                                             OrderType='STP LMT')
+            for i, order in enumerate(bracket_orders):
+                self.app.placeOrder(order_id + i, strategy.contract, order)
+        direction = 'Long' if action == 'BUY' else 'Short'
+        self._report_latency(f"\n{strategy.symbol}: {label} {direction} Order Placed")
+
+    def cancel_order(self, order_id):
+        print(f"The order we need to cancel is {order_id}")
+        self.app.cancelOrder(order_id)
+        print(f"Order Cancelled")
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                #Market Data Events
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def on_historical_bar(self, reqId, bar):
+        #start() holds the lock while it registers the request, so look the strategy up under it
+        with self.lock:
+            strategy = self.bar_requests.get(reqId)
+            if strategy is None:
+                return
+            strategy.state.add_bar(bar)
+            strategy.state.last_update = time.monotonic()
+
+    def on_historical_end(self, reqId):
+        with self.lock:
+            strategy = self.bar_requests.get(reqId)
+            if (strategy is None) or not self.account_ready:
+                return
+            self._activate(strategy)
+
+    def on_historical_update(self, reqId, bar):
+        with self.lock:
+            strategy = self.bar_requests.get(reqId)
+            if strategy is None:
+                return
+            self.event_started = time.perf_counter()
+            strategy.state.last_update = time.monotonic()
+            with self.latency.span('bar_update'):
+                closed = strategy.state.add_bar(bar)
+            if closed:
+                self._evaluate(strategy, strategy.on_bar_closed)
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                            #Position, Order and Execution Events
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def _strategy_for_order(self, order_id):
+        for strategy in self.strategies.values():
+            if order_id in strategy.state.open_orders:
+                return strategy
+        return None
+
+    def on_position(self, account, contract, position, avgCost):
+        strategy = self.strategies.get(contract.symbol)
+        if strategy is None:
+            return
+        with self.lock:
+            self.event_started = time.perf_counter()
+            strategy.state.position = position
+            self._evaluate(strategy, strategy.on_account_event)
+
+    def on_open_order(self, orderId, contract, order, orderState):
+        strategy = self.strategies.get(contract.symbol)
+        if strategy is None:
+            return
+        with self.lock:
+            self.event_started = time.perf_counter()
+            self._acknowledged(orderId)
+            if orderState.status in DONE_STATUSES:
+                strategy.state.open_orders.pop(orderId, None)
+            else:
+                strategy.state.open_orders[orderId] = {'action': order.action, 'orderType': order.orderType,
+                                                       'parentId': order.parentId, 'status': orderState.status}
+            self._evaluate(strategy, strategy.on_account_event)
+
+    def on_order_status(self, orderId, status, filled, remaining):
+        with self.lock:
+            self._acknowledged(orderId)
+            strategy = self._strategy_for_order(orderId)
+            if strategy is None:
+                return
+            self.event_started = time.perf_counter()
+            if status in DONE_STATUSES:
+                strategy.state.open_orders.pop(orderId, None)
+            else:
+                strategy.state.open_orders[orderId]['status'] = status
+            self._evaluate(strategy, strategy.on_account_event)
+
+    def on_execution(self, reqId, contract, execution):
+        strategy = self.strategies.get(contract.symbol)
+        if strategy is None:
+            return
+        with self.lock:
+            self.event_started = time.perf_counter()
+            with self.latency.span('execution'):
+                fill = strategy.state.ledger.add_execution(contract, execution)
+                if fill is None:
+                    return
+                commission = self.early_commissions.pop(fill.exec_id, None)
+                if commission is not None:
+                    strategy.state.ledger.add_commission(fill.exec_id, commission)
+                #A commission held for an execution this one corrected will never be claimed
+                for exec_id in [exec_id for exec_id in self.early_commissions
+                                if strategy.state.ledger.superseded(exec_id)]:
+                    del self.early_commissions[exec_id]
+            self._evaluate(strategy, strategy.on_account_event)
+        if strategy.performance_db is not None:
+            strategy.performance_db.request_refresh()
+
+    def on_commission(self, exec_id, commission):
+        with self.lock:
+            for strategy in self.strategies.values():
+                if strategy.state.ledger.add_commission(exec_id, commission):
+                    return
+                if strategy.state.ledger.superseded(exec_id):
+                    #For an execution a correction already replaced, nothing will ever claim it
+                    return
+            #Arrived before its execution, held once here until on_execution hands it to the right ledger
+            self.early_commissions[exec_id] = commission
+
+    def on_next_valid_id(self, orderId):
+        with self.lock:
+            if (self.next_order_id is None) or (orderId > self.next_order_id):
+                self.next_order_id = orderId
@@ -0,0 +1,310 @@
+'''
+Per-session feature store shared by Notebook 2 and the live bot.
+
+mnq_backtesting_data.csv is a one-off export from the Notebook 1 loop, so refreshing it means recomputing the whole
+history, and the live bot has no way to produce the same features at 07:35 without a 90 bar window. The FeatureStore
+keeps one row per session (keyed by date) in a local Feather file:
+
+- context: everything a session's features need from before its opening range bar (yesterday's OHLC, the previous
+  close, the last 89/90 closes summed, the last 19 opening range volumes summed, volume weighted price so far)
+- features: the mnq_backtesting_data.csv columns, computed from the context and the opening range bar
+
+update() only computes rows for sessions newer than the last stored date and also saves the context for the next
+session. At 07:35 the live bot calls live_row() with the 7:30 bar, which is a handful of arithmetic on that saved
+context instead of any window over the bars. Both paths go through the same functions (_feature_values and
+orb.features.orb_bar_features), so training and inference see identical definitions.
+
+One deliberate difference from the old export: avwap_2day is taken on the opening range bar, the last value known at
+07:35, where the notebook recorded it on the entry bar.
+
+Usage in Notebook 2:
+
+    from orb.feature_store import FeatureStore
+    store = FeatureStore('mnq')
+    store.update(data_MNQ)                 #candles, e.g. from orb.candle_cache
+    ml_df = store.training_rows(trade_df['mnq'])
+'''
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                            #IMPORT LIBRARIES AND DEPENDENCIES
+#-------------------------------------------------------------------------------------------------------------------------------
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+
+from orb.features import ORB_TIME, SMA_WINDOW, VOLUME_WINDOW, SessionIndex, orb_bar_features
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Constants
+#-------------------------------------------------------------------------------------------------------------------------------
+
+STORE_DIRECTORY = 'feature_store'
+ONE_DAY = np.timedelta64(1, 'D')
+
+#What a session needs from before its opening range bar
+CONTEXT_COLUMNS = ['y_date', 'y_Open', 'y_High', 'y_Low', 'y_Close', 'prior_close', 'close_sum_89', 'sma_90_prev',
+                   'volume_sum_19', 'pv_before', 'volume_before', 'anchored']
+
+#The mnq_backtesting_data.csv feature columns, in the same order
+ML_COLUMNS = ['volume_5min', 'volume_norm', 'barsize_5min', 'barsize_5min_norm', 'topping_tail', 'bottoming_tail',
+              'inside_wicks', 'inside_body', 'sma_90_norm', 'sma_90_slope', 'avwap_2day', 'gap', 'gap_up']
+
+#find_conditions forward fills these, so a value it leaves unset comes from the previous session
+CARRIED_COLUMNS = ['volume_5min', 'barsize_5min', 'barsize_5min_norm', 'gap', 'topping_tail', 'bottoming_tail',
+                   'sma_90_norm', 'sma_90_slope', 'inside_wicks', 'inside_body']
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                #Context and Feature Rows
+#-------------------------------------------------------------------------------------------------------------------------------
+
+def _window_sum(values, ends, length):
+    '''Sum of values[end - length:end] for every end, NaN where there aren't enough values yet'''
+    positions = np.maximum(ends[:, None] - length + np.arange(length), 0)
+    return np.where(ends >= length, values[positions].sum(axis=1), np.nan)
+
+
+def session_contexts(data, sessions, session_ids):
+    '''
+    Context for the given sessions as a dataframe. A session id equal to sessions.sessions means the session after
+    the data ends (the one the live bot is about to trade).
+    '''
+    close = data['Close'].to_numpy(dtype=float)
+    volume = data['Volume'].to_numpy(dtype=float)
+    session_ids = np.asarray(session_ids)
+    is_next = session_ids == sessions.sessions
+    known = np.minimum(session_ids, sessions.sessions - 1)
+    positions = np.where(is_next, sessions.size, sessions.orb_bar[known])
+    previous = np.where(is_next, sessions.sessions - 1, sessions.prior[known])
+
+    #Yesterday's bar, the calendar check happens in feature_rows so the next session can use it too
+    has_previous = previous >= 0
+    previous = np.maximum(previous, 0)
+    y_open = sessions.first(data['Open'].to_numpy(dtype=float))[previous]
+    y_high = sessions.reduce(np.maximum, data['High'].to_numpy(dtype=float))[previous]
+    y_low = sessions.reduce(np.minimum, data['Low'].to_numpy(dtype=float))[previous]
+    y_close = sessions.last(close)[previous]
+
+    #Opening range volumes of earlier sessions, summed exactly with a cumulative sum over sessions
+    orb_sessions = np.flatnonzero(sessions.orb_bar >= 0)
+    orb_volume_total = np.concatenate(([0.0], np.cumsum(volume[sessions.orb_bar[orb_sessions]])))
+    earlier = np.searchsorted(orb_sessions, session_ids)
+    window = VOLUME_WINDOW - 1
+    volume_sum = np.where(earlier >= window,
+                          orb_volume_total[earlier] - orb_volume_total[np.maximum(earlier - window, 0)], np.nan)
+
+    #Volume weighted price of any bars earlier in the same session (pre-market), zero for a regular hours session
+    same_session = ~is_next & (positions > sessions.starts[known])
+    before = np.maximum(positions - 1, 0)
+    typical_price = ((data['Open'] + data['High'] + data['Low'] + data['Close']) / 4).to_numpy(dtype=float)
+    pv_before = np.where(same_session, sessions.cumsum(typical_price * volume)[before], 0.0)
+    volume_before = np.where(same_session, sessions.cumsum(volume)[before], 0.0)
+
+    return pd.DataFrame({
+        'y_date': np.where(has_previous, sessions.dates.astype('datetime64[ns]')[previous], np.datetime64('NaT', 'ns')),
+        'y_Open': np.where(has_previous, y_open, np.nan),
+        'y_High': np.where(has_previous, y_high, np.nan),
+        'y_Low': np.where(has_previous, y_low, np.nan),
+        'y_Close': np.where(has_previous, y_close, np.nan),
+        'prior_close': np.where(positions > 0, close[np.maximum(positions - 1, 0)], np.nan),
+        'close_sum_89': _window_sum(close, positions, SMA_WINDOW - 1),
+        'sma_90_prev': _window_sum(close, positions, SMA_WINDOW) / SMA_WINDOW,
+        'volume_sum_19': volume_sum,
+        'pv_before': pv_before,
+        'volume_before': volume_before,
+        'anchored': has_previous & (sessions.orb_bar[previous] >= 0),
+    })
+
+
+def _feature_values(context, dates, open_, high, low, close, volume):
+    '''
+    ML feature values from contexts (a mapping of CONTEXT_COLUMNS to arrays) and their opening range bars (arrays of
+    the same length). This is the one place the live bot and the stored training rows get their features from.
+    '''
+    #Like the notebook's resample('D'), only the previous calendar day counts as yesterday (Mondays get NaN)
+    is_yesterday = (dates - context['y_date']) == ONE_DAY
+    y = {column: np.where(is_yesterday, context[column], np.nan) for column in ['y_Open', 'y_High', 'y_Low', 'y_Close']}
+
+    sma = (context['close_sum_89'] + close) / SMA_WINDOW
+    values = orb_bar_features(open_, high, low, close, volume, context['prior_close'], sma, context['sma_90_prev'],
+                              y['y_Open'], y['y_High'], y['y_Low'], y['y_Close'])
+
+    typical_price = (open_ + high + low + close) / 4
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vwap = (context['pv_before'] + typical_price * volume) / (context['volume_before'] + volume)
+        average_volume = (context['volume_sum_19'] + volume) / VOLUME_WINDOW
+        values['volume_norm'] = volume / average_volume
+    values['avwap_2day'] = np.where(context['anchored'], np.round(((close - vwap) / open_) * 100, 4), np.nan)
+    values['gap_up'] = np.zeros(len(dates))
+    return values
+
+
+def _context_arrays(context):
+    '''A context dataframe as the plain arrays _feature_values works on'''
+    arrays = {column: context[column].to_numpy(dtype=float) for column in CONTEXT_COLUMNS[1:-1]}
+    arrays['y_date'] = context['y_date'].to_numpy(dtype='datetime64[ns]')
+    arrays['anchored'] = context['anchored'].to_numpy(dtype=bool)
+    return arrays
+
+
+def feature_rows(context, dates, open_, high, low, close, volume):
+    '''ML feature rows (a dataframe keyed by date) from a context dataframe and the opening range bars'''
+    dates = np.asarray(dates, dtype='datetime64[ns]')
+    values = _feature_values(_context_arrays(context), dates, np.asarray(open_, dtype=float),
+                             np.asarray(high, dtype=float), np.asarray(low, dtype=float),
+                             np.asarray(close, dtype=float), np.asarray(volume, dtype=float))
+    return pd.DataFrame({column: values[column] for column in ML_COLUMNS}, index=pd.DatetimeIndex(dates, name='date'))
+
+
+def _carry_forward(rows, previous=None):
+    '''Fill unset CARRIED_COLUMNS from the session before (previous is the last stored row, if any)'''
+    if previous is not None:
+        rows = pd.concat([previous.to_frame().T[rows.columns].astype(float), rows])
+    rows[CARRIED_COLUMNS] = rows[CARRIED_COLUMNS].ffill()
+    rows['gap_up'] = np.where(rows['gap'] > 0, 1, 0)
+    rows.index.name = 'date'
+    return rows.iloc[1:] if previous is not None else rows
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Feature Store
+#-------------------------------------------------------------------------------------------------------------------------------
+
+class FeatureStore:
+
+    def __init__(self, ticker, directory=STORE_DIRECTORY, orb_time=ORB_TIME):
+        self.ticker = ticker.lower()
+        self.directory = directory
+        self.orb_time = orb_time
+        self.path = os.path.join(directory, f"{self.ticker}_features.feather")
+        self.context_path = os.path.join(directory, f"{self.ticker}_next_context.json")
+        self.rows = self._read_rows()
+        self.next_context = self._read_next_context()
+        self._prepare_live()
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                    #Files
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def _read_rows(self):
+        if not os.path.exists(self.path):
+            return pd.DataFrame(columns=CONTEXT_COLUMNS + ML_COLUMNS, index=pd.DatetimeIndex([], name='date'))
+        return feather.read_feather(self.path, memory_map=True).set_index('date')
+
+    def _read_next_context(self):
+        if not os.path.exists(self.context_path):
+            return None
+        with open(self.context_path) as f:
+            saved = json.load(f)
+        context = pd.DataFrame([saved['context']])
+        context['y_date'] = pd.to_datetime(context['y_date'])
+        return {'after': pd.Timestamp(saved['after']), 'context': context}
+
+    def _write(self):
+        os.makedirs(self.directory, exist_ok=True)
+        feather.write_feather(self.rows.reset_index(), self.path, compression='uncompressed')
+        if self.next_context is not None:
+            context = self.next_context['context'].iloc[0].to_dict()
+            context['y_date'] = str(context['y_date'])
+            context['anchored'] = bool(context['anchored'])
+            with open(self.context_path, 'w') as f:
+                json.dump({'after': str(self.next_context['after']), 'context': context}, f, indent=2)
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                    #Updating
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def update(self, data):
+        '''
+        Add rows for every session in data newer than the last stored date and save the context for the session
+        after data ends. data needs enough history before the first new session for the windows (20 sessions is
+        plenty), the full candle history from the cache is fine.
+        '''
+        sessions = SessionIndex(data.index, self.orb_time)
+        orb_sessions = np.flatnonzero(sessions.orb_bar >= 0)
+        dates = sessions.dates[orb_sessions]
+        if len(self.rows):
+            orb_sessions = orb_sessions[dates > self.rows.index.max().value]
+
+        if len(orb_sessions):
+            context = session_contexts(data, sessions, orb_sessions)
+            bars = sessions.orb_bar[orb_sessions]
+            rows = feature_rows(context, sessions.dates[orb_sessions].astype('datetime64[ns]'),
+                                data['Open'].to_numpy()[bars], data['High'].to_numpy()[bars],
+                                data['Low'].to_numpy()[bars], data['Close'].to_numpy()[bars],
+                                data['Volume'].to_numpy()[bars])
+            rows = _carry_forward(rows, self.rows.iloc[-1] if len(self.rows) else None)
+            context.index = rows.index
+            new_rows = pd.concat([context, rows], axis=1)
+            self.rows = new_rows if not len(self.rows) else pd.concat([self.rows, new_rows])
+
+        self.next_context = {'after': pd.Timestamp(sessions.dates[-1]),
+                             'context': session_contexts(data, sessions, [sessions.sessions])}
+        self._write()
+        self._prepare_live()
+        print(f"{self.ticker}: {len(orb_sessions)} new session(s), {len(self.rows)} stored through "
+              f"{self.next_context['after'].date()}")
+        return self.rows
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                    #Reading
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def features(self, start=None, end=None):
+        '''The stored ML feature rows between two dates'''
+        return self.rows.loc[start:end, ML_COLUMNS]
+
+    def live_row(self, session_date, open, high, low, close, volume):
+        '''
+        Features for today's session from its opening range bar, using the context update() saved last night.
+        Returns a dict of ML_COLUMNS values, or None when the store wasn't updated since the last session. This runs
+        inside the 07:35 window, so it stays on plain arrays (no dataframes) and only reads what _prepare_live cached.
+        '''
+        session_date = np.datetime64(session_date, 'D').astype('datetime64[ns]')
+        if (self.next_context is None) or (session_date <= self._live_after):
+            print(f"{self.ticker}: feature store has no context for {str(session_date)[:10]}, "
+                  f"run update() after the close")
+            return None
+        values = _feature_values(self._live_context, np.array([session_date]), np.array([open], dtype=float),
+                                 np.array([high], dtype=float), np.array([low], dtype=float),
+                                 np.array([close], dtype=float), np.array([volume], dtype=float))
+        row = {column: float(values[column][0]) for column in ML_COLUMNS}
+        #Same forward fill as _carry_forward, from the last stored session
+        if self._live_previous is not None:
+            for column in CARRIED_COLUMNS:
+                if np.isnan(row[column]):
+                    row[column] = self._live_previous[column]
+        row['gap_up'] = 1 if row['gap'] > 0 else 0
+        return row
+
+    def _prepare_live(self):
+        '''Cache the saved context and the last stored row as arrays/floats for live_row'''
+        if self.next_context is None:
+            self._live_after, self._live_context = None, None
+        else:
+            self._live_after = self.next_context['after'].to_datetime64().astype('datetime64[ns]')
+            self._live_context = _context_arrays(self.next_context['context'])
+        self._live_previous = None
+        if len(self.rows):
+            self._live_previous = {column: float(value) for column, value in self.rows.iloc[-1][ML_COLUMNS].items()}
+
+    def training_rows(self, trades):
+        '''
+        The mnq_backtesting_data.csv layout from a rrk.kpi_dataframe trade table: the first trade of each day, its
+        outcome as target_label and the stored features for that date (Notebook 1's ml_df cell).
+        '''
+        ml_df = trades.drop_duplicates(subset='date', keep='first')
+        ml_df = ml_df.iloc[1:].reset_index(drop=True)
+        ml_df['time'] = ml_df['timestamp'].dt.time
+        ml_df['day'] = ml_df['timestamp'].dt.day_name()
+        ml_df['transaction'] = ml_df['transaction'].map({'SHORT': 0, 'LONG': 1})
+        ml_df['target_label'] = np.where(ml_df['dollar_return'] > 0, 1, 0)
+        features = self.features().reset_index()
+        features['date'] = features['date'].dt.date
+        ml_df = ml_df[['timestamp', 'date', 'time', 'target_label', 'day', 'transaction']].merge(features, on='date',
+                                                                                                 how='left')
+        return ml_df.dropna()
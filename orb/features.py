@@ -0,0 +1,350 @@
+'''
+Vectorized feature pipeline for the ORB machine learning features.
+
+inside_day, find_conditions and anchored_vwap in Notebook 1 each copy the whole intraday frame, re-parse the dates,
+build day_map dictionaries from sorted(unique()) and merge daily tables back onto every bar. Here a SessionIndex is
+built once per frame (session id, bar offset within the session, previous session and the opening range bar of each
+session) and every feature is a reduceat / cumsum over sessions followed by a gather back onto the bars:
+
+- y_Open, y_High, y_Low, y_Close: the previous calendar day's OHLC (inside_day)
+- long_entry, short_entry and the opening range bar features in FEATURE_COLUMNS (find_conditions)
+- anchored_vwap and avwap_2day (anchored_vwap)
+- average_vol and volume_norm: opening range volume over its 20 session average (the Notebook 1 ML dataframe)
+
+The columns are added to the frame in place, so memory and run time grow linearly with the number of bars.
+
+Usage in Notebook 1 (replacing the inside_day / find_conditions / anchored_vwap cell):
+
+    import orb.features as orbf
+    MES = orbf.build_features(MES)
+    MNQ = orbf.build_features(MNQ)
+
+The outputs match the notebook functions value for value, quirks included (see the comments), and check_parity runs
+both on the same frame to prove it.
+'''
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                            #IMPORT LIBRARIES AND DEPENDENCIES
+#-------------------------------------------------------------------------------------------------------------------------------
+
+import time
+
+import numpy as np
+import pandas as pd
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Constants
+#-------------------------------------------------------------------------------------------------------------------------------
+
+ORB_TIME = '07:30:00'
+NANOSECONDS_PER_DAY = 86_400 * 10**9
+#Rolling windows from Notebook 1
+SMA_WINDOW = 90
+VOLUME_WINDOW = 20
+
+#Columns find_conditions sets on the opening range bar and then forward fills (inside_day's columns are filled too)
+YESTERDAY_COLUMNS = ['y_Open', 'y_High', 'y_Low', 'y_Close']
+ORB_COLUMNS = ['long_entry', 'short_entry', 'volume_5min', 'barsize_5min', 'barsize_5min_norm', 'gap', 'bottoming_tail',
+               'topping_tail', 'sma_90_norm', 'sma_90_slope', 'inside_wicks', 'inside_body']
+
+
+def _seconds(time_string):
+    t = pd.to_datetime(time_string).time()
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+def _ffill(values):
+    '''Forward fill NaNs in a 1D float array, leading NaNs stay NaN'''
+    positions = np.where(np.isnan(values), 0, np.arange(len(values)))
+    return values[np.maximum.accumulate(positions)]
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Session Index
+#-------------------------------------------------------------------------------------------------------------------------------
+
+class SessionIndex:
+    '''
+    Where every bar sits in its session, built once from a DatetimeIndex. A session is a run of bars on the same
+    calendar date, the same way the notebook groups them.
+
+    Per bar: session_id, offset (bars since the session's first bar), seconds (time of day)
+    Per session: starts, ends, dates (midnight, int64 ns), prior (previous session or -1), orb_bar (position of the
+    opening range bar or -1)
+    '''
+
+    def __init__(self, index, orb_time=ORB_TIME):
+        index = pd.DatetimeIndex(index)
+        self.size = len(index)
+        days = index.normalize().as_unit('ns').asi8
+        new_session = np.ones(self.size, dtype=bool)
+        new_session[1:] = days[1:] != days[:-1]
+        self.starts = np.flatnonzero(new_session)
+        self.ends = np.append(self.starts[1:], self.size)
+        self.dates = days[self.starts]
+        self.sessions = len(self.starts)
+        self.session_id = np.cumsum(new_session) - 1
+        self.offset = np.arange(self.size) - self.starts[self.session_id]
+        self.prior = np.arange(self.sessions) - 1
+        self.seconds = (index.hour * 3600 + index.minute * 60 + index.second).to_numpy()
+
+        #One opening range bar per session at most, the first bar of the frame never counts (the notebook loop starts at 1)
+        self.orb_bar = np.full(self.sessions, -1)
+        is_orb = self.seconds == _seconds(orb_time)
+        is_orb[:1] = False
+        orb_positions = np.flatnonzero(is_orb)
+        self.orb_bar[self.session_id[orb_positions]] = orb_positions
+
+    def reduce(self, ufunc, values):
+        '''One value per session, e.g. reduce(np.maximum, high)'''
+        return ufunc.reduceat(values, self.starts)
+
+    def first(self, values):
+        return values[self.starts]
+
+    def last(self, values):
+        return values[self.ends - 1]
+
+    def cumsum(self, values):
+        '''Running total that restarts at every session'''
+        #Summed in bar order within each session rather than global total minus offset, so it matches groupby exactly
+        return pd.Series(values, dtype=float).groupby(self.session_id).cumsum().to_numpy()
+
+    def gather(self, per_session, sessions=None):
+        '''Spread one value per session onto its bars, sessions of -1 give NaN'''
+        sessions = self.session_id if sessions is None else sessions[self.session_id]
+        values = np.asarray(per_session, dtype=float)[np.maximum(sessions, 0)]
+        return np.where(sessions >= 0, values, np.nan)
+
+    def previous_calendar_day(self):
+        '''For each session the session on the calendar day before it, or -1 when that day had no bars'''
+        has_prior = self.prior >= 0
+        consecutive = np.zeros(self.sessions, dtype=bool)
+        consecutive[has_prior] = (self.dates[has_prior] - self.dates[self.prior[has_prior]]) == NANOSECONDS_PER_DAY
+        return np.where(consecutive, self.prior, -1)
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Features
+#-------------------------------------------------------------------------------------------------------------------------------
+
+def add_yesterday_ohlc(data, sessions):
+    '''
+    inside_day: the previous calendar day's OHLC on every bar. Like the notebook's resample('D') a Monday looks back
+    at Sunday, so it gets NaN here (build_features forward fills it afterwards, as find_conditions did).
+    '''
+    yesterday = sessions.previous_calendar_day()
+    data['y_Open'] = sessions.gather(sessions.first(data['Open'].to_numpy(dtype=float)), yesterday)
+    data['y_High'] = sessions.gather(sessions.reduce(np.maximum, data['High'].to_numpy(dtype=float)), yesterday)
+    data['y_Low'] = sessions.gather(sessions.reduce(np.minimum, data['Low'].to_numpy(dtype=float)), yesterday)
+    data['y_Close'] = sessions.gather(sessions.last(data['Close'].to_numpy(dtype=float)), yesterday)
+    return data
+
+
+def orb_bar_features(o, h, l, c, volume, prior_close, sma, sma_prev, y_open, y_high, y_low, y_close):
+    '''
+    The find_conditions formulas for a set of opening range bars, as a dictionary of ORB_COLUMNS arrays. Rounding uses
+    np.round, which is what round() does on the numpy floats the notebook reads with .iloc.
+    '''
+    down, up = o > c, o < c
+    slope_num = sma - sma_prev
+    slope_ok = ~np.isnan(slope_num) & ~np.isnan(sma) & (sma != 0)
+    return {
+        'long_entry': h,
+        'short_entry': l,
+        'volume_5min': volume,
+        'barsize_5min': h - l,
+        'barsize_5min_norm': np.round(((h - l) / o) * 100, 2),
+        'gap': np.round(((o - prior_close) / prior_close) * 100, 2),
+        #A doji (open == close) sets neither tail, so the previous day's value carries forward
+        'bottoming_tail': np.where(down, np.round(((c - l) / o) * 100, 4),
+                                   np.where(up, np.round(((o - l) / o) * 100, 4), np.nan)),
+        'topping_tail': np.where(down, np.round(((h - o) / o) * 100, 4),
+                                 np.where(up, np.round(((h - c) / o) * 100, 4), np.nan)),
+        'sma_90_norm': np.round(o / sma, 4),
+        'sma_90_slope': np.where(slope_ok, np.round((slope_num / np.where(slope_ok, sma, 1)) * 100, 4), np.nan),
+        'inside_wicks': ((o > y_low) & (o < y_high)).astype(float),
+        #Also left unset (and carried forward) when yesterday's open equals its close or is unknown
+        'inside_body': np.where(y_open > y_close, ((o > y_close) & (o < y_open)).astype(float),
+                                np.where(y_open < y_close, ((o < y_close) & (o > y_open)).astype(float), np.nan)),
+    }
+
+
+def add_orb_features(data, sessions):
+    '''find_conditions: entry levels and the opening range bar features, set on the opening range bar only'''
+    close = data['Close'].to_numpy(dtype=float)
+    sma = data['Close'].rolling(window=SMA_WINDOW).mean().to_numpy()
+    data['sma_90'] = sma
+
+    rows = sessions.orb_bar[sessions.orb_bar >= 0]
+    values = orb_bar_features(data['Open'].to_numpy(dtype=float)[rows], data['High'].to_numpy(dtype=float)[rows],
+                              data['Low'].to_numpy(dtype=float)[rows], close[rows],
+                              data['Volume'].to_numpy(dtype=float)[rows], close[rows - 1], sma[rows], sma[rows - 1],
+                              data['y_Open'].to_numpy()[rows], data['y_High'].to_numpy()[rows],
+                              data['y_Low'].to_numpy()[rows], data['y_Close'].to_numpy()[rows])
+    for column in ORB_COLUMNS:
+        column_values = np.full(sessions.size, np.nan)
+        column_values[rows] = values[column]
+        data[column] = column_values
+    return data
+
+
+def add_anchored_vwap(data, sessions):
+    '''
+    anchored_vwap: volume weighted (O+H+L+C)/4 accumulated over each session. The notebook anchors every session to
+    the previous session's opening range bar but only merges that anchor onto the current session's bars, so the sum
+    restarts each session, and sessions whose previous session has no opening range bar get no value.
+    '''
+    typical_price = ((data['Open'] + data['High'] + data['Low'] + data['Close']) / 4).to_numpy(dtype=float)
+    volume = data['Volume'].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vwap = sessions.cumsum(typical_price * volume) / sessions.cumsum(volume)
+    anchored = sessions.gather(sessions.prior >= 0) > 0
+    anchored[anchored] = sessions.orb_bar[sessions.prior[sessions.session_id[anchored]]] >= 0
+    data['anchored_vwap'] = np.where(anchored, vwap, np.nan)
+    data['avwap_2day'] = np.round(((data['Close'].to_numpy(dtype=float) - data['anchored_vwap'].to_numpy())
+                                   / data['Open'].to_numpy(dtype=float)) * 100, 4)
+    return data, anchored
+
+
+def add_volume_norm(data, sessions):
+    '''Opening range volume over the rolling average of the last 20 opening range bars, on every bar of the session'''
+    has_orb = sessions.orb_bar >= 0
+    orb_volume = data['Volume'].to_numpy(dtype=float)[sessions.orb_bar[has_orb]]
+    average = np.full(sessions.sessions, np.nan)
+    average[has_orb] = pd.Series(orb_volume).rolling(window=VOLUME_WINDOW).mean().to_numpy()
+    data['average_vol'] = sessions.gather(average)
+    data['volume_norm'] = data['volume_5min'] / data['average_vol']
+    return data
+
+
+def build_features(data, orb_time=ORB_TIME, drop_unanchored=True):
+    '''
+    Add every Notebook 1 feature column to data in place. With drop_unanchored the sessions anchored_vwap would have
+    dropped (the first session and any whose previous session has no opening range bar) are removed as well, which
+    is the only copy the pipeline makes.
+    '''
+    sessions = SessionIndex(data.index, orb_time)
+    add_yesterday_ohlc(data, sessions)
+    add_orb_features(data, sessions)
+    for column in YESTERDAY_COLUMNS + ORB_COLUMNS:
+        data[column] = _ffill(data[column].to_numpy(dtype=float))
+    add_volume_norm(data, sessions)
+    data, anchored = add_anchored_vwap(data, sessions)
+    if drop_unanchored:
+        data = data[anchored]
+    return data
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                            #Reference Functions and Parity Check
+#-------------------------------------------------------------------------------------------------------------------------------
+
+def reference_features(data):
+    '''The three Notebook 1 functions back to back (inside_day, find_conditions, anchored_vwap), for check_parity'''
+    data = data.copy()
+    data.reset_index(inplace=True)
+    data['timestamp'] = pd.to_datetime(data['Date'])
+    data['date'] = data['timestamp'].dt.date
+    data.set_index('timestamp', inplace=True)
+    daily_data = data.resample('D').agg({'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'})
+    daily_data['date'] = daily_data.index.date
+    unique_days = sorted(daily_data['date'].unique())
+    day_map = {today: yesterday for today, yesterday in zip(unique_days[1:], unique_days[:-1])}
+    daily_data['yesterday'] = daily_data['date'].map(day_map)
+    yesterday_ohlc = daily_data[['date', 'Open', 'High', 'Low', 'Close']].copy()
+    yesterday_ohlc.columns = ['yesterday', 'y_Open', 'y_High', 'y_Low', 'y_Close']
+    daily_data = daily_data.merge(yesterday_ohlc, on='yesterday', how='left')
+    data = data.reset_index()
+    data['date'] = data['timestamp'].dt.date
+    data = data.merge(daily_data[['date', 'y_Open', 'y_High', 'y_Low', 'y_Close']], on='date', how='left')
+    data.set_index('timestamp', inplace=True)
+
+    data['sma_90'] = data['Close'].rolling(window=90).mean()
+    orb_time = pd.to_datetime(ORB_TIME).time()
+    for idx in range(1, len(data)):
+        if data.iloc[idx]['Time'] == orb_time:
+            row, previous = data.iloc[idx], data.iloc[idx - 1]
+            at = data.index[idx]
+            data.loc[at, 'long_entry'] = row['High']
+            data.loc[at, 'short_entry'] = row['Low']
+            data.loc[at, 'volume_5min'] = row['Volume']
+            data.loc[at, 'barsize_5min'] = row['High'] - row['Low']
+            data.loc[at, 'barsize_5min_norm'] = float(round(((row['High'] - row['Low']) / row['Open']) * 100, 2))
+            data.loc[at, 'gap'] = float(round(((row['Open'] - previous['Close']) / previous['Close']) * 100, 2))
+            if row['Open'] > row['Close']:
+                data.loc[at, 'bottoming_tail'] = float(round(((row['Close'] - row['Low']) / row['Open']) * 100, 4))
+                data.loc[at, 'topping_tail'] = float(round(((row['High'] - row['Open']) / row['Open']) * 100, 4))
+            elif row['Open'] < row['Close']:
+                data.loc[at, 'bottoming_tail'] = float(round(((row['Open'] - row['Low']) / row['Open']) * 100, 4))
+                data.loc[at, 'topping_tail'] = float(round(((row['High'] - row['Close']) / row['Open']) * 100, 4))
+            data.loc[at, 'sma_90_norm'] = float(round(row['Open'] / row['sma_90'], 4))
+            num = row['sma_90'] - previous['sma_90']
+            denom = row['sma_90']
+            if pd.notna(num) and pd.notna(denom) and denom != 0:
+                data.loc[at, 'sma_90_slope'] = round((num / denom) * 100, 4)
+            else:
+                data.loc[at, 'sma_90_slope'] = None
+            if (row['Open'] > row['y_Low']) and (row['Open'] < row['y_High']):
+                data.loc[at, 'inside_wicks'] = 1
+            else:
+                data.loc[at, 'inside_wicks'] = 0
+            if row['y_Open'] > row['y_Close']:
+                if (row['Open'] > row['y_Close']) and (row['Open'] < row['y_Open']):
+                    data.loc[at, 'inside_body'] = 1
+                else:
+                    data.loc[at, 'inside_body'] = 0
+            if row['y_Open'] < row['y_Close']:
+                if (row['Open'] < row['y_Close']) and (row['Open'] > row['y_Open']):
+                    data.loc[at, 'inside_body'] = 1
+                else:
+                    data.loc[at, 'inside_body'] = 0
+    data = data.ffill().infer_objects(copy=False)
+
+    data.reset_index(inplace=True)
+    data['typical_price'] = (data['Open'] + data['High'] + data['Low'] + data['Close']) / 4
+    data['yyyymmdd'] = pd.to_datetime(data['Date']).dt.date
+    data['Time'] = pd.to_datetime(data['Date']).dt.time
+    unique_days = sorted(data['yyyymmdd'].unique())
+    day_map = {today: yesterday for today, yesterday in zip(unique_days[1:], unique_days[:-1])}
+    data['anchor_date'] = data['yyyymmdd'].map(day_map)
+    anchor_times = data[data['Time'] == orb_time]
+    anchor_times = anchor_times[['yyyymmdd']].copy()
+    anchor_times['anchor_ts'] = pd.to_datetime(anchor_times['yyyymmdd'].astype(str) + ' 07:30:00')
+    anchor_times.columns = ['anchor_date', 'anchor_ts']
+    data = data.merge(anchor_times, on='anchor_date', how='left')
+    data = data[~data['anchor_ts'].isna()].copy()
+    data['Date'] = pd.to_datetime(data['Date'])
+    data = data[data['Date'] >= data['anchor_ts']]
+    data['pv'] = data['typical_price'] * data['Volume']
+    data['cum_pv'] = data.groupby('anchor_ts')['pv'].cumsum()
+    data['cum_vol'] = data.groupby('anchor_ts')['Volume'].cumsum()
+    data['anchored_vwap'] = data['cum_pv'] / data['cum_vol']
+    data['avwap_2day'] = (((data['Close'] - data['anchored_vwap']) / data['Open']) * 100).round(4)
+    data.set_index('Date', inplace=True)
+    return data
+
+
+def check_parity(data, orb_time=ORB_TIME):
+    '''
+    Run the notebook functions and build_features on copies of the same frame, raise AssertionError on the first
+    column that differs and return the (notebook seconds, pipeline seconds) each took.
+    '''
+    started = time.perf_counter()
+    expected = reference_features(data)
+    reference_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    actual = build_features(data.copy(), orb_time)
+    pipeline_seconds = time.perf_counter() - started
+
+    assert expected.index.equals(actual.index), f"Rows differ: {len(expected)} vs {len(actual)}"
+    columns = ['sma_90', 'anchored_vwap', 'avwap_2day'] + YESTERDAY_COLUMNS + ORB_COLUMNS
+    for column in [column for column in columns if column in expected.columns]:
+        left = expected[column].to_numpy(dtype=float)
+        right = actual[column].to_numpy(dtype=float)
+        same = (left == right) | (np.isnan(left) & np.isnan(right))
+        assert np.all(same), f"Column {column} differs at rows {np.flatnonzero(~same)[:10]}"
+    print(f"Parity confirmed on {len(data)} bars: notebook {reference_seconds:.2f}s, "
+          f"pipeline {pipeline_seconds:.3f}s ({reference_seconds / pipeline_seconds:.0f}x)")
+    return reference_seconds, pipeline_seconds
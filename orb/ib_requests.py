@@ -0,0 +1,126 @@
+'''
+Awaitable request/response layer for IBKR.
+
+IBKR answers every request asynchronously: rows stream into callbacks (historicalData, position, openOrder, execDetails)
+and a matching *End callback tells us the answer is complete. The bot used to guess how long that takes with fixed
+sleeps. Here every request gets a PendingRequest keyed by its reqId (or by name for the requests IBKR doesn't give a
+reqId to) that the callbacks fill and resolve, so callers wait exactly as long as IBKR takes and no longer.
+'''
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                            #IMPORT LIBRARIES AND DEPENDENCIES
+#-------------------------------------------------------------------------------------------------------------------------------
+
+import threading
+import time
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Request Keys
+#-------------------------------------------------------------------------------------------------------------------------------
+
+#Requests that IBKR doesn't assign a reqId to are keyed by name
+POSITIONS = 'positions'
+OPEN_ORDERS = 'open_orders'
+NEXT_VALID_ID = 'next_valid_id'
+
+#error() reports order rejections against the order ID, in the same integer space as our reqIds, so ours start far
+#above any order ID the account will reach (both are 32 bit on the IBKR side)
+FIRST_REQ_ID = 1_000_000_000
+
+#Errors IBKR sends against a reqId that are only informational and shouldn't fail the request
+INFORMATIONAL_ERRORS = (2104, 2106, 2107, 2108, 2158, 2174, 2176)
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Pending Request
+#-------------------------------------------------------------------------------------------------------------------------------
+
+class PendingRequest:
+    '''One outstanding request, completed by an IBKR callback through a threading.Event'''
+
+    def __init__(self, key, description):
+        self.key = key
+        self.description = description
+        self.rows = []
+        self.value = None
+        self.error = None
+        self.started = time.perf_counter()
+        self.elapsed = None
+        self._done = threading.Event()
+
+    def add(self, row):
+        self.rows.append(row)
+
+    def resolve(self, value=None):
+        self.value = value
+        self.elapsed = time.perf_counter() - self.started
+        self._done.set()
+
+    def fail(self, code, message):
+        self.error = (code, message)
+        self.elapsed = time.perf_counter() - self.started
+        self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        '''Block until IBKR completes the request, then return the rows (or the value for single answer requests)'''
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"{self.description} (request {self.key}) got no answer from IBKR in {timeout} second(s)")
+        if self.error is not None:
+            raise RuntimeError(f"{self.description} (request {self.key}) failed with IBKR error {self.error[0]}: {self.error[1]}")
+        return self.value if self.value is not None else self.rows
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Request Registry
+#-------------------------------------------------------------------------------------------------------------------------------
+
+class RequestRegistry:
+    '''Hands out reqIds and routes callback rows to the request they belong to'''
+
+    def __init__(self, first_req_id=FIRST_REQ_ID):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._allocated = set()
+        self._next_req_id = first_req_id
+
+    def new_req_id(self):
+        with self._lock:
+            req_id = self._next_req_id
+            self._next_req_id += 1
+            self._allocated.add(req_id)
+            return req_id
+
+    def open(self, key, description):
+        pending = PendingRequest(key, description)
+        with self._lock:
+            self._pending[key] = pending
+        return pending
+
+    def get(self, key):
+        with self._lock:
+            return self._pending.get(key)
+
+    def add(self, key, row):
+        pending = self.get(key)
+        if pending is not None:
+            pending.add(row)
+
+    def resolve(self, key, value=None):
+        with self._lock:
+            pending = self._pending.pop(key, None)
+        if pending is not None:
+            pending.resolve(value)
+
+    def fail(self, key, code, message):
+        '''Fail a pending request, only named ones or reqIds we handed out (anything else is e.g. an order ID)'''
+        if code in INFORMATIONAL_ERRORS:
+            return
+        with self._lock:
+            if isinstance(key, int) and (key not in self._allocated):
+                return
+            pending = self._pending.pop(key, None)
+        if pending is not None:
+            pending.fail(code, message)
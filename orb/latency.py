@@ -0,0 +1,240 @@
+'''
+Hot-path latency instrumentation for the live bot.
+
+The engine used to tell us how long one thing took (the "Order Placed x ms after the triggering event" line) and
+nothing else. A LatencyRecorder times every stage with time.perf_counter() spans and keeps them in fixed-size
+log-scale histograms, so recording a span is a handful of integer operations and memory never grows with the session:
+
+- IBKR request round trips (the startup snapshots, each bar subscription)
+- bar updates written into the BarStore (the only timezone conversion left is in there)
+- rule evaluation per hook, the 07:35 feature row and ML gate scoring
+- order submission (the RiverRose placeOrder calls), order acknowledgement (placeOrder to IBKR's first openOrder or
+  orderStatus) and signal to order (the event that triggered the rule to the last placeOrder)
+
+report() gives count, p50, p90, p99 and max per stage, write_report() appends it to a CSV and to_sql() to a table in
+the performance database. profile_next() (or creating the trigger file the bot watches) runs cProfile around the next
+span of a stage, on whichever thread it happens, and saves the stats, no restart needed.
+
+    latency = LatencyRecorder()
+    with latency.span('rules'):
+        strategy.on_bar_closed()
+    print(latency.report())
+'''
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                            #IMPORT LIBRARIES AND DEPENDENCIES
+#-------------------------------------------------------------------------------------------------------------------------------
+
+import cProfile
+import datetime as dt
+import io
+import math
+import os
+import pstats
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Constants
+#-------------------------------------------------------------------------------------------------------------------------------
+
+#Buckets cover 100 ns to 100 s, 20 per decade keeps a percentile within ~6% of the true value
+SMALLEST_SECONDS = 1e-7
+DECADES = 9
+BUCKETS_PER_DECADE = 20
+PERCENTILES = (50, 90, 99)
+PROFILE_DIRECTORY = 'profiles'
+PROFILE_LINES = 15
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Histogram
+#-------------------------------------------------------------------------------------------------------------------------------
+
+class LatencyHistogram:
+    '''Counts of durations in log-spaced buckets, plus the exact count, total, min and max'''
+
+    __slots__ = ('counts', 'count', 'total', 'minimum', 'maximum')
+
+    def __init__(self):
+        #One underflow bucket at the front and one overflow bucket at the end
+        self.counts = np.zeros(DECADES * BUCKETS_PER_DECADE + 2, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = math.inf
+        self.maximum = 0.0
+
+    def record(self, seconds):
+        if seconds < SMALLEST_SECONDS:
+            bucket = 0
+        else:
+            bucket = min(int(math.log10(seconds / SMALLEST_SECONDS) * BUCKETS_PER_DECADE) + 1, len(self.counts) - 1)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        self.minimum = min(self.minimum, seconds)
+        self.maximum = max(self.maximum, seconds)
+
+    def percentile(self, q):
+        '''Approximate q-th percentile in seconds (the geometric middle of the bucket it falls in)'''
+        if self.count == 0:
+            return math.nan
+        bucket = int(np.searchsorted(np.cumsum(self.counts), math.ceil(self.count * q / 100)))
+        if bucket == 0:
+            return self.minimum
+        if bucket == len(self.counts) - 1:
+            return self.maximum
+        middle = SMALLEST_SECONDS * 10 ** ((bucket - 0.5) / BUCKETS_PER_DECADE)
+        return min(max(middle, self.minimum), self.maximum)
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Recorder
+#-------------------------------------------------------------------------------------------------------------------------------
+
+class Span:
+    '''Context manager returned by LatencyRecorder.span'''
+
+    __slots__ = ('recorder', 'stage', 'started', 'profiler')
+
+    def __init__(self, recorder, stage):
+        self.recorder = recorder
+        self.stage = stage
+        self.profiler = None
+
+    def __enter__(self):
+        self.profiler = self.recorder._start_profile(self.stage)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        if self.profiler is not None:
+            self.recorder._finish_profile(self.stage, self.profiler)
+        self.recorder.record(self.stage, elapsed)
+        return False
+
+
+class LatencyRecorder:
+    '''One histogram per stage, safe to record into from the connection thread and the main thread at once'''
+
+    def __init__(self, enabled=True, profile_directory=PROFILE_DIRECTORY):
+        self.enabled = enabled
+        self.profile_directory = profile_directory
+        self.histograms = {}
+        self.started = dt.datetime.now()
+        self._lock = threading.Lock()
+        #stage (or None for any stage) -> how many more spans to profile
+        self._profile_requests = {}
+
+    def record(self, stage, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def span(self, stage):
+        return Span(self, stage)
+
+    def since(self, stage, started):
+        '''Record the time from a perf_counter() reading taken earlier (e.g. when the triggering event arrived)'''
+        self.record(stage, time.perf_counter() - started)
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.started = dt.datetime.now()
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                    #Reports
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def report(self):
+        '''count, p50/p90/p99, mean and max per stage in milliseconds, slowest p99 first'''
+        with self._lock:
+            rows = [{'stage': stage, 'count': histogram.count,
+                     **{f"p{q}_ms": histogram.percentile(q) * 1000 for q in PERCENTILES},
+                     'mean_ms': histogram.total / histogram.count * 1000, 'max_ms': histogram.maximum * 1000,
+                     'total_ms': histogram.total * 1000}
+                    for stage, histogram in self.histograms.items()]
+        if not rows:
+            return pd.DataFrame(columns=['count'] + [f"p{q}_ms" for q in PERCENTILES] + ['mean_ms', 'max_ms',
+                                                                                         'total_ms'])
+        return pd.DataFrame(rows).set_index('stage').sort_values('p99_ms', ascending=False).round(4)
+
+    def _session_report(self, session_date=None, **labels):
+        table = self.report().reset_index()
+        table.insert(0, 'session_date', session_date or self.started.date())
+        for position, (name, value) in enumerate(labels.items(), start=1):
+            table.insert(position, name, value)
+        return table
+
+    def write_report(self, path, session_date=None, **labels):
+        '''
+        Append this session's report to a CSV. Labels (e.g. algo_version='0.3.8') become extra columns, so pass the
+        same ones every session.
+        '''
+        table = self._session_report(session_date, **labels)
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        table.to_csv(path, mode='a', header=not os.path.exists(path), index=False)
+        print(f"Latency report for {len(table)} stage(s) written to {path}")
+        return table
+
+    def to_sql(self, engine, table='latency', session_date=None, **labels):
+        '''Append this session's report to a table in the database (pandas creates it the first time)'''
+        report = self._session_report(session_date, **labels)
+        report.to_sql(table, engine, if_exists='append', index=False)
+        print(f"Latency report for {len(report)} stage(s) written to the {table} table")
+        return report
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                    #Profiling
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def profile_next(self, stage=None, spans=1):
+        '''Run cProfile around the next span(s) of a stage (any stage when None)'''
+        with self._lock:
+            self._profile_requests[stage] = self._profile_requests.get(stage, 0) + spans
+        print(f"Profiling the next {spans} {stage or 'span'}(s)")
+
+    def check_trigger(self, path, stage=None):
+        '''Profile the next span if the trigger file exists (then remove it), so profiling needs no restart'''
+        if os.path.exists(path):
+            os.remove(path)
+            self.profile_next(stage)
+
+    def _start_profile(self, stage):
+        if not self._profile_requests:
+            return None
+        with self._lock:
+            key = stage if self._profile_requests.get(stage) else None
+            if not self._profile_requests.get(key):
+                return None
+            self._profile_requests[key] -= 1
+            if self._profile_requests[key] == 0:
+                del self._profile_requests[key]
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            #Another profiler is already running on this thread
+            return None
+        return profiler
+
+    def _finish_profile(self, stage, profiler):
+        profiler.disable()
+        os.makedirs(self.profile_directory, exist_ok=True)
+        path = os.path.join(self.profile_directory,
+                            f"{stage.replace(' ', '_').replace(':', '')}_{dt.datetime.now():%Y%m%d_%H%M%S_%f}.prof")
+        profiler.dump_stats(path)
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_LINES)
+        print(f"Profile of {stage} saved to {path}\n{output.getvalue()}")
@@ -0,0 +1,272 @@
+'''
+Typed execution ledger with incremental trade pairing.
+
+The polling bot turned every execution into a string, pulled AvgPrice and ClientId back out with regexes each cycle
+and only understood exactly one or two executions, so partial fills and re-entry legs fell through. The engine then
+kept (clientId, time, avgPrice) tuples and still counted to two. The FillLedger takes execDetails and
+commissionReport straight from the callbacks:
+
+- one Fill per execId (__slots__, no dataframes): client id, side, quantity, price, time and commission. IBKR resends
+  executions with the snapshot, those are ignored, and a correction (same execId up to the last '.') replaces the
+  fill it corrects
+- every new fill from our client id is paired the moment it arrives: it adds to the open trade, reduces it, or closes
+  it (and a reversal opens the next trade with what is left), so partial fills and re-entries are just more fills
+- each Trade knows its direction, its number in the session (1 = first trade, 2 = re-entry), weighted entry and exit
+  prices, commission and gross profit. Trades that close while recording is on go to on_trade once every fill has
+  its commission (PerformanceDB.record_trade in the bot)
+'''
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                            #IMPORT LIBRARIES AND DEPENDENCIES
+#-------------------------------------------------------------------------------------------------------------------------------
+
+import datetime as dt
+from zoneinfo import ZoneInfo
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Constants
+#-------------------------------------------------------------------------------------------------------------------------------
+
+SIDES = {'BOT': 1, 'SLD': -1}
+DIRECTIONS = {1: 'LONG', -1: 'SHORT'}
+UTC = ZoneInfo('UTC')
+
+
+def parse_execution_time(text):
+    '''IBKR sends "20250115 07:35:02 US/Mountain", or "20250115-14:35:02" in UTC depending on the API settings'''
+    text = text.strip()
+    if '-' in text[:9]:
+        return dt.datetime.strptime(text, '%Y%m%d-%H:%M:%S').replace(tzinfo=UTC)
+    parts = text.split(' ')
+    moment = dt.datetime.strptime(' '.join(parts[:2]), '%Y%m%d %H:%M:%S')
+    return moment.replace(tzinfo=ZoneInfo(parts[2])) if len(parts) > 2 else moment
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                #Fills and Trades
+#-------------------------------------------------------------------------------------------------------------------------------
+
+class Fill:
+    __slots__ = ('exec_id', 'order_id', 'perm_id', 'client_id', 'symbol', 'side', 'quantity', 'price', 'time',
+                 'commission')
+
+    def __init__(self, exec_id, order_id, perm_id, client_id, symbol, side, quantity, price, time, commission=None):
+        self.exec_id = exec_id
+        self.order_id = order_id
+        self.perm_id = perm_id
+        self.client_id = client_id
+        self.symbol = symbol
+        self.side = side
+        self.quantity = quantity
+        self.price = price
+        self.time = time
+        self.commission = commission
+
+    @classmethod
+    def from_execution(cls, contract, execution):
+        return cls(execution.execId, execution.orderId, execution.permId, execution.clientId, contract.symbol,
+                   execution.side, float(execution.shares), float(execution.price),
+                   parse_execution_time(execution.time))
+
+    def __repr__(self):
+        return f"Fill({self.exec_id} {self.side} {self.quantity:g} {self.symbol} @ {self.price} {self.time})"
+
+
+class Trade:
+    '''One round trip, built up from (fill, quantity) legs so a fill can be split across a reversal'''
+
+    __slots__ = ('symbol', 'sign', 'number', 'quantity', 'entry_value', 'exit_quantity', 'exit_value', 'entry_time',
+                 'exit_time', 'legs')
+
+    def __init__(self, symbol, sign, number, time):
+        self.symbol = symbol
+        self.sign = sign
+        self.number = number
+        self.quantity = 0.0
+        self.entry_value = 0.0
+        self.exit_quantity = 0.0
+        self.exit_value = 0.0
+        self.entry_time = time
+        self.exit_time = None
+        self.legs = []
+
+    @property
+    def direction(self):
+        return DIRECTIONS[self.sign]
+
+    @property
+    def open_quantity(self):
+        return self.quantity - self.exit_quantity
+
+    @property
+    def closed(self):
+        return self.quantity > 0 and self.open_quantity == 0
+
+    @property
+    def entry_price(self):
+        return self.entry_value / self.quantity
+
+    @property
+    def exit_price(self):
+        return self.exit_value / self.exit_quantity if self.exit_quantity else None
+
+    @property
+    def commission(self):
+        '''Commission of every leg (split pro rata for a reversal fill), None until IBKR has reported all of them'''
+        if any(fill.commission is None for fill, _ in self.legs):
+            return None
+        return sum(fill.commission * quantity / fill.quantity for fill, quantity in self.legs)
+
+    def gross_profit(self, multiplier):
+        return (self.exit_value - self.exit_quantity * self.entry_price) * self.sign * multiplier
+
+    def add_entry(self, fill, quantity):
+        self.quantity += quantity
+        self.entry_value += fill.price * quantity
+        self.legs.append((fill, quantity))
+
+    def add_exit(self, fill, quantity):
+        self.exit_quantity += quantity
+        self.exit_value += fill.price * quantity
+        self.exit_time = fill.time
+        self.legs.append((fill, quantity))
+
+    def __repr__(self):
+        state = f"closed @ {self.exit_price:.2f}" if self.closed else f"open {self.open_quantity:g}"
+        return f"Trade({self.symbol} #{self.number} {self.direction} {self.quantity:g} @ {self.entry_price:.2f}, " \
+               f"{state})"
+
+
+def _trade_key(trade):
+    '''The execIds of a trade's fills without their correction suffix, the same before and after a correction'''
+    return frozenset(fill.exec_id.rsplit('.', 1)[0] for fill, _ in trade.legs)
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Ledger
+#-------------------------------------------------------------------------------------------------------------------------------
+
+class FillLedger:
+    '''
+    Fills of one symbol keyed by execId. Only fills from client_id (every client when None) are paired into trades.
+    multiplier is the contract's point value (orb.contracts.point_value), replaced by the execution contract's when
+    IBKR reports it. It stays None when neither gives one, gross profit can't be worked out in dollars then.
+    '''
+
+    def __init__(self, client_id=None, multiplier=None, on_trade=None):
+        self.client_id = client_id
+        self.multiplier = multiplier
+        self.on_trade = on_trade
+        #Trades closing before this is switched on (the startup snapshot) were already handled by an earlier run
+        self.recording = False
+        self.fills = {}
+        self.trades = []
+        self.position = 0.0
+        self._corrections = {}
+        #Keys of closed trades that went to on_trade (or closed before recording), so a re-pair never reports twice
+        self._settled = set()
+        self._unreported = []
+
+    def add_execution(self, contract, execution):
+        '''Add an execDetails callback, returns the new Fill or None when we already had it'''
+        if execution.execId in self.fills:
+            return None
+        if getattr(contract, 'multiplier', ''):
+            self.multiplier = float(contract.multiplier)
+        fill = Fill.from_execution(contract, execution)
+        base = fill.exec_id.rsplit('.', 1)[0]
+        corrected = self._corrections.get(base)
+        self._corrections[base] = fill.exec_id
+        self.fills[fill.exec_id] = fill
+        if corrected is not None:
+            del self.fills[corrected]
+            print(f"{fill.symbol}: execution {corrected} corrected by {fill.exec_id}, re-pairing trades")
+            self._repair()
+        elif (self.client_id is None) or (fill.client_id == self.client_id):
+            self._pair(fill)
+        self._report()
+        return fill
+
+    def add_commission(self, exec_id, commission):
+        '''
+        Add a commissionReport, True when it belongs to one of our fills. IBKR usually sends it after the execution,
+        one that arrives first is held by the caller (ORBEngine) until the execution shows up.
+        '''
+        fill = self.fills.get(exec_id)
+        if fill is None:
+            return False
+        #IBKR uses the largest double for "not known yet"
+        if commission <= 1e300:
+            fill.commission = commission
+            self._report()
+        return True
+
+    def superseded(self, exec_id):
+        '''True when a correction has already replaced this execution'''
+        latest = self._corrections.get(exec_id.rsplit('.', 1)[0])
+        return (latest is not None) and (latest != exec_id)
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                    #Pairing
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    @property
+    def open_trade(self):
+        if self.trades and not self.trades[-1].closed:
+            return self.trades[-1]
+        return None
+
+    def session_trades(self, date):
+        '''Trades that were entered on a date (in the fill's own timezone)'''
+        return [trade for trade in self.trades if trade.entry_time.date() == date]
+
+    def _pair(self, fill, report=True):
+        sign = SIDES[fill.side]
+        remaining = fill.quantity
+        while remaining > 0:
+            trade = self.open_trade
+            if trade is None:
+                number = len(self.session_trades(fill.time.date())) + 1
+                trade = Trade(fill.symbol, sign, number, fill.time)
+                self.trades.append(trade)
+            if trade.sign == sign:
+                trade.add_entry(fill, remaining)
+                self.position += sign * remaining
+                remaining = 0
+            else:
+                used = min(remaining, trade.open_quantity)
+                trade.add_exit(fill, used)
+                self.position += sign * used
+                remaining -= used
+                if trade.closed and report:
+                    if self.recording:
+                        self._unreported.append(trade)
+                    else:
+                        self._settled.add(_trade_key(trade))
+
+    def _repair(self):
+        '''
+        Pair every fill again from the start (only after an execution correction). Trades already reported are not
+        reported again, closed ones that weren't replace the pre-correction trades waiting for their commissions.
+        '''
+        self.trades = []
+        self.position = 0.0
+        for fill in sorted(self.fills.values(), key=lambda fill: fill.time):
+            if (self.client_id is None) or (fill.client_id == self.client_id):
+                self._pair(fill, report=False)
+        closed = [trade for trade in self.trades if trade.closed]
+        if not self.recording:
+            self._settled.update(_trade_key(trade) for trade in closed)
+        self._unreported = [trade for trade in closed if _trade_key(trade) not in self._settled]
+
+    def _report(self):
+        if not self._unreported or self.on_trade is None:
+            return
+        waiting = []
+        for trade in self._unreported:
+            if trade.commission is None:
+                waiting.append(trade)
+            else:
+                self._settled.add(_trade_key(trade))
+                self.on_trade(trade)
+        self._unreported = waiting
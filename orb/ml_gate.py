@@ -0,0 +1,382 @@
+'''
+Low-latency ML gate for the 07:35 breakout.
+
+Notebook 2 picks a classifier for "does the first trade of the day win", but nothing in the bot used it. The gate
+closes that loop without putting sklearn (or its input validation) inside the trading window:
+
+- export_model() runs in Notebook 2 once a model is chosen. It reduces the fitted model and its scaler to plain NumPy
+  arrays (a CompiledModel): coefficients for linear models, layer weights for the MLPs, support vectors for the
+  SVCs and one flattened node table for decision trees, random forests, extra trees and gradient boosting. Anything
+  else is kept as the fitted estimator and scored through sklearn. The compiled model is checked against
+  predict_proba before it is pickled.
+- MLGate loads that file when the bot starts (before the START_TIME wait), warms it up once and then at 07:35 turns
+  the feature store's live row into the training column order (transaction, features, day dummies) and scores the
+  long and the short row together, well under a millisecond for every compiled model. A buy-only or sell-only model
+  (exported with side='buy' or 'sell') scores and gates just that side.
+- ORBStrategy.check_orb only brackets the sides whose probability clears the threshold: both sides keep the usual OCA
+  bracket, one side gets a single bracket and neither side means no trade today.
+
+Usage in Notebook 2 (X_train / X_test before scaling, scaler fitted on X_train[scaler_list]):
+
+    import orb.ml_gate as orbg
+    orbg.export_model(best_model, 'mnq_orb_model.pkl', X_train.columns, scaler=scaler, scaler_columns=scaler_list,
+                      threshold=0.5, check_X=X_test, side=buy_sell_side)
+'''
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                            #IMPORT LIBRARIES AND DEPENDENCIES
+#-------------------------------------------------------------------------------------------------------------------------------
+
+import datetime as dt
+import pickle
+import time
+
+import numpy as np
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Constants
+#-------------------------------------------------------------------------------------------------------------------------------
+
+#Notebook 2 encodes the trade direction this way (FeatureStore.training_rows does the same)
+TRANSACTIONS = {'LONG': 1.0, 'SHORT': 0.0}
+#Notebook 2's buy_sell_side, a buy-only or sell-only model has no transaction column and scores just its own side
+SIDES = {'buy': 'LONG', 'long': 'LONG', 'sell': 'SHORT', 'short': 'SHORT'}
+DAY_PREFIX = 'day_'
+
+ACTIVATIONS = {'identity': lambda z: z,
+               'relu': lambda z: np.maximum(z, 0),
+               'tanh': np.tanh,
+               'logistic': lambda z: 1 / (1 + np.exp(-z))}
+
+
+def _sigmoid(z):
+    return 1 / (1 + np.exp(-z))
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Scorers
+#-------------------------------------------------------------------------------------------------------------------------------
+
+class LinearScorer:
+    '''Logistic link over one dot product (LogisticRegression, LinearDiscriminantAnalysis)'''
+
+    def __init__(self, coef, intercept):
+        self.coef = np.ascontiguousarray(coef, dtype=float)
+        self.intercept = float(intercept)
+
+    def probability(self, X):
+        return _sigmoid(X @ self.coef + self.intercept)
+
+
+class MLPScorer:
+    '''Forward pass of an MLPClassifier with a logistic output unit'''
+
+    def __init__(self, weights, biases, activation):
+        self.weights = [np.ascontiguousarray(w, dtype=float) for w in weights]
+        self.biases = [np.ascontiguousarray(b, dtype=float) for b in biases]
+        self.activation = activation
+
+    def probability(self, X):
+        hidden = ACTIVATIONS[self.activation]
+        for weight, bias in zip(self.weights[:-1], self.biases[:-1]):
+            X = hidden(X @ weight + bias)
+        return _sigmoid(X @ self.weights[-1] + self.biases[-1])[:, 0]
+
+
+class KernelSVCScorer:
+    '''SVC decision function from its support vectors, through a sigmoid so 0.5 is still its decision boundary'''
+
+    def __init__(self, support_vectors, dual_coef, intercept, kernel, gamma, coef0, degree):
+        self.support_vectors = np.ascontiguousarray(support_vectors, dtype=float)
+        self.dual_coef = np.ascontiguousarray(dual_coef, dtype=float)
+        self.intercept = float(intercept)
+        self.kernel = kernel
+        self.gamma = float(gamma)
+        self.coef0 = float(coef0)
+        self.degree = degree
+
+    def probability(self, X):
+        if self.kernel == 'rbf':
+            distance = (X ** 2).sum(axis=1)[:, None] - 2 * X @ self.support_vectors.T + \
+                (self.support_vectors ** 2).sum(axis=1)
+            kernel = np.exp(-self.gamma * distance)
+        else:
+            kernel = X @ self.support_vectors.T
+            if self.kernel == 'poly':
+                kernel = (self.gamma * kernel + self.coef0) ** self.degree
+            elif self.kernel == 'sigmoid':
+                kernel = np.tanh(self.gamma * kernel + self.coef0)
+        return _sigmoid(kernel @ self.dual_coef + self.intercept)
+
+
+class TreeScorer:
+    '''
+    Every tree of an ensemble in one flat node table. Leaves point at themselves, so all trees are walked together,
+    one level per step, for as many steps as the deepest tree. combine='mean' averages leaf probabilities (forests),
+    combine='boost' adds learning_rate x leaf values to init and applies the logistic link (gradient boosting).
+    '''
+
+    def __init__(self, feature, threshold, left, right, value, roots, depth, combine='mean', learning_rate=1.0,
+                 init=0.0):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        self.combine = combine
+        self.learning_rate = learning_rate
+        self.init = init
+
+    @classmethod
+    def from_trees(cls, trees, leaf_values, **kwargs):
+        '''trees: fitted sklearn tree_ objects, leaf_values: function(tree_) returning one value per node'''
+        feature, threshold, left, right, value, roots = [], [], [], [], [], []
+        offset = 0
+        depth = 0
+        for tree in trees:
+            nodes = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+            roots.append(offset)
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+            left.append(np.where(is_leaf, nodes, tree.children_left) + offset)
+            right.append(np.where(is_leaf, nodes, tree.children_right) + offset)
+            value.append(leaf_values(tree))
+            depth = max(depth, tree.max_depth)
+            offset += tree.node_count
+        return cls(np.concatenate(feature).astype(np.intp), np.concatenate(threshold).astype(float),
+                   np.concatenate(left).astype(np.intp), np.concatenate(right).astype(np.intp),
+                   np.concatenate(value).astype(float), np.array(roots, dtype=np.intp), depth, **kwargs)
+
+    def raw(self, X):
+        '''Leaf value of every tree for every row'''
+        #sklearn compares float32 inputs against float64 thresholds
+        X = X.astype(np.float32)
+        rows = np.arange(len(X))[:, None]
+        node = np.repeat(self.roots[None, :], len(X), axis=0)
+        for _ in range(self.depth):
+            node = np.where(X[rows, self.feature[node]] <= self.threshold[node], self.left[node], self.right[node])
+        return self.value[node]
+
+    def probability(self, X):
+        leaves = self.raw(X)
+        if self.combine == 'mean':
+            return leaves.mean(axis=1)
+        return _sigmoid(self.init + self.learning_rate * leaves.sum(axis=1))
+
+
+class EstimatorScorer:
+    '''Anything we can't compile: the fitted estimator itself (decision_function through a sigmoid when it has no
+    predict_proba, so 0.5 is still its decision boundary)'''
+
+    def __init__(self, estimator):
+        self.estimator = estimator
+
+    def probability(self, X):
+        if hasattr(self.estimator, 'predict_proba'):
+            return self.estimator.predict_proba(X)[:, 1]
+        return _sigmoid(self.estimator.decision_function(X))
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                #Compiling a Model
+#-------------------------------------------------------------------------------------------------------------------------------
+
+def _class_probability(tree):
+    value = tree.value[:, 0, :]
+    return value[:, 1] / value.sum(axis=1)
+
+
+def compile_scorer(model):
+    '''The fastest scorer we have for a fitted sklearn binary classifier'''
+    name = type(model).__name__
+    if name in ('LogisticRegression', 'LinearDiscriminantAnalysis'):
+        return LinearScorer(model.coef_[0], model.intercept_[0])
+    if name == 'MLPClassifier' and model.out_activation_ == 'logistic':
+        return MLPScorer(model.coefs_, model.intercepts_, model.activation)
+    if name == 'SVC' and not hasattr(model, 'predict_proba') and \
+            model.kernel in ('linear', 'poly', 'rbf', 'sigmoid'):
+        #_gamma is the value 'scale' / 'auto' resolved to during fit
+        return KernelSVCScorer(model.support_vectors_, model.dual_coef_[0], model.intercept_[0], model.kernel,
+                               model._gamma, model.coef0, model.degree)
+    if name == 'DecisionTreeClassifier':
+        return TreeScorer.from_trees([model.tree_], _class_probability)
+    if name in ('RandomForestClassifier', 'ExtraTreesClassifier'):
+        return TreeScorer.from_trees([tree.tree_ for tree in model.estimators_], _class_probability)
+    if name == 'GradientBoostingClassifier' and model.estimators_.shape[1] == 1:
+        scorer = TreeScorer.from_trees([tree.tree_ for tree in model.estimators_[:, 0]],
+                                       lambda tree: tree.value[:, 0, 0], combine='boost',
+                                       learning_rate=model.learning_rate)
+        #The starting raw score (log odds of the training prior) is whatever the trees don't account for
+        origin = np.zeros((1, model.n_features_in_))
+        scorer.init = float(model.decision_function(origin)[0] - model.learning_rate * scorer.raw(origin).sum())
+        return scorer
+    print(f"No compiled scorer for {name}, it will be scored through sklearn")
+    return EstimatorScorer(model)
+
+
+class CompiledModel:
+    '''A fitted classifier, its scaler and the training column order, scored one row at a time'''
+
+    def __init__(self, scorer, feature_columns, scaler_kind=None, scaled=None, scale=None, shift=None,
+                 threshold=0.5, name='', side=None):
+        self.scorer = scorer
+        self.feature_columns = list(feature_columns)
+        self.scaler_kind = scaler_kind
+        self.scaled = scaled
+        self.scale = scale
+        self.shift = shift
+        self.threshold = threshold
+        self.name = name
+        #'LONG' or 'SHORT' for a model trained on one side only, None when it scores both
+        self.side = side
+        self.exported = dt.datetime.now().isoformat(timespec='seconds')
+
+    def transform(self, X):
+        '''The scaler's transform, with the same operations so the scaled values are identical'''
+        if self.scaler_kind == 'minmax':
+            X[:, self.scaled] = X[:, self.scaled] * self.scale + self.shift
+        elif self.scaler_kind == 'standard':
+            X[:, self.scaled] = (X[:, self.scaled] - self.shift) / self.scale
+        return X
+
+    def probability(self, X):
+        '''Probability of a winning trade for unscaled rows in feature_columns order'''
+        return self.scorer.probability(self.transform(np.array(X, dtype=float, ndmin=2)))
+
+
+def model_side(feature_columns, side=None):
+    '''The side a model covers: None (both) when it has the transaction column, otherwise LONG or SHORT from side'''
+    if 'transaction' in feature_columns:
+        return None
+    side = SIDES.get(str(side).lower())
+    if side is None:
+        raise ValueError("A model without the transaction column only covers one side, pass side='buy' or 'sell' "
+                         "(Notebook 2's buy_sell_side)")
+    return side
+
+
+def compile_model(model, feature_columns, scaler=None, scaler_columns=None, threshold=0.5, side=None):
+    feature_columns = list(feature_columns)
+    side = model_side(feature_columns, side)
+    scaler_kind, scaled, scale, shift = None, None, None, None
+    if scaler is not None:
+        columns = feature_columns if scaler_columns is None else list(scaler_columns)
+        scaled = np.array([feature_columns.index(column) for column in columns], dtype=np.intp)
+        if type(scaler).__name__ == 'MinMaxScaler':
+            scaler_kind, scale, shift = 'minmax', scaler.scale_.astype(float), scaler.min_.astype(float)
+        elif type(scaler).__name__ == 'StandardScaler':
+            scaler_kind = 'standard'
+            scale = np.ones(len(columns)) if scaler.scale_ is None else scaler.scale_.astype(float)
+            shift = np.zeros(len(columns)) if scaler.mean_ is None else scaler.mean_.astype(float)
+        else:
+            raise ValueError(f"Unsupported scaler {type(scaler).__name__}, use MinMaxScaler or StandardScaler")
+    return CompiledModel(compile_scorer(model), feature_columns, scaler_kind, scaled, scale, shift, threshold,
+                         type(model).__name__, side)
+
+
+def check_compiled(compiled, model, X, scaler=None, scaler_columns=None, tolerance=1e-9):
+    '''Largest difference between the compiled probabilities and model.predict_proba on X (unscaled rows)'''
+    X = X[compiled.feature_columns].copy()
+    expected_X = X.copy()
+    if scaler is not None:
+        columns = compiled.feature_columns if scaler_columns is None else list(scaler_columns)
+        expected_X[columns] = scaler.transform(expected_X[columns])
+    if hasattr(model, 'predict_proba'):
+        expected = model.predict_proba(expected_X.to_numpy(dtype=float))[:, 1]
+    else:
+        expected = _sigmoid(model.decision_function(expected_X.to_numpy(dtype=float)))
+    actual = compiled.probability(X.to_numpy(dtype=float))
+    difference = np.abs(actual - expected).max()
+    if difference > tolerance:
+        raise ValueError(f"Compiled {compiled.name} differs from sklearn by {difference:.2e}")
+    return difference
+
+
+def export_model(model, path, feature_columns, scaler=None, scaler_columns=None, threshold=0.5, check_X=None,
+                 side=None):
+    '''
+    Compile a fitted model for the live gate, check it against sklearn on check_X and pickle it to path. A buy-only or
+    sell-only model (n = 5 in Notebook 2) needs side='buy' or 'sell' so the gate only scores that side.
+    '''
+    compiled = compile_model(model, feature_columns, scaler, scaler_columns, threshold, side)
+    if check_X is not None:
+        difference = check_compiled(compiled, model, check_X, scaler, scaler_columns)
+        print(f"Compiled {compiled.name} matches predict_proba on {len(check_X)} rows "
+              f"(max difference {difference:.1e})")
+    with open(path, 'wb') as f:
+        pickle.dump(compiled, f)
+    print(f"Saved {compiled.name} ({type(compiled.scorer).__name__}) for {compiled.side or 'both sides'} with "
+          f"threshold {threshold} to {path}")
+    return compiled
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Live Gate
+#-------------------------------------------------------------------------------------------------------------------------------
+
+class MLGate:
+    '''
+    Loaded once at startup. allow() takes the feature store's live row and returns whether the long and the short
+    bracket should go in. Without a usable row (no feature store context, or a feature the model never saw as NaN)
+    both sides are allowed, which is how the bot traded before the gate. A single-side model only gates its own side.
+    '''
+
+    def __init__(self, path, threshold=None):
+        start = time.perf_counter()
+        with open(path, 'rb') as f:
+            self.model = pickle.load(f)
+        self.threshold = self.model.threshold if threshold is None else threshold
+        columns = self.model.feature_columns
+        self.side = getattr(self.model, 'side', None)
+        if ('transaction' not in columns) and (self.side not in TRANSACTIONS):
+            raise ValueError(f"{path} has no transaction column and no side, re-export it with side='buy' or 'sell'")
+        self.sides = list(TRANSACTIONS) if self.side is None else [self.side]
+        self.transaction_slot = columns.index('transaction') if 'transaction' in columns else None
+        self.day_slots = {column[len(DAY_PREFIX):]: i for i, column in enumerate(columns)
+                          if column.startswith(DAY_PREFIX)}
+        self.feature_names = [column for column in columns
+                              if column != 'transaction' and not column.startswith(DAY_PREFIX)]
+        self.feature_slots = np.array([columns.index(column) for column in self.feature_names], dtype=np.intp)
+        self.last_seconds = None
+        #First call pays for any lazy imports and allocations, so do it now rather than at 07:35
+        self.scores({name: 0.0 for name in self.feature_names}, dt.date.today())
+        print(f"Loaded ML gate {self.model.name} (exported {self.model.exported}), threshold {self.threshold}, "
+              f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def rows(self, features, session_date):
+        '''The unscaled row for each side the model covers in the training column order, NaN for a missing feature'''
+        X = np.zeros((len(self.sides), len(self.model.feature_columns)))
+        X[:, self.feature_slots] = [features.get(name, np.nan) for name in self.feature_names]
+        if self.transaction_slot is not None:
+            X[:, self.transaction_slot] = [TRANSACTIONS[side] for side in self.sides]
+        day = self.day_slots.get(session_date.strftime('%A'))
+        if day is not None:
+            X[:, day] = 1.0
+        return X
+
+    def scores(self, features, session_date):
+        '''Probability of a win for each side the model covers (scored together), None when a feature is missing'''
+        start = time.perf_counter()
+        X = self.rows(features, session_date)
+        if np.isnan(X).any():
+            return None
+        probability = self.model.probability(X)
+        self.last_seconds = time.perf_counter() - start
+        return {side: float(p) for side, p in zip(self.sides, probability)}
+
+    def allow(self, features, session_date):
+        '''(long_ok, short_ok) for today's breakout'''
+        if features is None:
+            print("ML gate has no features for today, trading both sides")
+            return True, True
+        scores = self.scores(features, session_date)
+        if scores is None:
+            print("ML gate has a missing feature today, trading both sides")
+            return True, True
+        print("ML gate: P(win) " + ', '.join(f"{side.lower()} {p:.3f}" for side, p in scores.items()) +
+              f" (threshold {self.threshold}, scored in {self.last_seconds * 1e6:.0f} us)")
+        #A side the model wasn't trained on isn't gated
+        return tuple(scores.get(side, self.threshold) >= self.threshold for side in TRANSACTIONS)
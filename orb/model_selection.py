@@ -0,0 +1,164 @@
+'''
+Parallel, cached model selection for the Notebook 2 classifier zoo.
+
+Notebook 2 runs cross_val_score over 11 models one after another and then a separate GridSearchCV per model (the
+poly-kernel SVC alone is 5 x 10 C/degree combinations), refitting the scaler and resampler inside every fold and
+starting from scratch on every rerun. Here every (model, parameter set, fold) is one task:
+
+- the folds are preprocessed once (scaler fitted on the training fold only, then the optional SMOTE /
+  RandomOverSampler) and cached on disk with joblib.Memory, so every model reuses the same fitted preprocessing
+- task results are cached by joblib.Memory as well, keyed by a hash of the dataset and the full config (estimator,
+  parameters, fold, scoring, preprocessing), so rerunning a cell only fits what changed
+- uncached tasks fan out over processes with joblib.Parallel
+- every task records its fit time, so summary() shows what each model costs next to what it scores
+
+Usage in Notebook 2 (replacing the cross_val_score loop and the GridSearchCV cells):
+
+    import orb.model_selection as orbm
+    grids = {'SVM': {'kernel': ['poly'], 'C': [0.01, 0.1, 1, 10, 100], 'degree': list(range(1, 11))}}
+    results = orbm.evaluate(X_train, y_train, orbm.default_models(model_seed), grids, folds=folds, scoring=scoring,
+                            scaler_type=scaler_type, scaler_columns=scaler_list)
+    orbm.summary(results)
+'''
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                            #IMPORT LIBRARIES AND DEPENDENCIES
+#-------------------------------------------------------------------------------------------------------------------------------
+
+import time
+
+import joblib
+import pandas as pd
+from imblearn.over_sampling import RandomOverSampler, SMOTE
+from sklearn.base import clone
+from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
+from sklearn.ensemble import AdaBoostClassifier, ExtraTreesClassifier, GradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import KFold, ParameterGrid
+from sklearn.naive_bayes import GaussianNB
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.neural_network import MLPClassifier
+from sklearn.preprocessing import MinMaxScaler, StandardScaler
+from sklearn.svm import SVC
+from sklearn.tree import DecisionTreeClassifier
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Constants
+#-------------------------------------------------------------------------------------------------------------------------------
+
+CACHE_DIRECTORY = 'model_cache'
+
+SCALERS = {'standard': StandardScaler, 'minmax': MinMaxScaler}
+SAMPLERS = {'smote': SMOTE, 'randomoversampler': RandomOverSampler}
+
+
+def default_models(seed=None):
+    '''The Notebook 2 model list, in the same order'''
+    return [('LR', LogisticRegression()),
+            ('LDA', LinearDiscriminantAnalysis()),
+            ('KNN', KNeighborsClassifier()),
+            ('CART', DecisionTreeClassifier(random_state=seed)),
+            ('NB', GaussianNB()),
+            ('SVM', SVC(max_iter=2000, random_state=seed)),
+            ('NN', MLPClassifier(max_iter=1000, random_state=seed)),
+            ('AB', AdaBoostClassifier(random_state=seed)),
+            ('GBM', GradientBoostingClassifier(random_state=seed)),
+            ('RF', RandomForestClassifier(random_state=seed)),
+            ('ET', ExtraTreesClassifier(random_state=seed))]
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                #Cached Task Functions
+#-------------------------------------------------------------------------------------------------------------------------------
+
+def prepare_fold(X, y, train_index, test_index, scaler_type='MinMax', scaler_columns=None, sampler=None, seed=None):
+    '''
+    Scale one fold with a scaler fitted on its training rows only, then resample the training rows. Returns
+    (X_train, y_train, X_test, y_test) as arrays.
+    '''
+    X_train, X_test = X.iloc[train_index].copy(), X.iloc[test_index].copy()
+    y_train, y_test = y.iloc[train_index].to_numpy(), y.iloc[test_index].to_numpy()
+    if scaler_type is not None and scaler_type.lower() in SCALERS:
+        columns = list(X.columns) if scaler_columns is None else list(scaler_columns)
+        scaler = SCALERS[scaler_type.lower()]()
+        X_train[columns] = scaler.fit_transform(X_train[columns])
+        X_test[columns] = scaler.transform(X_test[columns])
+    X_train, X_test = X_train.to_numpy(dtype=float), X_test.to_numpy(dtype=float)
+    if sampler is not None and sampler.lower() in SAMPLERS:
+        X_train, y_train = SAMPLERS[sampler.lower()](random_state=seed).fit_resample(X_train, y_train)
+    return X_train, y_train, X_test, y_test
+
+
+def score_task(name, estimator, params, fold, fold_data, scoring):
+    '''Fit one model with one parameter set on one prepared fold and score it'''
+    X_train, y_train, X_test, y_test = fold_data
+    model = clone(estimator).set_params(**params)
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+    score = get_scorer(scoring)(model, X_test, y_test)
+    return {'model': name, 'params': params, 'fold': fold, 'score': score, 'fit_seconds': fit_seconds}
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Harness
+#-------------------------------------------------------------------------------------------------------------------------------
+
+def dataset_hash(X, y):
+    return joblib.hash((X, y))
+
+
+def evaluate(X, y, models, param_grids=None, folds=5, cv=None, scoring='recall', scaler_type='MinMax',
+             scaler_columns=None, sampler=None, seed=None, n_jobs=-1, cache_directory=CACHE_DIRECTORY):
+    '''
+    Cross validate every model (and every parameter set in param_grids[name], default just the model as given) on
+    the same folds. Returns one row per (model, parameter set, fold) with its score, fit time and whether it came from
+    the cache.
+    '''
+    start = time.perf_counter()
+    memory = joblib.Memory(cache_directory, verbose=0)
+    cached_prepare = memory.cache(prepare_fold)
+    cached_score = memory.cache(score_task)
+    param_grids = param_grids or {}
+    cv = cv or KFold(n_splits=folds)
+    print(f"Dataset {dataset_hash(X, y)[:12]}: {len(X)} rows, {X.shape[1]} features")
+
+    #Preprocess each fold once up front, every model below loads the same cached arrays
+    fold_data = [cached_prepare(X, y, train_index, test_index, scaler_type, scaler_columns, sampler, seed)
+                 for train_index, test_index in cv.split(X, y)]
+
+    tasks = [(name, estimator, params, fold, fold_data[fold], scoring)
+             for name, estimator in models
+             for params in ParameterGrid(param_grids.get(name, {}))
+             for fold in range(len(fold_data))]
+    rows = []
+    pending = []
+    for task in tasks:
+        if cached_score.check_call_in_cache(*task):
+            rows.append(dict(cached_score(*task), cached=True))
+        else:
+            pending.append(task)
+    print(f"{len(tasks)} tasks, {len(tasks) - len(pending)} already cached, fitting {len(pending)}...")
+
+    for row in joblib.Parallel(n_jobs=n_jobs)(joblib.delayed(cached_score)(*task) for task in pending):
+        rows.append(dict(row, cached=False))
+
+    results = pd.DataFrame(rows)
+    results['params'] = results['params'].map(lambda params: str(params) if params else '')
+    print(f"Model selection finished in {time.perf_counter() - start:.1f} second(s)")
+    return results
+
+
+def summary(results):
+    '''Mean and spread of the score per model and parameter set, with the fitting time it cost, best first'''
+    table = results.groupby(['model', 'params'], sort=False).agg(score_mean=('score', 'mean'),
+                                                                  score_std=('score', 'std'),
+                                                                  fit_seconds=('fit_seconds', 'sum'),
+                                                                  folds=('fold', 'count'))
+    return table.sort_values('score_mean', ascending=False).round(4)
+
+
+def model_times(results):
+    '''Total fitting time per model across all its parameter sets and folds'''
+    return results.groupby('model', sort=False)['fit_seconds'].sum().sort_values(ascending=False).round(3)
@@ -0,0 +1,219 @@
+'''
+Incremental, vectorized performance tracking for Notebook 3.
+
+Notebook 3 runs two full-table JOIN queries every time it opens (every trade, then the DISTINCT ON (date) variant for
+the first trade of each day) and works out its summary with repeated boolean filtering and two
+`for i in range(len(performance))` loops over performance.loc for the win and loss streaks. Here:
+
+- PerformanceHistory keeps the joined rows in memory (and optionally in a Feather file between notebook sessions) and
+  only asks the database for rows with performance.id above the last one it has seen
+- the first trade of each day (what the DISTINCT ON query returned) is picked from the rows we already have
+- tracking_kpis() computes the whole summary from NumPy arrays in one go: totals, wins and losses, streaks from a
+  run-length encoding, and the equity curve and drawdown from cumulative sums
+- breakdown() gives one KPI row per algorithm version, account, algorithm or ticker (or any mix of them)
+
+Usage in Notebook 3:
+
+    import orb.performance_analytics as orbp
+    history = orbp.PerformanceHistory(engine)
+    performance = orbp.add_metrics(history.load())
+    print(orbp.summary_text(orbp.tracking_kpis(performance), algo, algo_version))
+    orbp.breakdown(performance, 'algo_version')
+'''
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                            #IMPORT LIBRARIES AND DEPENDENCIES
+#-------------------------------------------------------------------------------------------------------------------------------
+
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Constants
+#-------------------------------------------------------------------------------------------------------------------------------
+
+#Notebook 3's join, plus the algorithm and account so one load serves every breakdown
+PERFORMANCE_QUERY = sa.text('''SELECT performance.id, performance.date, tickers.ticker, performance.margin,
+                                      direction.direction, performance.gross_profit, performance.commissions,
+                                      performance.algo_version, performance.algorithm_id, performance.account_id
+                               FROM performance
+                               JOIN tickers ON performance.ticker_id = tickers.id
+                               JOIN direction ON performance.direction_id = direction.id
+                               WHERE performance.id > :last_id
+                               ORDER BY performance.id''')
+
+COLUMNS = ['id', 'date', 'ticker', 'margin', 'direction', 'gross_profit', 'commissions', 'algo_version',
+           'algorithm_id', 'account_id']
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                #Incremental Loading
+#-------------------------------------------------------------------------------------------------------------------------------
+
+class PerformanceHistory:
+    '''
+    engine: SQLAlchemy engine for the performance database
+    cache_path: optional Feather file that keeps the rows between notebook sessions
+    '''
+
+    def __init__(self, engine, cache_path=None):
+        self.engine = engine
+        self.cache_path = cache_path
+        self.data = pd.DataFrame(columns=COLUMNS)
+        if (cache_path is not None) and os.path.exists(cache_path):
+            self.data = pd.read_feather(cache_path)
+
+    @property
+    def last_id(self):
+        return int(self.data['id'].max()) if len(self.data) else 0
+
+    def load(self):
+        '''Fetch only the rows added since the last load and return the full history ordered by id'''
+        start = time.perf_counter()
+        with self.engine.connect() as connection:
+            new_rows = pd.read_sql(PERFORMANCE_QUERY, connection, params={'last_id': self.last_id})
+        if len(new_rows):
+            frames = [self.data, new_rows[COLUMNS]] if len(self.data) else [new_rows[COLUMNS]]
+            self.data = pd.concat(frames, ignore_index=True)
+            if self.cache_path is not None:
+                self.data.to_feather(self.cache_path)
+        print(f"Performance: {len(new_rows)} new row(s), {len(self.data)} in total "
+              f"({(time.perf_counter() - start) * 1000:.0f} ms)")
+        return self.data.copy()
+
+    def invalidate(self):
+        '''Forget every row (e.g. after rows were edited or deleted in the database), the next load fetches them all'''
+        self.data = pd.DataFrame(columns=COLUMNS)
+        if (self.cache_path is not None) and os.path.exists(self.cache_path):
+            os.remove(self.cache_path)
+
+
+def select(performance, algorithm_id=None, account_id=None, algo_version=None):
+    '''Filter the history down to one algorithm, account and/or version ('None' or None keeps everything)'''
+    mask = np.ones(len(performance), dtype=bool)
+    for column, value in (('algorithm_id', algorithm_id), ('account_id', account_id),
+                          ('algo_version', algo_version)):
+        if (value is not None) and (value != 'None'):
+            mask &= (performance[column] == value).to_numpy()
+    return performance[mask].reset_index(drop=True)
+
+
+def first_trades(performance):
+    '''The first trade of every day, what the DISTINCT ON (performance.date) query returned'''
+    first = performance.sort_values(['date', 'id'], kind='stable').drop_duplicates('date')
+    return first.reset_index(drop=True)
+
+
+def add_metrics(performance):
+    '''Notebook 3's net_profit and % return columns'''
+    performance = performance.copy()
+    performance['net_profit'] = performance['gross_profit'] - performance['commissions']
+    performance['return'] = np.round(performance['net_profit'] / performance['margin'] * 100, 2)
+    return performance
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                        #KPIs
+#-------------------------------------------------------------------------------------------------------------------------------
+
+def run_lengths(mask):
+    '''Length of every run of True in a boolean array'''
+    padded = np.concatenate(([0], np.asarray(mask, dtype=np.int8), [0]))
+    edges = np.flatnonzero(np.diff(padded))
+    return edges[1::2] - edges[0::2]
+
+
+def equity_curve(net_profit):
+    '''Cumulative net profit, its running peak and the drawdown from that peak after every trade (starting flat)'''
+    equity = np.cumsum(np.asarray(net_profit, dtype=float))
+    peak = np.maximum.accumulate(np.concatenate(([0.0], equity)))[1:]
+    return equity, peak, equity - peak
+
+
+def tracking_kpis(performance):
+    '''Every Notebook 3 summary number (plus drawdown and streak details) from one set of arrays'''
+    net = (performance['gross_profit'] - performance['commissions']).to_numpy(dtype=float)
+    gross = performance['gross_profit'].to_numpy(dtype=float)
+    commissions = performance['commissions'].to_numpy(dtype=float)
+    returns = np.round(net / performance['margin'].to_numpy(dtype=float) * 100, 2)
+    trades = len(net)
+
+    winners, losers = net[net > 0], net[net < 0]
+    win_runs, loss_runs = run_lengths(net > 0), run_lengths(net < 0)
+    equity, peak, drawdown = equity_curve(net)
+    underwater = run_lengths(drawdown < 0)
+    if trades and (net[-1] != 0):
+        current_streak = int(np.argmin(np.sign(net[::-1]) == np.sign(net[-1])) or trades)
+        current_streak *= int(np.sign(net[-1]))
+    else:
+        current_streak = 0
+    avg_winner = winners.mean() if len(winners) else np.nan
+    avg_loser = losers.mean() if len(losers) else np.nan
+
+    return {'trades': trades,
+            'gross_profit': gross.sum(),
+            'commissions': commissions.sum(),
+            'net_profit': net.sum(),
+            'net_return': np.nansum(returns),
+            'wins': len(winners),
+            'losses': len(losers),
+            'win_rate': len(winners) / trades * 100 if trades else np.nan,
+            'avg_winner': avg_winner,
+            'avg_loser': avg_loser,
+            'reward_risk': avg_winner / abs(avg_loser) if len(winners) and len(losers) else np.nan,
+            'profit_factor': winners.sum() / -losers.sum() if len(losers) else np.nan,
+            'max_win_streak': int(win_runs.max()) if len(win_runs) else 0,
+            'max_loss_streak': int(loss_runs.max()) if len(loss_runs) else 0,
+            #Positive for a winning streak, negative for a losing one
+            'current_streak': current_streak,
+            'peak_profit': peak[-1] if trades else 0.0,
+            'max_drawdown': drawdown.min() if trades else 0.0,
+            'current_drawdown': drawdown[-1] if trades else 0.0,
+            'longest_drawdown_trades': int(underwater.max()) if len(underwater) else 0,
+            'first_date': performance['date'].iloc[0] if trades else None,
+            'last_date': performance['date'].iloc[-1] if trades else None}
+
+
+def equity_frame(performance):
+    '''Per trade equity curve and drawdown next to the trades, in $ and cumulative %'''
+    performance = add_metrics(performance)
+    equity, peak, drawdown = equity_curve(performance['net_profit'].to_numpy(dtype=float))
+    performance['equity'] = equity
+    performance['equity_peak'] = peak
+    performance['drawdown'] = drawdown
+    performance['cumulative_return'] = np.cumsum(performance['return'].to_numpy(dtype=float))
+    return performance
+
+
+def breakdown(performance, by='algo_version'):
+    '''One tracking_kpis row per group (by can be a column or a list of columns), trades stay in id order'''
+    performance = performance.sort_values('id', kind='stable')
+    rows = {key: tracking_kpis(group) for key, group in performance.groupby(by, sort=True)}
+    table = pd.DataFrame.from_dict(rows, orient='index')
+    table.index.names = [by] if isinstance(by, str) else list(by)
+    return table
+
+
+def summary_text(kpis, algo=None, algo_version=None):
+    '''The Notebook 3 summary paragraph'''
+    trades = kpis['trades']
+    if trades == 0:
+        return f"No trades recorded yet for the {algo} version {algo_version} Algorithm"
+    pnl = 'loss' if kpis['gross_profit'] < 0 else 'profit'
+    return (f"You have taken {trades} trades with the {algo} version {algo_version} Algorithm for a net return of "
+            f"{np.round(kpis['net_return'], 2)}% to date"
+            f"\n\nThis has resulted in a gross {pnl} of ${np.round(kpis['gross_profit'], 2)} and you have paid "
+            f"${np.round(kpis['commissions'], 2)} in commissions resulting in a net {pnl} of "
+            f"${np.round(kpis['net_profit'], 2)}"
+            f"\n\nYou have had a total of {kpis['wins']} profitable trades and {kpis['losses']} losing trades for a "
+            f"batting average of {np.round(kpis['win_rate'], 2)}%"
+            f"\n\nYour average winner is ${np.round(kpis['avg_winner'], 2)} and your average loser is "
+            f"${np.round(kpis['avg_loser'], 2)} for an average reward/risk of {np.round(kpis['reward_risk'], 1)}R"
+            f"\n\nYour best run so far is {kpis['max_win_streak']} winning trades in a row and your worst run is "
+            f"{kpis['max_loss_streak']} losing trades in a row"
+            f"\n\nYour largest drawdown is ${np.round(kpis['max_drawdown'], 2)}, currently "
+            f"${np.round(kpis['current_drawdown'], 2)} from the peak")
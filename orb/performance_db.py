@@ -0,0 +1,189 @@
+'''
+Pooled, asynchronous access to the performance table.
+
+The bot used to build a fresh engine at startup, run an f-string query that pulled every performance row for the
+algorithm into pandas, filter the account client side and sum gross_profit - commissions in Python. The contract size
+that came out of it was then fixed for the whole 6.5 hour session. PerformanceDB instead:
+
+- runs one pooled engine (create_engine) with pre-ping, so a connection dropped overnight is replaced, not reused
+- asks the server for COUNT and SUM(gross_profit - commissions) for the algorithm and account, with bound parameters
+  (NET_PROFIT_QUERY is built once), so one row comes back no matter how long the history gets
+- refreshes on a background thread, every refresh_seconds and whenever request_refresh() is called (the engine does
+  after each execution), and tells every listener (each strategy trading off this algorithm's results) the new
+  contract size when it changes
+- queues trade results from record_trade() (the strategy calls it as the fill ledger closes each trade) and inserts
+  them on the same thread, so the trading callbacks never wait on the database. A failed insert is kept and retried
+  on the next pass.
+
+Usage in the bot:
+
+    engine = create_engine(DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME)
+    performance_db = PerformanceDB(engine, client_id, account, algo_version)
+    performance_db.refresh()             #blocking, once, before we size the first trade
+    performance_db.start()
+'''
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                            #IMPORT LIBRARIES AND DEPENDENCIES
+#-------------------------------------------------------------------------------------------------------------------------------
+
+import math
+import queue
+import threading
+import time
+import urllib.parse
+
+import sqlalchemy as sa
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Constants
+#-------------------------------------------------------------------------------------------------------------------------------
+
+#One more contract for every $2000 the algorithm has made, one less for every $2000 it has lost
+PROFIT_PER_CONTRACT = 2000
+REFRESH_SECONDS = 300
+
+NET_PROFIT_QUERY = sa.text('''SELECT COUNT(*) AS trades, COALESCE(SUM(gross_profit - commissions), 0) AS net_profit
+                              FROM performance
+                              WHERE algorithm_id = :algorithm_id AND account_id = :account_id''')
+
+#Tickers and directions are looked up by name, the same tables Notebook 3 joins on
+INSERT_TRADE = sa.text('''INSERT INTO performance (date, ticker_id, margin, direction_id, gross_profit, commissions,
+                                                   algo_version, algorithm_id, account_id)
+                          VALUES (:date,
+                                  (SELECT id FROM tickers WHERE ticker = :ticker),
+                                  :margin,
+                                  (SELECT id FROM direction WHERE direction = :direction),
+                                  :gross_profit, :commissions, :algo_version, :algorithm_id, :account_id)''')
+
+
+def create_engine(user, password, host, port, name, pool_size=2, max_overflow=2, pool_recycle=1800):
+    '''One pooled PostgreSQL engine for the whole session'''
+    url = f"postgresql://{user}:{urllib.parse.quote_plus(password)}@{host}:{port}/{name}"
+    return sa.create_engine(url, pool_size=pool_size, max_overflow=max_overflow, pool_pre_ping=True,
+                            pool_recycle=pool_recycle)
+
+
+def contract_size(net_profit, trades, profit_per_contract=PROFIT_PER_CONTRACT):
+    '''The bot's sizing rule, a new algorithm starts with one contract'''
+    if trades == 0:
+        return 1
+    return 1 + int(math.floor(net_profit / profit_per_contract))
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                #Performance Database
+#-------------------------------------------------------------------------------------------------------------------------------
+
+class PerformanceDB:
+    '''
+    on_update: function(contracts) called from the background thread whenever a refresh changes the contract size,
+               add_listener() adds more (one per strategy when several symbols share the algorithm)
+    '''
+
+    def __init__(self, engine, algorithm_id, account_id, algo_version=None, refresh_seconds=REFRESH_SECONDS,
+                 on_update=None, profit_per_contract=PROFIT_PER_CONTRACT):
+        self.engine = engine
+        self.algorithm_id = int(algorithm_id)
+        self.account_id = int(account_id)
+        self.algo_version = algo_version
+        self.refresh_seconds = refresh_seconds
+        self.listeners = [] if on_update is None else [on_update]
+        self.profit_per_contract = profit_per_contract
+        self.trades = None
+        self.net_profit = None
+        self.contracts = None
+        self.refreshed_at = None
+        self.failed_writes = []
+        self._queue = queue.Queue()
+        self._refresh_queued = threading.Event()
+        self._thread = None
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                #Database Work
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def refresh(self):
+        '''Fetch the algorithm's trade count and net profit now (blocking), returns the contract size'''
+        start = time.perf_counter()
+        with self.engine.connect() as connection:
+            row = connection.execute(NET_PROFIT_QUERY, {'algorithm_id': self.algorithm_id,
+                                                        'account_id': self.account_id}).one()
+        previous, previous_trades = self.contracts, self.trades
+        self.trades, self.net_profit = int(row.trades), float(row.net_profit)
+        self.contracts = contract_size(self.net_profit, self.trades, self.profit_per_contract)
+        self.refreshed_at = time.time()
+        if self.trades != previous_trades:
+            print(f"Performance: {self.trades} trade(s), net profit ${self.net_profit:.2f}, {self.contracts} "
+                  f"contract(s) ({(time.perf_counter() - start) * 1000:.0f} ms)")
+        if (previous is not None) and (self.contracts != previous):
+            for listener in self.listeners:
+                listener(self.contracts)
+        return self.contracts
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def _write(self, trades):
+        with self.engine.begin() as connection:
+            connection.execute(INSERT_TRADE, trades)
+        print(f"Performance: recorded {len(trades)} trade(s)")
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                #Background Thread
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='performance-db', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=30):
+        '''Finish any queued writes, then stop the thread'''
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        if self.failed_writes:
+            print(f"Performance: {len(self.failed_writes)} trade(s) could not be written: {self.failed_writes}")
+
+    def request_refresh(self):
+        '''Ask for a refresh without waiting for it, requests that arrive before it runs are merged into one'''
+        if not self._refresh_queued.is_set():
+            self._refresh_queued.set()
+            self._queue.put('refresh')
+
+    def record_trade(self, date, ticker, direction, gross_profit, commissions, margin=None, algo_version=None):
+        '''Queue one closed trade for the performance table (direction as stored in the direction table)'''
+        self._queue.put({'date': date, 'ticker': ticker, 'direction': direction, 'gross_profit': float(gross_profit),
+                         'commissions': float(commissions), 'margin': None if margin is None else float(margin),
+                         'algo_version': algo_version or self.algo_version, 'algorithm_id': self.algorithm_id,
+                         'account_id': self.account_id})
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                tasks = [self._queue.get(timeout=self.refresh_seconds)]
+            except queue.Empty:
+                tasks = ['refresh']
+            #Take everything already queued, so the trades go in as one transaction and the refreshes merge into one
+            while True:
+                try:
+                    tasks.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._refresh_queued.clear()
+            stopping = None in tasks
+
+            trades = self.failed_writes + [task for task in tasks if isinstance(task, dict)]
+            self.failed_writes = []
+            if trades:
+                try:
+                    self._write(trades)
+                except sa.exc.SQLAlchemyError as e:
+                    print(f"Performance database error, {len(trades)} trade(s) will be retried: {e}")
+                    self.failed_writes = trades
+            try:
+                self.refresh()
+            except sa.exc.SQLAlchemyError as e:
+                print(f"Performance database error, keeping {self.contracts} contract(s): {e}")
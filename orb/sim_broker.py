@@ -0,0 +1,474 @@
+'''
+In-process simulated broker for replaying sessions through the live code path.
+
+The only way to run the bot end to end used to be a live or paper Gateway, one real trading day per test. The
+SimulatedApp is an ORBTradingApp whose EClient side never opens a socket: the requests the engine makes (reqIds,
+reqPositions, reqOpenOrders, reqExecutions, reqHistoricalData with keepUpToDate, placeOrder, cancelOrder) are answered
+in process by calling the same wrapper callbacks IBKR would, so ORBTradingApp, ORBEngine, ORBStrategy and the fill
+ledger all run unchanged.
+
+- a VirtualClock stands in for wall time, the replay moves it bar by bar so a session takes well under a second
+- stored 5 minute bars are replayed as keepUpToDate updates, each bar walks a fixed path with an update at every
+  point: by default open -> low -> high -> close for an up bar and open -> high -> low -> close otherwise, or always
+  high first / low first with path_order
+- orders fill deterministically on that path: STP at the stop (or the open when it gaps through), LMT at the limit
+  (or better on a gap), STP LMT triggers at the stop and then fills as a limit. Bracket children wait for their
+  parent, a filled child cancels its sibling, a filled parent cancels the rest of its OCA group and cancelling a
+  parent takes its children with it. Every fill sends orderStatus, execDetails, a commission report and a position
+
+run_sessions() replays many sessions (a fresh app, engine and strategy per day like the daily bot) and returns the
+ledger's trades, compare_with_backtest() lines them up with orb.backtest on the same bars. 5 minute bars can't say
+which side a bar that reaches both opening range levels touched first (the backtest takes the long side and then
+holds through the entry bar), so trades in those sessions are flagged ambiguous and a CI gate should only fail on
+the rest.
+
+Usage (e.g. Notebook 1 or a CI job):
+
+    import orb.sim_broker as orbsim
+    sim_trades = orbsim.run_sessions(data_MNQ.loc['2024-06'], 'MNQ')
+    table = orbsim.compare_with_backtest(data_MNQ.loc['2024-06'], sim_trades)
+    assert table[~table['ambiguous']]['match'].all()
+'''
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                            #IMPORT LIBRARIES AND DEPENDENCIES
+#-------------------------------------------------------------------------------------------------------------------------------
+
+import contextlib
+import copy
+import datetime as dt
+import io
+import time
+
+import pandas as pd
+from ibapi.common import BarData
+from ibapi.execution import Execution
+from ibapi.order_state import OrderState
+
+try:
+    from ibapi.commission_report import CommissionReport
+except ImportError:
+    #Newer ibapi versions renamed it
+    from ibapi.commission_and_fees_report import CommissionAndFeesReport as CommissionReport
+
+from orb.app import ORBTradingApp
+from orb.backtest import FEATURE_COLUMNS, ORB_TIME, backtest_ticker, orb_levels
+from orb.bar_store import TIMEZONE
+from orb.contracts import point_value
+from orb.engine import ORBEngine, ORBStrategy
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Constants
+#-------------------------------------------------------------------------------------------------------------------------------
+
+BAR_SECONDS = 300
+RTH_START = dt.time(7, 30)
+RTH_END = dt.time(14, 0)
+#Seconds into the bar at which the replay reaches each point of bar_path
+BAR_PATH_STEPS = (0, 100, 200, 299)
+#Which extreme a bar visits first: by the bar's direction (an up bar made its low first), or always high or low first
+PATH_ORDERS = ('bar_direction', 'high_first', 'low_first')
+#The bot starts at 7:33, while the opening range bar is still building
+START_TIME = dt.time(7, 33)
+#IBKR's per contract commission on micro futures (commission plus exchange and regulatory fees)
+COMMISSION = 0.62
+ACCOUNT = 'SIMULATED'
+FIRST_ORDER_ID = 1
+
+
+class VirtualClock:
+    '''Simulated wall time in epoch seconds, moved forward by the replay instead of by time passing'''
+
+    def __init__(self, epoch=0):
+        self.epoch = epoch
+
+    def now(self):
+        return dt.datetime.fromtimestamp(self.epoch, TIMEZONE)
+
+    def advance(self, epoch):
+        self.epoch = max(self.epoch, epoch)
+
+
+class SimOrder:
+    __slots__ = ('order_id', 'perm_id', 'contract', 'order', 'status', 'triggered')
+
+    def __init__(self, order_id, perm_id, contract, order, status):
+        self.order_id = order_id
+        self.perm_id = perm_id
+        self.contract = contract
+        self.order = order
+        self.status = status
+        self.triggered = False
+
+
+def bar_path(open_, high, low, close, path_order='bar_direction'):
+    '''The prices a bar visits in order, by default an up bar is assumed to have made its low first'''
+    if path_order not in PATH_ORDERS:
+        raise ValueError(f"Unknown path_order {path_order}, use one of {', '.join(PATH_ORDERS)}")
+    if (path_order == 'low_first') or ((path_order == 'bar_direction') and (close >= open_)):
+        return [open_, low, high, close]
+    return [open_, high, low, close]
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                #Simulated Trading App
+#-------------------------------------------------------------------------------------------------------------------------------
+
+class SimulatedApp(ORBTradingApp):
+    '''
+    bars: {symbol: dataframe of 5 minute candles} in the candle cache layout (naive MST 'Date' index, OHLCV)
+    client_id: stamped on every execution, the strategy only pairs fills from its own client id
+    path_order: how each bar is walked, one of PATH_ORDERS
+    '''
+
+    def __init__(self, bars, client_id=0, commission=COMMISSION, account=ACCOUNT, path_order='bar_direction'):
+        ORBTradingApp.__init__(self)
+        self.bars = {symbol.upper(): frame for symbol, frame in bars.items()}
+        self.client_id = client_id
+        self.commission = commission
+        self.account = account
+        self.path_order = path_order
+        self.clock = VirtualClock()
+        self.connected = False
+        self.nextOrderId = FIRST_ORDER_ID
+        self.orders = {}
+        self.executions = []
+        self.positions = {}
+        self.subscriptions = {}
+        self.session = {}
+        self._perm_id = 0
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                #Session Setup
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def set_session(self, session_date, start_time=START_TIME):
+        '''Load the regular hours bars of one session for every symbol and put the clock at start_time'''
+        session_date = pd.Timestamp(session_date).date()
+        for symbol, frame in self.bars.items():
+            day = frame[frame.index.date == session_date]
+            day = day[(day.index.time >= RTH_START) & (day.index.time < RTH_END)]
+            epochs = day.index.tz_localize(TIMEZONE).as_unit('s').asi8
+            self.session[symbol] = list(zip(epochs.tolist(), day['Open'].to_numpy(dtype=float).tolist(),
+                                            day['High'].to_numpy(dtype=float).tolist(),
+                                            day['Low'].to_numpy(dtype=float).tolist(),
+                                            day['Close'].to_numpy(dtype=float).tolist(),
+                                            day['Volume'].to_numpy(dtype=float).tolist()))
+        start = dt.datetime.combine(session_date, start_time, TIMEZONE).timestamp()
+        self.clock = VirtualClock(int(start))
+
+    def _bar_data(self, epoch, open_, high, low, close, volume):
+        bar = BarData()
+        bar.date = str(epoch)
+        bar.open, bar.high, bar.low, bar.close, bar.volume = open_, high, low, close, volume
+        return bar
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                #EClient Requests
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def connect(self, host, port, clientId):
+        self.connected = True
+        self.nextValidId(self.nextOrderId)
+
+    def isConnected(self):
+        return self.connected
+
+    def disconnect(self):
+        self.connected = False
+
+    def run(self):
+        pass
+
+    def reqIds(self, numIds):
+        self.nextValidId(self.nextOrderId)
+
+    def reqPositions(self):
+        #Like IBKR, only contracts we have held show up
+        for symbol, (contract, position, average_cost) in self.positions.items():
+            self.position(self.account, contract, position, average_cost)
+        self.positionEnd()
+
+    def cancelPositions(self):
+        pass
+
+    def reqOpenOrders(self):
+        for sim_order in self.orders.values():
+            if sim_order.status in ('PreSubmitted', 'Submitted'):
+                self.openOrder(sim_order.order_id, sim_order.contract, sim_order.order, self._order_state(sim_order))
+        self.openOrderEnd()
+
+    def reqExecutions(self, reqId, execFilter):
+        for contract, execution, report in self.executions:
+            self.execDetails(reqId, contract, execution)
+            self._commission(report)
+        self.execDetailsEnd(reqId)
+
+    def reqHistoricalData(self, reqId, contract, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH,
+                          formatDate, keepUpToDate, chartOptions):
+        #Every bar of the session that has started, the newest one only as far as its open
+        for epoch, open_, high, low, close, volume in self.session.get(contract.symbol.upper(), []):
+            if epoch + BAR_SECONDS <= self.clock.epoch:
+                self.historicalData(reqId, self._bar_data(epoch, open_, high, low, close, volume))
+            elif epoch <= self.clock.epoch:
+                self.historicalData(reqId, self._bar_data(epoch, open_, open_, open_, open_, 0))
+        self.historicalDataEnd(reqId, '', '')
+        if keepUpToDate:
+            self.subscriptions[reqId] = contract.symbol.upper()
+
+    def cancelHistoricalData(self, reqId):
+        self.subscriptions.pop(reqId, None)
+
+    def placeOrder(self, orderId, contract, order):
+        self.order_ids.add(orderId)
+        self.nextOrderId = max(self.nextOrderId, orderId + 1)
+        self._perm_id += 1
+        parent = self.orders.get(getattr(order, 'parentId', 0))
+        status = 'PreSubmitted' if (parent is not None) and (parent.status != 'Filled') else 'Submitted'
+        sim_order = SimOrder(orderId, self._perm_id, contract, order, status)
+        self.orders[orderId] = sim_order
+        self.openOrder(orderId, contract, order, self._order_state(sim_order))
+        self._order_status(sim_order)
+
+    def cancelOrder(self, orderId, *args):
+        sim_order = self.orders.get(orderId)
+        if sim_order is not None:
+            self._cancel(sim_order)
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                #Order Callbacks
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def _order_state(self, sim_order):
+        state = OrderState()
+        state.status = sim_order.status
+        return state
+
+    def _order_status(self, sim_order, fill_price=0.0):
+        quantity = float(sim_order.order.totalQuantity)
+        filled = quantity if sim_order.status == 'Filled' else 0.0
+        self.orderStatus(sim_order.order_id, sim_order.status, filled, quantity - filled, fill_price,
+                         sim_order.perm_id, getattr(sim_order.order, 'parentId', 0), fill_price, self.client_id, '',
+                         0.0)
+
+    def _commission(self, report):
+        if hasattr(report, 'commissionAndFees'):
+            self.commissionAndFeesReport(report)
+        else:
+            self.commissionReport(report)
+
+    def _cancel(self, sim_order):
+        if sim_order.status not in ('PreSubmitted', 'Submitted'):
+            return
+        sim_order.status = 'Cancelled'
+        self._order_status(sim_order)
+        for child in self._children(sim_order):
+            self._cancel(child)
+
+    def _children(self, sim_order):
+        return [child for child in self.orders.values() if getattr(child.order, 'parentId', 0) == sim_order.order_id]
+
+    def _fill(self, sim_order, price):
+        order, contract = sim_order.order, sim_order.contract
+        symbol = contract.symbol.upper()
+        quantity = float(order.totalQuantity)
+        sim_order.status = 'Filled'
+        self._order_status(sim_order, price)
+
+        execution = Execution()
+        execution.execId = f"sim.{len(self.executions) + 1:08d}.01.01"
+        execution.orderId, execution.permId, execution.clientId = sim_order.order_id, sim_order.perm_id, self.client_id
+        execution.side = 'BOT' if order.action == 'BUY' else 'SLD'
+        execution.shares, execution.cumQty = quantity, quantity
+        execution.price, execution.avgPrice = price, price
+        execution.time = self.clock.now().strftime('%Y%m%d %H:%M:%S ') + TIMEZONE.key
+        execution.acctNumber, execution.exchange = self.account, 'SIM'
+        report = CommissionReport()
+        report.execId = execution.execId
+        if hasattr(report, 'commissionAndFees'):
+            report.commissionAndFees = self.commission * quantity
+        else:
+            report.commission = self.commission * quantity
+        report.currency = 'USD'
+        #The ledger reads the point value from the execution's contract, like IBKR sends it
+        contract = copy.copy(contract)
+        contract.multiplier = str(point_value(symbol) or 1)
+        self.executions.append((contract, execution, report))
+        self.execDetails(-1, contract, execution)
+        self._commission(report)
+
+        _, position, average_cost = self.positions.get(symbol, (contract, 0.0, 0.0))
+        position += quantity if order.action == 'BUY' else -quantity
+        self.positions[symbol] = (contract, position, price if position else 0.0)
+        self.position(self.account, contract, position, self.positions[symbol][2])
+
+        #Bracket and OCA semantics
+        parent = self.orders.get(getattr(order, 'parentId', 0))
+        if parent is not None:
+            for sibling in self._children(parent):
+                if sibling is not sim_order:
+                    self._cancel(sibling)
+        else:
+            for child in self._children(sim_order):
+                if child.status == 'PreSubmitted':
+                    child.status = 'Submitted'
+                    self._order_status(child)
+            group = getattr(order, 'ocaGroup', '')
+            if group:
+                for other in list(self.orders.values()):
+                    if (other is not sim_order) and (getattr(other.order, 'ocaGroup', '') == group) and \
+                            (getattr(other.order, 'parentId', 0) != sim_order.order_id):
+                        self._cancel(other)
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                    #Matching
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def _fill_price(self, sim_order, current, target):
+        '''Where the order fills while the price moves from current to target (a straight line), None if it doesn't'''
+        order = sim_order.order
+        buy = order.action == 'BUY'
+        order_type = order.orderType.upper()
+        if order_type == 'MKT':
+            return current
+        if order_type in ('STP', 'STP LMT') and not sim_order.triggered:
+            stop = order.auxPrice
+            if buy and max(current, target) >= stop:
+                trigger = current if current >= stop else stop
+            elif (not buy) and min(current, target) <= stop:
+                trigger = current if current <= stop else stop
+            else:
+                return None
+            if order_type == 'STP':
+                return trigger
+            sim_order.triggered = True
+            if (buy and trigger <= order.lmtPrice) or ((not buy) and trigger >= order.lmtPrice):
+                return trigger
+            #Gapped through the limit, it now waits as a limit order
+            current = trigger
+        if order_type in ('LMT', 'STP LMT'):
+            limit = order.lmtPrice
+            if buy and min(current, target) <= limit:
+                return current if current <= limit else limit
+            if (not buy) and max(current, target) >= limit:
+                return current if current >= limit else limit
+        return None
+
+    def _match(self, symbol, current, target):
+        '''Fill working orders for a symbol in the order the price reaches them'''
+        while True:
+            best = None
+            for sim_order in list(self.orders.values()):
+                if (sim_order.status != 'Submitted') or (sim_order.contract.symbol.upper() != symbol):
+                    continue
+                price = self._fill_price(sim_order, current, target)
+                if (price is not None) and ((best is None) or (abs(price - current) < abs(best[1] - current))):
+                    best = (sim_order, price)
+            if best is None:
+                return
+            self._fill(*best)
+            current = best[1]
+
+    #---------------------------------------------------------------------------------------------------------------------------
+                                                    #Replay
+    #---------------------------------------------------------------------------------------------------------------------------
+
+    def _send_update(self, symbol, bar):
+        for req_id, subscribed in list(self.subscriptions.items()):
+            if subscribed == symbol:
+                self.historicalDataUpdate(req_id, bar)
+
+    def replay(self):
+        '''Play the rest of the session: every bar's path point by point, filling orders as the price moves'''
+        #Several instruments step through each bar together, on one clock like they share one connection
+        by_symbol = {symbol: {bar[0]: bar for bar in bars} for symbol, bars in self.session.items()}
+        for epoch in sorted({epoch for bars in by_symbol.values() for epoch in bars}):
+            if epoch + BAR_SECONDS <= self.clock.epoch:
+                continue
+            paths = [(symbol, bars[epoch], bar_path(*bars[epoch][1:5], self.path_order))
+                     for symbol, bars in by_symbol.items() if epoch in bars]
+            for step in range(len(BAR_PATH_STEPS)):
+                self.clock.advance(epoch + BAR_PATH_STEPS[step])
+                for symbol, (_, open_, _, _, _, volume), path in paths:
+                    #The price gets here first, then the bar update goes out (the open is a gap from the last close)
+                    self._match(symbol, path[step - 1] if step else open_, path[step])
+                    seen = path[:step + 1]
+                    traded = volume * step / (len(path) - 1)
+                    self._send_update(symbol, self._bar_data(epoch, open_, max(seen), min(seen), path[step], traded))
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                #Session Runner
+#-------------------------------------------------------------------------------------------------------------------------------
+
+def run_session(data, session_date, symbol='MNQ', quantity=1, client_id=0, start_time=START_TIME,
+                path_order='bar_direction', **strategy_kwargs):
+    '''Replay one session through ORBTradingApp, ORBEngine and ORBStrategy, returns (strategy, app)'''
+    app = SimulatedApp({symbol: data}, client_id=client_id, path_order=path_order)
+    app.set_session(session_date, start_time)
+    app.connect('127.0.0.1', 0, client_id)
+    strategy = ORBStrategy(symbol, 'SIM', quantity, client_id, **strategy_kwargs)
+    engine = ORBEngine(app, [strategy])
+    engine.start()
+    app.replay()
+    engine.stop()
+    return strategy, app
+
+
+def run_sessions(data, symbol='MNQ', dates=None, quiet=True, **kwargs):
+    '''
+    Replay every session in data (or the given dates) with a fresh app, engine and strategy each day, returns one row
+    per trade from the strategy's fill ledger.
+    '''
+    dates = sorted(set(data.index.date)) if dates is None else [pd.Timestamp(date).date() for date in dates]
+    rows = []
+    start = time.perf_counter()
+    for session_date in dates:
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+            strategy, app = run_session(data, session_date, symbol, **kwargs)
+        ledger = strategy.state.ledger
+        for trade in ledger.trades:
+            priced = trade.closed and (ledger.multiplier is not None)
+            rows.append({'date': session_date, 'number': trade.number, 'direction': trade.direction,
+                         'quantity': trade.quantity, 'entry_time': trade.entry_time, 'entry': trade.entry_price,
+                         'exit_time': trade.exit_time, 'exit': trade.exit_price,
+                         'gross_profit': trade.gross_profit(ledger.multiplier) if priced else None,
+                         'commission': trade.commission})
+    print(f"Replayed {len(dates)} session(s) in {time.perf_counter() - start:.2f} second(s), {len(rows)} trade(s)")
+    return pd.DataFrame(rows)
+
+
+def compare_with_backtest(data, sim_trades, profit_multiplier=2, reentry_tolerance=5, cancel_time='13:30:00'):
+    '''
+    The simulated trades next to orb.backtest's on the same bars (with the live bot's cancel time and re-entry
+    tolerance), one row per session and trade number with a match flag for direction, entry and exit, and an
+    ambiguous flag for sessions where a bar after the opening range reached both of its levels.
+    '''
+    trades, _ = backtest_ticker(data, profit_multiplier, cancel_time=cancel_time, reentry_tolerance=reentry_tolerance)
+    #A trade still open at the end of the data has no exit (and Notebook 1's quirk may have replaced it with a close)
+    closed_length = 3 + len(FEATURE_COLUMNS) + 1
+    backtest = pd.DataFrame([{'date': trade[0].date(), 'direction': trade[1], 'entry': trade[2],
+                              'exit': trade[-1] if len(trade) == closed_length else None}
+                             for trade in trades.values() if isinstance(trade, list)])
+    if len(backtest):
+        backtest['number'] = backtest.groupby('date').cumcount() + 1
+    else:
+        backtest = pd.DataFrame(columns=['date', 'direction', 'entry', 'exit', 'number'])
+    table = sim_trades[['date', 'number', 'direction', 'entry', 'exit']].merge(
+        backtest, on=['date', 'number'], how='outer', suffixes=('_sim', '_backtest'))
+    table['match'] = (table['direction_sim'] == table['direction_backtest']) & \
+        (table['entry_sim'] == table['entry_backtest']) & \
+        ((table['exit_sim'] == table['exit_backtest']) | (table['exit_sim'].isna() & table['exit_backtest'].isna()))
+    #Every stop/target or entry/entry pair a trade has lies outside the opening range, so such a bar is the only
+    #place the two can part ways
+    long_entry, short_entry = orb_levels(data)
+    after_orb = data.index.time > pd.Timestamp(ORB_TIME).time()
+    both = after_orb & (data['High'].to_numpy(dtype=float) >= long_entry) & \
+        (data['Low'].to_numpy(dtype=float) <= short_entry)
+    table['ambiguous'] = table['date'].isin(set(data.index.date[both]))
+    mismatched = ~table['match']
+    print(f"{table['match'].sum()} of {len(table)} trades match the backtest, "
+          f"{(mismatched & table['ambiguous']).sum()} differ in sessions with a bar that reached both opening range "
+          f"levels (ambiguous on 5 minute bars), {(mismatched & ~table['ambiguous']).sum()} real mismatch(es)")
+    return table.sort_values(['date', 'number']).reset_index(drop=True)
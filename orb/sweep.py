@@ -0,0 +1,197 @@
+'''
+Parallel parameter sweep for the ORB backtest.
+
+Tuning profit_multiplier (and friends) used to mean re-running the whole Notebook 1 loop once per setting. The sweep
+fans the grid out over a process pool instead:
+
+- each ticker's bars are written once to .npy files (index, OHLC and the precomputed session arrays) and every worker
+  opens them with np.load(mmap_mode='r'), so the data is shared through the page cache rather than pickled per task
+- each task runs orb.backtest.backtest_arrays for one (ticker, parameter set) and sends back a single KPI row
+- rows are streamed back as they finish and collected into one tidy dataframe, one row per ticker and parameter set
+
+Usage in Notebook 1:
+
+    import orb.sweep as orbs
+    grid = orbs.parameter_grid(profit_multiplier=[1, 1.5, 2, 3], orb_minutes=[5, 15, 30], reentry=[True, False])
+    results = orbs.sweep(data_dict, grid)
+    results.sort_values('sharpe_ratio', ascending=False).head(10)
+
+The KPI columns mirror the longtermKPIs / daytrading_KPI_df tables so the numbers line up with the notebook, but they
+are computed here from the task's own trades because the RiverRose functions print and plot rather than return rows.
+'''
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                            #IMPORT LIBRARIES AND DEPENDENCIES
+#-------------------------------------------------------------------------------------------------------------------------------
+
+import itertools
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from orb.backtest import FEATURE_COLUMNS, ORB_TIME, backtest_arrays, opening_range_levels, session_index
+from orb.contracts import point_value
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Constants
+#-------------------------------------------------------------------------------------------------------------------------------
+
+#5 minute regular trading hours bars in a day (390 minutes / 5)
+CANDLES_PER_DAY = 78
+RISK_FREE_RATE = 0.0464
+
+#Arrays written per ticker, in the order backtest_arrays needs them
+ARRAYS = ('index', 'open', 'high', 'low', 'close', 'seconds', 'session_start', 'session_end')
+
+#Arrays each worker maps once in its initializer: {ticker: {array name: memmap}}
+_WORKER_DATA = {}
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                #Grid and Shared Data
+#-------------------------------------------------------------------------------------------------------------------------------
+
+def parameter_grid(**values):
+    '''Every combination of the keyword lists, e.g. parameter_grid(profit_multiplier=[1, 2], reentry=[True, False])'''
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in itertools.product(*(values[name] for name in names))]
+
+
+def _write_datasets(data_dict, directory):
+    '''Write each ticker's arrays to .npy files once and return {ticker: {array name: path}}'''
+    paths = {}
+    for ticker, data in data_dict.items():
+        seconds, session_start, session_end = session_index(data.index)
+        arrays = {'index': pd.DatetimeIndex(data.index).as_unit('ns').asi8,
+                  'open': data['Open'].to_numpy(dtype=float),
+                  'high': data['High'].to_numpy(dtype=float),
+                  'low': data['Low'].to_numpy(dtype=float),
+                  'close': data['Close'].to_numpy(dtype=float),
+                  'seconds': np.asarray(seconds, dtype=np.int64),
+                  'session_start': session_start,
+                  'session_end': session_end}
+        paths[ticker] = {}
+        for name in ARRAYS:
+            path = os.path.join(directory, f"{ticker}_{name}.npy")
+            np.save(path, arrays[name])
+            paths[ticker][name] = path
+    return paths
+
+
+def _init_worker(paths):
+    for ticker, files in paths.items():
+        _WORKER_DATA[ticker] = {name: np.load(path, mmap_mode='r') for name, path in files.items()}
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #KPIs
+#-------------------------------------------------------------------------------------------------------------------------------
+
+def _max_consecutive(mask):
+    longest = current = 0
+    for flag in mask:
+        current = current + 1 if flag else 0
+        longest = max(longest, current)
+    return longest
+
+
+def kpi_row(ticker, trades, returns, index, candles_per_day=CANDLES_PER_DAY, riskfreerate=RISK_FREE_RATE):
+    '''One tidy row of long term (per bar returns) and day trading (per trade points) KPIs'''
+    years = len(returns) / (candles_per_day * 252)
+    total_return = float(np.prod(1 + returns) - 1)
+    annual_return = (1 + total_return) ** (1 / years) - 1 if years > 0 else np.nan
+    annual_volatility = float(np.std(returns) * np.sqrt(candles_per_day * 252))
+    sharpe = (annual_return - riskfreerate) / annual_volatility if annual_volatility > 0 else np.nan
+    equity = np.cumprod(1 + returns)
+    max_drawdown = float(np.max(1 - equity / np.maximum.accumulate(equity))) if len(equity) else 0.0
+
+    #Only complete trades (entry plus exit) have points, trade_data ends on a bare close when the count is odd
+    points = []
+    for trade in trades.values():
+        if isinstance(trade, list) and len(trade) == len(FEATURE_COLUMNS) + 4:
+            entry, exit = trade[2], trade[-1]
+            points.append(exit - entry if trade[1] == 'LONG' else entry - exit)
+    points = np.asarray(points, dtype=float)
+    winners = points[points > 0]
+    losers = points[points <= 0]
+    dollars_per_point = point_value(ticker) or 1
+
+    return {'trades': len(points),
+            'total_return': total_return,
+            'annual_return': annual_return,
+            'annual_volatility': annual_volatility,
+            'sharpe_ratio': sharpe,
+            'max_drawdown': max_drawdown,
+            'win_rate': len(winners) / len(points) if len(points) else np.nan,
+            'avg_winner_points': winners.mean() if len(winners) else np.nan,
+            'avg_loser_points': losers.mean() if len(losers) else np.nan,
+            'avg_winner_dollars': winners.mean() * dollars_per_point if len(winners) else np.nan,
+            'avg_loser_dollars': losers.mean() * dollars_per_point if len(losers) else np.nan,
+            'net_points': points.sum(),
+            'net_dollars': points.sum() * dollars_per_point,
+            'profit_factor': winners.sum() / -losers.sum() if losers.sum() < 0 else np.nan,
+            'max_consecutive_losses': _max_consecutive(points <= 0),
+            'first_bar': pd.Timestamp(index[0]) if len(index) else None,
+            'last_bar': pd.Timestamp(index[-1]) if len(index) else None}
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Workers
+#-------------------------------------------------------------------------------------------------------------------------------
+
+def _run_task(ticker, params, candles_per_day=CANDLES_PER_DAY, riskfreerate=RISK_FREE_RATE):
+    start = time.perf_counter()
+    arrays = _WORKER_DATA[ticker]
+    params = dict(params)
+    orb_time = params.pop('orb_time', ORB_TIME)
+    orb_minutes = params.pop('orb_minutes', 5)
+    high = np.asarray(arrays['high'])
+    low = np.asarray(arrays['low'])
+    long_entry, short_entry = opening_range_levels(arrays['seconds'], arrays['session_start'], high, low, orb_time,
+                                                   orb_minutes)
+    trades, columns = backtest_arrays(arrays['index'], np.asarray(arrays['open']), high, low,
+                                      np.asarray(arrays['close']), long_entry, short_entry, arrays['seconds'],
+                                      arrays['session_end'], **params)
+    row = {'ticker': ticker, 'orb_time': orb_time, 'orb_minutes': orb_minutes, **params}
+    row.update(kpi_row(ticker, trades, columns['return'], arrays['index'], candles_per_day, riskfreerate))
+    row['task_seconds'] = time.perf_counter() - start
+    return row
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Sweep
+#-------------------------------------------------------------------------------------------------------------------------------
+
+def iter_sweep(data_dict, grid, tickers=None, max_workers=None, candles_per_day=CANDLES_PER_DAY,
+               riskfreerate=RISK_FREE_RATE):
+    '''
+    Run every (ticker, parameter set) on a process pool and yield the KPI rows as they finish.
+
+    grid is a list of keyword dictionaries for backtest_arrays (see parameter_grid), plus orb_time and orb_minutes.
+    The opening range is always rebuilt from the raw bars here, so orb_minutes=5 matches find_conditions.
+    '''
+    tickers = list(data_dict) if tickers is None else tickers
+    with tempfile.TemporaryDirectory(prefix='orb_sweep_') as directory:
+        paths = _write_datasets({ticker: data_dict[ticker] for ticker in tickers}, directory)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(paths,)) as pool:
+            futures = [pool.submit(_run_task, ticker, params, candles_per_day, riskfreerate)
+                       for ticker in tickers for params in grid]
+            for future in as_completed(futures):
+                yield future.result()
+
+
+def sweep(data_dict, grid, tickers=None, max_workers=None, candles_per_day=CANDLES_PER_DAY,
+          riskfreerate=RISK_FREE_RATE):
+    '''Run the whole grid and return one tidy dataframe of KPI rows'''
+    start = time.perf_counter()
+    rows = []
+    for row in iter_sweep(data_dict, grid, tickers, max_workers, candles_per_day, riskfreerate):
+        rows.append(row)
+        print(f"{len(rows)} tasks complete: {row['ticker']} {row['task_seconds']:.2f}s")
+    results = pd.DataFrame(rows)
+    print(f"Sweep of {len(rows)} tasks finished in {time.perf_counter() - start:.1f} second(s)")
+    return results
@@ -0,0 +1,337 @@
+'''
+Intrabar-accurate ORB outcomes from tick or 1 second data.
+
+The Notebook 1 backtest and the ML labels (target_label) decide stop versus target from 5 minute OHLC, so a bar that
+spans both levels is a guess, and entries assume the STP LMT always fills at the opening range level. The live bot
+fills on real prints. This module replays the finer data instead:
+
+- TickStore keeps one memory-mapped .npy file per session (time, price, size), written a day at a time so months
+  of ticks never have to be in RAM together. 1 second bars go in as four prints each along the bar's path
+- replay_session() walks one session in bounded chunks (views of the memory map) with the same rules as the
+  backtest: OCA breakout of the opening range, stop and profit_multiplier x target, one re-entry after a stop, no
+  entries from cancel_time and a flat exit at EXIT_TIME. Every step is a first-touch search over the chunk
+- entries are STP LMT: the first print through the level triggers it, it fills on that print when it is inside the
+  limit (level +/- limit_offset) and otherwise rests as a limit that may never fill (a 'NoFill')
+- compare_outcomes() lines the tick trades up with backtest_ticker on the 5 minute bars and reports how many trades
+  changed outcome, direction or fill
+
+Usage in Notebook 1:
+
+    import orb.tick_replay as orbt
+    store = orbt.TickStore(ticker='mnq')
+    for chunk in pd.read_csv('mnq_ticks.csv', index_col=0, parse_dates=True, chunksize=5_000_000):
+        store.write(chunk)
+    table = orbt.compare_outcomes(data_MNQ, store)
+'''
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                            #IMPORT LIBRARIES AND DEPENDENCIES
+#-------------------------------------------------------------------------------------------------------------------------------
+
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from orb.backtest import (FEATURE_COLUMNS, ORB_TIME, _first_at_or_above, _first_at_or_below, backtest_ticker,
+                          orb_levels)
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Constants
+#-------------------------------------------------------------------------------------------------------------------------------
+
+TICK_DIRECTORY = 'tick_data'
+#Times are nanoseconds of the naive MST timestamp, like the candle tables
+TICK_DTYPE = np.dtype([('time', '<i8'), ('price', '<f8'), ('size', '<f4')])
+CHUNK_ROWS = 1_000_000
+NANOSECONDS = 1_000_000_000
+
+ORB_MINUTES = 5
+CANCEL_TIME = '13:30:00'
+#The backtest closes a trade at the open of the 13:45 bar, the first print from 13:45 here
+EXIT_TIME = '13:45:00'
+#Points between the STP LMT stop and its limit (the live bot's BracketOrder offset)
+LIMIT_OFFSET = 1.0
+
+#Where each 1 second bar's four prints land within the second (open, first extreme, second extreme, close)
+SECOND_PATH_OFFSETS = np.array([0, 250, 500, 750], dtype=np.int64) * 1_000_000
+
+
+def _nanoseconds_of_day(time_string):
+    return int(pd.Timedelta(time_string).value)
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                    #Tick Store
+#-------------------------------------------------------------------------------------------------------------------------------
+
+class TickStore:
+    '''One memory-mapped file of prints per session: tick_data/mnq/2024-01-03.npy'''
+
+    def __init__(self, directory=TICK_DIRECTORY, ticker='mnq'):
+        self.directory = directory
+        self.ticker = ticker.lower()
+
+    def _path(self, session_date):
+        return os.path.join(self.directory, self.ticker, f"{pd.Timestamp(session_date):%Y-%m-%d}.npy")
+
+    def sessions(self):
+        folder = os.path.join(self.directory, self.ticker)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(pd.Timestamp(name[:-4]).date() for name in os.listdir(folder) if name.endswith('.npy'))
+
+    def load(self, session_date):
+        '''The session's prints as a read-only memory map, nothing is read until it is sliced'''
+        return np.load(self._path(session_date), mmap_mode='r')
+
+    def chunks(self, session_date, start=None, chunk_rows=CHUNK_ROWS):
+        '''(times, prices) views of at most chunk_rows prints, from the first print at or after start (ns)'''
+        ticks = self.load(session_date)
+        first = 0 if start is None else int(np.searchsorted(ticks['time'], start, side='left'))
+        for i in range(first, len(ticks), chunk_rows):
+            chunk = ticks[i:i + chunk_rows]
+            yield chunk['time'], chunk['price']
+
+    def write(self, ticks):
+        '''
+        Add prints from a frame with a (naive MST) DatetimeIndex, a Price column and optionally Size. Call it with one
+        chunk at a time, a session split across chunks is merged with what is already on disk.
+        '''
+        ticks = ticks.sort_index(kind='stable')
+        for session_date, day in ticks.groupby(ticks.index.date):
+            rows = np.empty(len(day), dtype=TICK_DTYPE)
+            rows['time'] = day.index.as_unit('ns').asi8
+            rows['price'] = day['Price'].to_numpy(dtype=float)
+            rows['size'] = day['Size'].to_numpy(dtype=np.float32) if 'Size' in day.columns else 1.0
+            path = self._path(session_date)
+            if os.path.exists(path):
+                rows = np.concatenate([np.load(path), rows])
+                rows = rows[np.argsort(rows['time'], kind='stable')]
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            np.save(path, rows)
+        print(f"{self.ticker}: wrote {len(ticks)} print(s) across {len(set(ticks.index.date))} session(s)")
+
+    def write_seconds(self, bars):
+        '''Add 1 second OHLCV bars, each as four prints along its path (an up bar makes its low first)'''
+        open_, high, low, close = (bars[column].to_numpy(dtype=float) for column in ('Open', 'High', 'Low', 'Close'))
+        up = close >= open_
+        prices = np.column_stack([open_, np.where(up, low, high), np.where(up, high, low), close]).ravel()
+        times = (pd.DatetimeIndex(bars.index).as_unit('ns').asi8[:, None] + SECOND_PATH_OFFSETS).ravel()
+        sizes = np.repeat(bars['Volume'].to_numpy(dtype=float) / 4, 4) if 'Volume' in bars.columns else 1.0
+        self.write(pd.DataFrame({'Price': prices, 'Size': sizes}, index=pd.DatetimeIndex(times)))
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                                #Session Replay
+#-------------------------------------------------------------------------------------------------------------------------------
+
+class SessionReplay:
+    '''
+    The ORB rules for one session, fed (times, prices) chunks in order. Each step is a first-touch search over what
+    is left of the chunk, so the work per chunk is a few NumPy passes however many prints it holds.
+    '''
+
+    def __init__(self, session_date, high, low, profit_multiplier=2, limit_offset=LIMIT_OFFSET,
+                 cancel_time=CANCEL_TIME, exit_time=EXIT_TIME, reentry=True):
+        self.session_date = session_date
+        self.high = high
+        self.low = low
+        self.profit_multiplier = profit_multiplier
+        self.limit_offset = limit_offset
+        day = pd.Timestamp(session_date).value
+        self.cancel_at = day + _nanoseconds_of_day(cancel_time)
+        self.exit_at = day + _nanoseconds_of_day(exit_time)
+        self.reentry = reentry
+        self.trades = []
+        self.position = None
+        #Working entries: the OCA pair to start with, a single re-entry after a stop
+        self.entries = [self._entry('LONG'), self._entry('SHORT')]
+
+    def _entry(self, direction):
+        if direction == 'LONG':
+            return {'direction': direction, 'stop': self.high, 'limit': self.high + self.limit_offset,
+                    'triggered': None}
+        return {'direction': direction, 'stop': self.low, 'limit': self.low - self.limit_offset, 'triggered': None}
+
+    def _first_event(self, order, prices):
+        '''Index of the first print that triggers (or, once triggered, fills) an entry'''
+        long = order['direction'] == 'LONG'
+        if order['triggered'] is None:
+            return _first_at_or_above(prices, order['stop']) if long else _first_at_or_below(prices, order['stop'])
+        return _first_at_or_below(prices, order['limit']) if long else _first_at_or_above(prices, order['limit'])
+
+    def _open(self, order, fill_time, price):
+        entry, stop = (order['stop'], self.low) if order['direction'] == 'LONG' else (order['stop'], self.high)
+        self.position = {'direction': order['direction'], 'number': len(self.trades) + 1,
+                         'level': entry, 'stop': stop, 'target': entry + ((entry - stop) * self.profit_multiplier),
+                         'entry_time': pd.Timestamp(fill_time), 'entry': price}
+        self.entries = []
+
+    def _close(self, exit_time, price, outcome):
+        trade = dict(self.position, exit_time=pd.Timestamp(exit_time), exit=price, outcome=outcome)
+        self.trades.append(trade)
+        self.position = None
+        if self.reentry and (outcome == 'Stopped') and (trade['number'] == 1):
+            self.entries = [self._entry(trade['direction'])]
+
+    def _cancel_entries(self):
+        '''Cancel time: an entry that triggered but never reached its limit is a no-fill'''
+        for order in self.entries:
+            if order['triggered'] is not None:
+                self.trades.append({'direction': order['direction'], 'number': len(self.trades) + 1,
+                                    'level': order['stop'], 'entry_time': pd.Timestamp(order['triggered']),
+                                    'entry': None, 'exit_time': None, 'exit': None, 'outcome': 'NoFill'})
+        self.entries = []
+
+    def feed(self, times, prices):
+        times = np.asarray(times)
+        prices = np.asarray(prices, dtype=float)
+        i, n = 0, len(prices)
+        while i < n:
+            position = self.position
+            if position is not None:
+                rest = prices[i:]
+                if position['direction'] == 'LONG':
+                    k_stop = _first_at_or_below(rest, position['stop'])
+                    k_profit = _first_at_or_above(rest, position['target'])
+                else:
+                    k_stop = _first_at_or_above(rest, position['stop'])
+                    k_profit = _first_at_or_below(rest, position['target'])
+                k_time = int(np.searchsorted(times[i:], self.exit_at, side='left'))
+                k = min(k_stop, k_profit, k_time)
+                if k >= n - i:
+                    return
+                j = i + k
+                #The stop is a market order once hit (we get that print), the target is a resting limit
+                if k == k_stop:
+                    self._close(times[j], prices[j], 'Stopped')
+                elif k == k_profit:
+                    self._close(times[j], position['target'], 'Profit')
+                else:
+                    self._close(times[j], prices[j], 'Time')
+                i = j + 1
+                continue
+
+            if not self.entries:
+                return
+            end = i + int(np.searchsorted(times[i:], self.cancel_at, side='left'))
+            events = [(self._first_event(order, prices[i:end]), order) for order in self.entries]
+            k, order = min(events, key=lambda event: event[0])
+            if i + k >= end:
+                if end < n:
+                    self._cancel_entries()
+                return
+            j = i + k
+            long = order['direction'] == 'LONG'
+            if order['triggered'] is None:
+                order['triggered'] = times[j]
+                #Marketable once triggered if the print is inside the limit, otherwise it rests at the limit
+                if (long and prices[j] <= order['limit']) or ((not long) and prices[j] >= order['limit']):
+                    self._open(order, times[j], prices[j])
+            else:
+                self._open(order, times[j], order['limit'])
+            i = j + 1
+
+    def finish(self):
+        '''End of the data: a trade still open is reported as Open, untriggered entries just expire'''
+        if self.position is not None:
+            self.trades.append(dict(self.position, exit_time=None, exit=None, outcome='Open'))
+            self.position = None
+        self._cancel_entries()
+        return self.trades
+
+
+def session_levels(data, orb_time=ORB_TIME, orb_minutes=None):
+    '''{session date: (high, low)} of the opening range from the 5 minute bars, what the backtest trades off'''
+    long_entry, short_entry = orb_levels(data, orb_time, orb_minutes)
+    levels = pd.DataFrame({'high': long_entry, 'low': short_entry, 'date': data.index.date}).dropna()
+    last = levels.groupby('date').last()
+    return {date: (row.high, row.low) for date, row in last.iterrows()}
+
+
+def replay_session(store, session_date, high, low, profit_multiplier=2, limit_offset=LIMIT_OFFSET,
+                   cancel_time=CANCEL_TIME, exit_time=EXIT_TIME, orb_time=ORB_TIME, orb_minutes=ORB_MINUTES,
+                   chunk_rows=CHUNK_ROWS):
+    '''Replay one session's prints from the store, starting when the opening range bar closes'''
+    replay = SessionReplay(session_date, high, low, profit_multiplier, limit_offset, cancel_time, exit_time)
+    start = pd.Timestamp(session_date).value + _nanoseconds_of_day(orb_time) + (orb_minutes * 60 * NANOSECONDS)
+    for times, prices in store.chunks(session_date, start, chunk_rows):
+        replay.feed(times, prices)
+    return replay.finish()
+
+
+def replay(data, store, profit_multiplier=2, limit_offset=LIMIT_OFFSET, cancel_time=CANCEL_TIME, dates=None,
+           chunk_rows=CHUNK_ROWS):
+    '''Every session that has both prints and an opening range, one at a time, as one row per trade'''
+    start = time.perf_counter()
+    levels = session_levels(data)
+    dates = store.sessions() if dates is None else [pd.Timestamp(date).date() for date in dates]
+    rows = []
+    for session_date in dates:
+        if session_date not in levels:
+            continue
+        high, low = levels[session_date]
+        for trade in replay_session(store, session_date, high, low, profit_multiplier, limit_offset, cancel_time,
+                                    chunk_rows=chunk_rows):
+            rows.append(dict(trade, date=session_date))
+    print(f"Replayed {len(dates)} session(s) of prints in {time.perf_counter() - start:.2f} second(s), "
+          f"{len(rows)} trade(s)")
+    columns = ['date', 'number', 'direction', 'entry_time', 'entry', 'exit_time', 'exit', 'outcome']
+    return pd.DataFrame(rows, columns=columns + ['level', 'stop', 'target'])
+
+
+#-------------------------------------------------------------------------------------------------------------------------------
+                                            #Comparison with the 5 Minute Backtest
+#-------------------------------------------------------------------------------------------------------------------------------
+
+def five_minute_trades(data, profit_multiplier=2, cancel_time=CANCEL_TIME):
+    '''backtest_ticker's trades with the outcome each one was given (Stopped, Profit, Time or Open)'''
+    levels = session_levels(data)
+    trades, _ = backtest_ticker(data, profit_multiplier, cancel_time=cancel_time)
+    closed_length = 3 + len(FEATURE_COLUMNS) + 1
+    rows = []
+    for trade in trades.values():
+        if not isinstance(trade, list):
+            continue
+        session_date, direction, entry = trade[0].date(), trade[1], trade[2]
+        high, low = levels.get(session_date, (np.nan, np.nan))
+        stop = low if direction == 'LONG' else high
+        target = entry + ((entry - stop) * profit_multiplier)
+        exit = trade[-1] if len(trade) == closed_length else None
+        if exit is None:
+            outcome = 'Open'
+        elif exit == stop:
+            outcome = 'Stopped'
+        elif exit == target:
+            outcome = 'Profit'
+        else:
+            outcome = 'Time'
+        rows.append({'date': session_date, 'direction': direction, 'entry': entry, 'exit': exit, 'outcome': outcome})
+    table = pd.DataFrame(rows, columns=['date', 'direction', 'entry', 'exit', 'outcome'])
+    table['number'] = table.groupby('date').cumcount() + 1
+    return table
+
+
+def compare_outcomes(data, store, profit_multiplier=2, limit_offset=LIMIT_OFFSET, cancel_time=CANCEL_TIME,
+                     dates=None, chunk_rows=CHUNK_ROWS):
+    '''
+    Tick and 5 minute trades side by side for every session in the store, one row per (date, trade number), with
+    flags for a changed outcome or direction. Prints how many trades the 5 minute approximation got wrong.
+    '''
+    ticks = replay(data, store, profit_multiplier, limit_offset, cancel_time, dates, chunk_rows)
+    bars = five_minute_trades(data, profit_multiplier, cancel_time)
+    bars = bars[bars['date'].isin(set(ticks['date']) | set(store.sessions() if dates is None else
+                                                            [pd.Timestamp(date).date() for date in dates]))]
+    table = bars.merge(ticks[['date', 'number', 'direction', 'entry', 'exit', 'outcome']], on=['date', 'number'],
+                       how='outer', suffixes=('_5min', '_tick'))
+    table['direction_changed'] = table['direction_5min'] != table['direction_tick']
+    table['outcome_changed'] = table['outcome_5min'] != table['outcome_tick']
+    table['changed'] = table['direction_changed'] | table['outcome_changed']
+
+    compared = len(table)
+    print(f"{int(table['changed'].sum())} of {compared} trades changed with tick data: "
+          f"{int(table['outcome_changed'].sum())} outcome(s), {int(table['direction_changed'].sum())} direction(s), "
+          f"{int((table['outcome_tick'] == 'NoFill').sum())} STP LMT no-fill(s)")
+    return table.sort_values(['date', 'number']).reset_index(drop=True)